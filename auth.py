@@ -1,12 +1,20 @@
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import NamedTuple, Optional
+import hashlib
+import os
+import threading
+import time
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, status, Cookie
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from database import get_db
+from database import get_db, get_read_db, get_write_db
 from models import User
+from schemas import UserIdentity
 
 # JWT 설정
 SECRET_KEY = "your-secret-key-here-change-in-production"
@@ -14,6 +22,13 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 10080  # 7일 (1440분 → 10080분)
 REFRESH_TOKEN_EXPIRE_DAYS = 30  # 리프레시 토큰 30일
 
+# 인증 사용자 캐시 설정 (사용자명 -> 사용자 스냅샷)
+USER_CACHE_SIZE = int(os.getenv("AUTH_USER_CACHE_SIZE", "1024"))
+USER_CACHE_TTL_SECONDS = float(os.getenv("AUTH_USER_CACHE_TTL_SECONDS", "60"))
+
+# 검증된 토큰 캐시 크기 (토큰 다이제스트 -> 디코딩 결과, 토큰 만료 시각까지 유지)
+TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "4096"))
+
 # 비밀번호 해싱
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -48,52 +63,122 @@ def create_refresh_token(data: dict):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def verify_token(token: str) -> Optional[str]:
-    """JWT 토큰 검증"""
+class DecodedToken(NamedTuple):
+    """서명이 검증된 JWT 디코딩 결과"""
+    username: Optional[str]
+    token_type: str  # "access" 또는 "refresh"
+    expires_at: Optional[float]  # 만료 시각 (UTC 타임스탬프)
+    claims: dict
+    
+    @property
+    def expired(self) -> bool:
+        return self.expires_at is None or time.time() > self.expires_at
+
+class TokenCache:
+    """서명 검증을 마친 토큰을 만료 시각까지 보관하는 LRU 캐시 (토큰 원문 대신 다이제스트 저장)"""
+    
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.entries = OrderedDict()  # 다이제스트 -> DecodedToken
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def digest(token: str) -> bytes:
+        return hashlib.blake2b(token.encode(), digest_size=16).digest()
+    
+    def get(self, key: bytes) -> Optional[DecodedToken]:
+        """만료되지 않은 검증 결과를 반환합니다."""
+        with self.lock:
+            decoded = self.entries.get(key)
+            if decoded is None or decoded.expired:
+                if decoded is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return decoded
+    
+    def put(self, key: bytes, decoded: DecodedToken):
+        """만료되지 않은 검증 결과만 저장합니다."""
+        if self.max_size <= 0 or decoded.expired:
+            return
+        with self.lock:
+            self.entries[key] = decoded
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+    
+    def clear(self):
+        """모든 항목을 제거합니다."""
+        with self.lock:
+            self.entries.clear()
+    
+    def stats(self) -> dict:
+        """캐시 크기와 적중/실패 횟수를 반환합니다."""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+token_cache = TokenCache(TOKEN_CACHE_SIZE)
+
+def decode_token(token: Optional[str]) -> Optional[DecodedToken]:
+    """JWT를 한 번만 디코딩해 사용자명, 유형, 만료 시각을 반환합니다. (서명이 틀리면 None)"""
+    if not token or not isinstance(token, str):
+        return None
+    # 이미 검증한 토큰은 캐시에서 바로 반환 (HMAC 검증, base64/JSON 파싱 생략)
+    key = TokenCache.digest(token)
+    decoded = token_cache.get(key)
+    if decoded is not None:
+        return decoded
+    # 만료된 토큰도 서명이 맞으면 결과를 반환 (만료 여부는 expired로 확인)
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            return None
-        return username
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM], options={"verify_exp": False})
     except JWTError:
         return None
+    exp = payload.get("exp")
+    decoded = DecodedToken(
+        username=payload.get("sub"),
+        token_type=payload.get("type", "access"),
+        expires_at=float(exp) if isinstance(exp, (int, float)) else None,
+        claims=payload
+    )
+    token_cache.put(key, decoded)
+    return decoded
+
+def verify_token(token: str) -> Optional[str]:
+    """JWT 토큰 검증"""
+    decoded = decode_token(token)
+    if decoded is None or decoded.expired:
+        return None
+    return decoded.username
 
 def verify_refresh_token(token: str) -> Optional[str]:
     """JWT 리프레시 토큰 검증"""
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        token_type = payload.get("type")
-        if token_type != "refresh":
-            return None
-        username: str = payload.get("sub")
-        if username is None:
-            return None
-        return username
-    except JWTError:
+    decoded = decode_token(token)
+    if decoded is None or decoded.expired or decoded.token_type != "refresh":
         return None
+    return decoded.username
 
 def is_token_expired(token: str) -> bool:
     """토큰 만료 여부 확인"""
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        exp = payload.get("exp")
-        if exp is None:
-            return True
-        return datetime.utcnow().timestamp() > exp
-    except JWTError:
-        return True
+    decoded = decode_token(token)
+    return decoded is None or decoded.expired
 
 def get_token_expiry_time(token: str) -> Optional[datetime]:
     """토큰 만료 시간 반환"""
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        exp = payload.get("exp")
-        if exp is None:
-            return None
-        return datetime.fromtimestamp(exp)
-    except JWTError:
+    decoded = decode_token(token)
+    if decoded is None or decoded.expires_at is None:
         return None
+    return datetime.fromtimestamp(decoded.expires_at)
 
 def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
@@ -136,3 +221,126 @@ def get_current_admin(
             detail="관리자 권한이 필요합니다"
         )
     return current_user
+
+class UserCache:
+    """사용자명으로 인증 사용자 스냅샷을 보관하는 LRU + TTL 캐시"""
+    
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()  # username -> (만료 시각, UserIdentity)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+    
+    def get(self, username: str) -> Optional[UserIdentity]:
+        """캐시된 스냅샷을 반환합니다. (없거나 만료되면 None)"""
+        with self.lock:
+            entry = self.entries.get(username)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self.entries[username]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(username)
+            self.hits += 1
+            return entry[1]
+    
+    def put(self, user: User) -> UserIdentity:
+        """사용자 스냅샷을 저장하고 반환합니다."""
+        identity = UserIdentity.model_validate(user)
+        if self.max_size <= 0:
+            return identity
+        with self.lock:
+            self.entries[identity.username] = (time.monotonic() + self.ttl_seconds, identity)
+            self.entries.move_to_end(identity.username)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return identity
+    
+    def invalidate(self, username: str):
+        """사용자 정보가 바뀌었을 때 해당 항목을 제거합니다."""
+        with self.lock:
+            if self.entries.pop(username, None) is not None:
+                self.invalidations += 1
+    
+    def clear(self):
+        """모든 항목을 제거합니다."""
+        with self.lock:
+            self.entries.clear()
+    
+    def stats(self) -> dict:
+        """캐시 크기와 적중/실패 횟수를 반환합니다."""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "invalidations": self.invalidations
+            }
+
+user_cache = UserCache(USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS)
+
+def get_username_from_cookies(access_token: Optional[str], refresh_token: Optional[str]) -> Optional[str]:
+    """쿠키의 액세스 토큰(만료 시 리프레시 토큰)에서 사용자명을 꺼냅니다."""
+    # 액세스 토큰은 한 번만 디코딩 (만료 확인과 사용자명 추출을 함께 처리)
+    username = verify_token(access_token)
+    if username:
+        return username
+    if refresh_token and refresh_token != "None":
+        return verify_refresh_token(refresh_token)
+    return None
+
+def approved_identity(identity: Optional[UserIdentity]) -> Optional[UserIdentity]:
+    """승인된 사용자만 인증된 것으로 처리합니다."""
+    return identity if identity and identity.is_approved else None
+
+# 쿠키 인증 의존성
+# 캐시에 없을 때만 사용자를 조회하며, 라우트와 같은 세션 의존성을 사용하므로
+# 요청 안에서 세션을 재사용함 (동기 get_db / 읽기 get_read_db / 쓰기 get_write_db)
+def get_cookie_user(
+    access_token: Optional[str] = Cookie(None),
+    refresh_token: Optional[str] = Cookie(None),
+    db: Session = Depends(get_db)
+) -> Optional[UserIdentity]:
+    """쿠키로 인증된 승인 사용자 (동기 세션 공유)"""
+    username = get_username_from_cookies(access_token, refresh_token)
+    if not username:
+        return None
+    identity = user_cache.get(username)
+    if identity is None:
+        user = db.query(User).filter(User.username == username).first()
+        identity = user_cache.put(user) if user else None
+    return approved_identity(identity)
+
+async def load_cookie_user(db: AsyncSession, access_token: Optional[str], refresh_token: Optional[str]) -> Optional[UserIdentity]:
+    """비동기 세션으로 쿠키 인증 사용자를 조회합니다."""
+    username = get_username_from_cookies(access_token, refresh_token)
+    if not username:
+        return None
+    identity = user_cache.get(username)
+    if identity is None:
+        user = await db.scalar(select(User).where(User.username == username))
+        identity = user_cache.put(user) if user else None
+    return approved_identity(identity)
+
+async def get_cookie_user_read(
+    access_token: Optional[str] = Cookie(None),
+    refresh_token: Optional[str] = Cookie(None),
+    db: AsyncSession = Depends(get_read_db)
+) -> Optional[UserIdentity]:
+    """쿠키로 인증된 승인 사용자 (읽기 세션 공유)"""
+    return await load_cookie_user(db, access_token, refresh_token)
+
+async def get_cookie_user_write(
+    access_token: Optional[str] = Cookie(None),
+    refresh_token: Optional[str] = Cookie(None),
+    db: AsyncSession = Depends(get_write_db)
+) -> Optional[UserIdentity]:
+    """쿠키로 인증된 승인 사용자 (쓰기 세션 공유)"""
+    return await load_cookie_user(db, access_token, refresh_token)
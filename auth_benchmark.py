@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+인증 비용 마이크로벤치마크
+요청 하나의 쿠키 인증에 드는 토큰 처리 비용을 단계별로 측정합니다.
+ - 기존 방식: 만료 확인과 사용자명 추출에서 jwt.decode를 두 번 호출
+ - decode_token (캐시 없음): 한 번만 디코딩
+ - decode_token (캐시 적중): 이미 검증한 토큰
+ - 쿠키 인증 전체 (토큰 캐시 + 사용자 캐시 적중, 데이터베이스 조회 없음)
+
+사용법:
+    python auth_benchmark.py --iterations 20000
+"""
+
+import argparse
+import os
+import tempfile
+import timeit
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="인증 비용 마이크로벤치마크")
+    parser.add_argument("--iterations", type=int, default=20000, help="측정 반복 횟수")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    os.environ.setdefault("DB_DIR", tempfile.mkdtemp(prefix="erp_auth_bench_"))
+
+    from jose import jwt
+    from auth import (ALGORITHM, SECRET_KEY, create_access_token, decode_token, get_cookie_user,
+                      token_cache, user_cache)
+    from models import User
+
+    token = create_access_token(data={"sub": "benchmark"})
+    user = User(id=1, username="benchmark", full_name="벤치마크", is_admin=False, is_approved=True)
+
+    def legacy():
+        # 기존 is_token_expired + verify_token
+        jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+    def uncached():
+        token_cache.clear()
+        decode_token(token)
+
+    def cached():
+        decode_token(token)
+
+    def full_request():
+        get_cookie_user(access_token=token, refresh_token=None, db=None)
+
+    user_cache.put(user)
+    decode_token(token)
+
+    cases = [
+        ("기존 방식 (jwt.decode 2회)", legacy),
+        ("decode_token (캐시 없음)", uncached),
+        ("decode_token (캐시 적중)", cached),
+        ("쿠키 인증 전체 (캐시 적중)", full_request),
+    ]
+
+    print("=== 인증 비용 마이크로벤치마크 ===")
+    print(f"반복 횟수: {args.iterations}")
+    baseline = None
+    for name, func in cases:
+        elapsed = min(timeit.repeat(func, number=args.iterations, repeat=3)) / args.iterations * 1_000_000
+        baseline = baseline or elapsed
+        print(f"{name}: {elapsed:.2f}µs/요청 (기존 대비 {baseline / elapsed:.1f}배)")
+
+if __name__ == "__main__":
+    main()
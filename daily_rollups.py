@@ -0,0 +1,128 @@
+"""
+일별 입출고 집계 테이블 관리
+daily_stock_rollups 테이블은 (날짜, 제품, 거래처, 거래 유형)별 수량 합계와 거래 건수를 보관하며,
+입고/출고/거래 삭제/수량 수정과 같은 트랜잭션에서 갱신됩니다.
+기간 통계(거래 내역 통계, 대시보드 거래 수, 소모량 분석)는 거래 내역 대신 이 테이블을 집계합니다.
+
+LOT별 재고 집계와 같이 변화량을 (날짜, 제품, 거래처, 유형)별로 누적한 뒤 한 번의 UPSERT로 반영합니다.
+날짜 키는 전체 재생성의 SQL 날짜 식과 같은 규칙으로 계산합니다. (rollup_day)
+
+전체 재생성:
+    python daily_rollups.py
+"""
+
+from datetime import datetime
+
+from sqlalchemy import select, delete, insert, func, case, text, bindparam, Date
+
+from models import DailyStockRollup, StockTransaction
+from inventory_snapshots import to_kst_date, day_end
+
+ROLLUP_COLUMNS = ["day", "product_id", "supplier_id", "transaction_type", "quantity", "transaction_count"]
+
+def transaction_day(dialect_name: str):
+    """거래 시각의 서울 시간 기준 날짜 SQL 식 (SQLite는 서울 시간으로 저장된 값의 날짜)"""
+    if dialect_name == "postgresql":
+        return func.date(func.timezone("Asia/Seoul", StockTransaction.created_at))
+    return func.date(StockTransaction.created_at)
+
+def rollup_day(dialect_name: str, created_at: datetime):
+    """거래 시각의 집계 날짜 (transaction_day와 같은 규칙)"""
+    if dialect_name == "postgresql":
+        return to_kst_date(created_at)
+    # SQLite는 시간대 변환 없이 저장된 시각의 날짜
+    return created_at.date()
+
+def rollup_source(dialect_name: str):
+    """거래 내역을 집계 키별 (날짜, 제품, 거래처, 유형, 수량 합계, 건수)로 묶는 쿼리"""
+    day = transaction_day(dialect_name)
+    supplier_id = func.coalesce(StockTransaction.supplier_id, 0)
+    return select(
+        day, StockTransaction.product_id, supplier_id, StockTransaction.transaction_type,
+        func.sum(StockTransaction.quantity), func.count()
+    ).group_by(day, StockTransaction.product_id, supplier_id, StockTransaction.transaction_type)
+
+# 입출고마다 실행하는 UPSERT (on_conflict_do_update로 만든 문장은 캐시되지 않아 실행마다 컴파일되므로,
+# SQLite와 PostgreSQL에서 문법이 같은 INSERT ... ON CONFLICT 문장을 한 번만 만들어 재사용)
+APPLY_DAILY_ROLLUPS = text("""
+    INSERT INTO daily_stock_rollups (day, product_id, supplier_id, transaction_type, quantity, transaction_count)
+    VALUES (:day, :product_id, :supplier_id, :transaction_type, :quantity, :transaction_count)
+    ON CONFLICT (day, product_id, supplier_id, transaction_type) DO UPDATE SET
+        quantity = daily_stock_rollups.quantity + excluded.quantity,
+        transaction_count = daily_stock_rollups.transaction_count + excluded.transaction_count
+""").bindparams(bindparam("day", type_=Date))
+
+def add_rollup_movement(movements: dict, dialect_name: str, created_at: datetime, product_id: int, supplier_id, transaction_type: str, quantity: int, count: int = 1):
+    """집계 키별 (수량, 건수) 변화량을 누적합니다. (삭제는 음수 수량과 count=-1, 수량 수정은 차이와 count=0)"""
+    key = (rollup_day(dialect_name, created_at), product_id, supplier_id or 0, transaction_type)
+    current_quantity, current_count = movements.get(key, (0, 0))
+    movements[key] = (current_quantity + quantity, current_count + count)
+
+async def apply_daily_rollups(db, movements: dict):
+    """누적된 집계 변화량을 daily_stock_rollups에 한 번의 UPSERT로 반영합니다."""
+    rows = [
+        {
+            "day": day,
+            "product_id": product_id,
+            "supplier_id": supplier_id,
+            "transaction_type": transaction_type,
+            "quantity": quantity,
+            "transaction_count": count
+        }
+        for (day, product_id, supplier_id, transaction_type), (quantity, count) in movements.items() if quantity or count
+    ]
+    if rows:
+        await db.execute(APPLY_DAILY_ROLLUPS, rows)
+
+def rollup_stats_query(conditions: list):
+    """일별 집계에서 거래 건수, 입고/출고 수량, 거래처 수를 계산하는 쿼리 (거래 내역 통계와 같은 순서)"""
+    return select(
+        func.coalesce(func.sum(DailyStockRollup.transaction_count), 0),
+        func.coalesce(func.sum(case((DailyStockRollup.transaction_type == "in", DailyStockRollup.quantity), else_=0)), 0),
+        func.coalesce(func.sum(case((DailyStockRollup.transaction_type == "out", DailyStockRollup.quantity), else_=0)), 0),
+        # 거래가 모두 삭제된 키(건수 0)와 거래처 없음(0)은 제외
+        func.count(func.distinct(case((
+            (DailyStockRollup.supplier_id != 0) & (DailyStockRollup.transaction_count > 0), DailyStockRollup.supplier_id
+        ))))
+    ).where(*conditions)
+
+def monthly_out_quantities(db, product_id: int, start: datetime) -> dict:
+    """start 이후 제품의 월별(YYYY-MM) 출고 수량 합계 (동기 세션)"""
+    # 시작일 당일은 시작 시각 이후 거래만 포함해야 하므로 거래 내역에서, 이후 날짜는 일별 집계에서 합산
+    start_day = to_kst_date(start)
+    monthly = {}
+    partial = db.scalar(select(func.sum(StockTransaction.quantity)).where(
+        StockTransaction.product_id == product_id,
+        StockTransaction.transaction_type == "out",
+        StockTransaction.created_at >= start,
+        StockTransaction.created_at < day_end(start_day)
+    ))
+    if partial:
+        monthly[start_day.strftime("%Y-%m")] = partial
+    rows = db.execute(select(DailyStockRollup.day, DailyStockRollup.quantity).where(
+        DailyStockRollup.product_id == product_id,
+        DailyStockRollup.day > start_day,
+        DailyStockRollup.transaction_type == "out",
+        DailyStockRollup.quantity != 0
+    ))
+    for day, quantity in rows:
+        month_key = day.strftime("%Y-%m")
+        monthly[month_key] = monthly.get(month_key, 0) + quantity
+    return {month_key: quantity for month_key, quantity in monthly.items() if quantity}
+
+def rebuild_daily_rollups(connection) -> int:
+    """stock_transactions에서 daily_stock_rollups 전체를 다시 생성하고 집계 행 수를 반환합니다."""
+    if connection.dialect.name == "postgresql":
+        # 재생성 중 다른 트랜잭션의 집계 변경이 반영되지 않고 사라지지 않도록 집계 테이블 쓰기를 막음
+        connection.execute(text("LOCK TABLE daily_stock_rollups IN EXCLUSIVE MODE"))
+    connection.execute(delete(DailyStockRollup))
+    connection.execute(insert(DailyStockRollup).from_select(ROLLUP_COLUMNS, rollup_source(connection.dialect.name)))
+    return connection.scalar(select(func.count()).select_from(DailyStockRollup))
+
+if __name__ == "__main__":
+    from database import engine
+
+    with engine.begin() as connection:
+        DailyStockRollup.__table__.create(bind=connection, checkfirst=True)
+        count = rebuild_daily_rollups(connection)
+    print(f"daily_stock_rollups 재생성 완료: {count}개 집계")
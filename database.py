@@ -1,16 +1,53 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 import os
 
-# SQLite 데이터베이스 설정
-# Windows 환경에서는 ./data 디렉토리에 저장
+# 데이터베이스 설정
+# DATABASE_URL이 있으면 해당 데이터베이스(PostgreSQL 등)를 사용하고,
+# 없으면 SQLite 파일을 사용 (Windows 환경에서는 ./data 디렉토리에 저장)
 DB_DIR = os.getenv("DB_DIR", "./data")
-os.makedirs(DB_DIR, exist_ok=True)
-SQLALCHEMY_DATABASE_URL = f"sqlite:///{DB_DIR}/erp_system.db"
+SQLITE_DB_PATH = os.path.join(DB_DIR, "erp_system.db")
+
+def resolve_database_url() -> str:
+    """환경 변수에서 데이터베이스 URL을 결정합니다."""
+    url = os.getenv("DATABASE_URL")
+    if not url:
+        os.makedirs(DB_DIR, exist_ok=True)
+        return f"sqlite:///{SQLITE_DB_PATH}"
+    # postgres:// 형식(일부 호스팅 서비스)을 SQLAlchemy 형식으로 변환
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    return url
+
+SQLALCHEMY_DATABASE_URL = resolve_database_url()
+DB_BACKEND = make_url(SQLALCHEMY_DATABASE_URL).get_backend_name()
+IS_SQLITE = DB_BACKEND == "sqlite"
+
+# SQLite 저장소 프로파일 (환경 변수로 조정 가능)
+# - WAL 모드: 읽기가 쓰기를 기다리지 않고, 커밋마다 롤백 저널 fsync를 하지 않음
+# - synchronous=NORMAL: WAL 모드에서는 체크포인트 시점에만 fsync
+# - busy_timeout: 쓰기 잠금 대기 시간 (즉시 "database is locked" 오류 대신 대기)
+SQLITE_STORAGE_PROFILE = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-65536")),  # 음수는 KiB 단위 (64MB)
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "temp_store": os.getenv("SQLITE_TEMP_STORE", "MEMORY"),
+    # WAL 체크포인트 정책: 자동 체크포인트 페이지 수와 체크포인트 후 WAL 파일 크기 상한
+    "wal_autocheckpoint": int(os.getenv("SQLITE_WAL_AUTOCHECKPOINT", "1000")),
+    "journal_size_limit": int(os.getenv("SQLITE_JOURNAL_SIZE_LIMIT", str(64 * 1024 * 1024))),
+}
+
+# 수동 체크포인트 모드 (PASSIVE, FULL, RESTART, TRUNCATE)
+SQLITE_CHECKPOINT_MODE = os.getenv("SQLITE_CHECKPOINT_MODE", "TRUNCATE")
 
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, 
-    connect_args={"check_same_thread": False},  # SQLite 전용 설정
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False} if IS_SQLITE else {},  # SQLite 전용 설정
     # 연결 풀 설정 추가
     pool_size=20,           # 기본 연결 풀 크기 증가 (기본값: 5)
     max_overflow=30,        # 오버플로우 연결 수 증가 (기본값: 10)
@@ -19,8 +56,95 @@ engine = create_engine(
     pool_pre_ping=True      # 연결 유효성 검사
 )
 
+# 비동기 드라이버 매핑 (동기 URL -> 비동기 URL)
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+def to_async_url(url: str) -> str:
+    """동기 드라이버 URL을 같은 데이터베이스의 비동기 드라이버 URL로 변환합니다."""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"비동기 드라이버가 없는 데이터베이스입니다: {backend}")
+    return parsed.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+ASYNC_DATABASE_URL = to_async_url(SQLALCHEMY_DATABASE_URL)
+
+# 비동기 엔진 (async 라우트 핸들러용, 이벤트 루프를 막지 않음)
+# 쓰기/읽기 엔진을 분리
+# - 쓰기 엔진: SQLite는 동시에 한 연결만 쓸 수 있으므로 연결 1개 고정,
+#   쓰기 요청은 풀에서 순서대로 대기 (busy 재시도 경쟁 없음).
+#   PostgreSQL은 행 잠금으로 동시 쓰기가 가능하므로 여러 연결 사용
+# - 읽기 엔진: 읽기 전용 연결, CPU 코어 수에 맞춰 확장 (WAL 모드에서 쓰기와 병행)
+WRITE_POOL_SIZE = int(os.getenv("DB_WRITE_POOL_SIZE", "1" if IS_SQLITE else "10"))
+WRITE_POOL_MAX_OVERFLOW = int(os.getenv("DB_WRITE_POOL_MAX_OVERFLOW", "0" if IS_SQLITE else "10"))
+WRITE_POOL_TIMEOUT = int(os.getenv("DB_WRITE_POOL_TIMEOUT", "60"))
+READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", str((os.cpu_count() or 2) * 2)))
+READ_POOL_MAX_OVERFLOW = int(os.getenv("DB_READ_POOL_MAX_OVERFLOW", str(READ_POOL_SIZE)))
+
+async_write_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    poolclass=AsyncAdaptedQueuePool,  # aiosqlite 기본값(NullPool)은 요청마다 재연결
+    pool_size=WRITE_POOL_SIZE,
+    max_overflow=WRITE_POOL_MAX_OVERFLOW,
+    pool_timeout=WRITE_POOL_TIMEOUT,
+    pool_recycle=3600,
+    pool_pre_ping=True
+)
+
+async_read_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    # PostgreSQL은 읽기 전용 트랜잭션으로 실행 (SQLite는 연결 시 query_only 설정)
+    execution_options={} if IS_SQLITE else {"postgresql_readonly": True},
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=READ_POOL_SIZE,
+    max_overflow=READ_POOL_MAX_OVERFLOW,
+    pool_timeout=60,
+    pool_recycle=3600,
+    pool_pre_ping=True
+)
+
+def apply_sqlite_storage_profile(dbapi_connection, connection_record):
+    """새 SQLite 연결마다 저장소 프로파일 PRAGMA를 적용합니다."""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_STORAGE_PROFILE.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+def make_connection_read_only(dbapi_connection, connection_record):
+    """읽기 엔진 연결에서 쓰기를 막습니다."""
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA query_only=ON")
+    finally:
+        cursor.close()
+
+def disable_driver_transaction(dbapi_connection, connection_record):
+    """pysqlite의 암시적 BEGIN을 끄고 트랜잭션 시작을 SQLAlchemy가 직접 처리하게 합니다. (SAVEPOINT 지원)"""
+    dbapi_connection.isolation_level = None
+
+def begin_immediate(connection):
+    """쓰기 트랜잭션 시작 시 바로 쓰기 잠금을 잡습니다. (읽기 후 쓰기 잠금 승격 실패 방지)"""
+    connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+if IS_SQLITE:
+    for target in (engine, async_write_engine.sync_engine, async_read_engine.sync_engine):
+        event.listen(target, "connect", apply_sqlite_storage_profile)
+    event.listen(async_read_engine.sync_engine, "connect", make_connection_read_only)
+    # 쓰기 엔진은 그룹 커밋에서 요청별 SAVEPOINT를 사용하므로 트랜잭션을 명시적으로 시작
+    event.listen(async_write_engine.sync_engine, "connect", disable_driver_transaction)
+    event.listen(async_write_engine.sync_engine, "begin", begin_immediate)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 커밋 후에도 응답 직렬화를 위해 속성을 만료시키지 않음 (비동기에서는 지연 로딩 불가)
+WriteSessionLocal = async_sessionmaker(async_write_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+ReadSessionLocal = async_sessionmaker(async_read_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 def get_db():
     db = SessionLocal()
     try:
@@ -28,18 +152,77 @@ def get_db():
     finally:
         db.close()
 
-def get_pool_status():
-    """연결 풀 상태를 반환합니다."""
-    pool = engine.pool
+async def get_write_db():
+    """데이터를 변경하는 요청용 세션 (단일 쓰기 연결)"""
+    async with WriteSessionLocal() as db:
+        yield db
+
+async def get_read_db():
+    """조회 요청용 세션 (읽기 전용 연결)"""
+    async with ReadSessionLocal() as db:
+        yield db
+
+def database_exists() -> bool:
+    """데이터베이스(SQLite 파일 또는 서버의 users 테이블) 존재 여부를 확인합니다."""
+    if IS_SQLITE:
+        return os.path.exists(SQLITE_DB_PATH)
+    return inspect(engine).has_table("users")
+
+def get_storage_profile():
+    """실제 연결에 적용된 SQLite PRAGMA 값을 반환합니다."""
+    if not IS_SQLITE:
+        return {"backend": DB_BACKEND}
+    with engine.connect() as connection:
+        active = {}
+        for name in SQLITE_STORAGE_PROFILE:
+            active[name] = connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+    active["checkpoint_mode"] = SQLITE_CHECKPOINT_MODE
+    return active
+
+def checkpoint_wal(mode: str = None):
+    """WAL 내용을 데이터베이스 파일에 반영하고 WAL 파일을 정리합니다."""
+    mode = (mode or SQLITE_CHECKPOINT_MODE).upper()
+    if mode not in ("PASSIVE", "FULL", "RESTART", "TRUNCATE"):
+        raise ValueError(f"지원하지 않는 체크포인트 모드입니다: {mode}")
+    if not IS_SQLITE:
+        return {"mode": mode, "skipped": f"{DB_BACKEND}은(는) WAL 체크포인트가 필요하지 않습니다"}
+
+    with engine.connect() as connection:
+        busy, log_frames, checkpointed_frames = connection.exec_driver_sql(
+            f"PRAGMA wal_checkpoint({mode})"
+        ).one()
+    return {
+        "mode": mode,
+        "busy": bool(busy),
+        "log_frames": log_frames,
+        "checkpointed_frames": checkpointed_frames
+    }
+
+def describe_pool(pool):
+    """연결 풀 통계를 딕셔너리로 반환합니다."""
     return {
         "pool_size": pool.size(),
         "checked_in": pool.checkedin(),
         "checked_out": pool.checkedout(),
-        "overflow": pool.overflow(),
-        "invalid": pool.invalid()
+        "overflow": pool.overflow()
     }
 
-def reset_pool():
+def get_pool_status():
+    """연결 풀 상태를 반환합니다."""
+    status = describe_pool(engine.pool)
+    status["write_pool"] = describe_pool(async_write_engine.pool)
+    status["read_pool"] = describe_pool(async_read_engine.pool)
+    status["storage_profile"] = get_storage_profile()
+    return status
+
+async def dispose_async_engines():
+    """비동기 엔진의 연결을 모두 닫습니다."""
+    await async_write_engine.dispose()
+    await async_read_engine.dispose()
+
+async def reset_pool():
     """연결 풀을 리셋합니다."""
+    checkpoint_wal()
     engine.dispose()
+    await dispose_async_engines()
     print("데이터베이스 연결 풀이 리셋되었습니다.")
@@ -0,0 +1,156 @@
+"""
+조회 성능용 인덱스 관리
+모델에 정의된 복합 인덱스를 기존 데이터베이스에도 생성하고,
+주요 조회 쿼리가 해당 인덱스를 사용하는지 EXPLAIN QUERY PLAN으로 확인합니다.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import select, func, inspect
+
+from models import StockTransaction, AuditLog, Order, Product, User, Supplier, LotBalance
+from pagination import keyset_before
+
+# 시작 시 생성/확인하는 인덱스 이름 (정의는 모델의 __table_args__)
+MANAGED_INDEX_NAMES = (
+    "ix_stock_transactions_product_lot_type",
+    "ix_stock_transactions_created_at_id",
+    "ix_stock_transactions_supplier_created_at",
+    "ix_stock_transactions_product_created_at",
+    "ix_stock_transactions_product_lot_created_at",
+    "ix_audit_logs_created_at",
+    "ix_orders_status_created_at",
+)
+
+def get_managed_indexes():
+    """관리 대상 인덱스 객체 목록을 반환합니다."""
+    indexes = {index.name: index for table in (StockTransaction.__table__, AuditLog.__table__, Order.__table__)
+               for index in table.indexes}
+    return [indexes[name] for name in MANAGED_INDEX_NAMES]
+
+# 실행 계획 확인 쿼리가 조회하는 거래 내역 컬럼
+# (모델 전체를 조회하면 이후 마이그레이션에서 추가되는 컬럼까지 포함되므로 처음부터 있던 컬럼만 명시)
+PLAN_CHECK_TRANSACTION_COLUMNS = (
+    StockTransaction.id,
+    StockTransaction.product_id,
+    StockTransaction.supplier_id,
+    StockTransaction.transaction_type,
+    StockTransaction.quantity,
+    StockTransaction.lot_number,
+    StockTransaction.created_at,
+)
+
+# (이름, 조회 쿼리, 사용되어야 하는 인덱스 - 여러 개면 그중 하나)
+INDEX_PLAN_CHECKS = [
+    (
+        "LOT 재고 확인 (출고 검증)",
+        select(func.sum(StockTransaction.quantity)).where(
+            StockTransaction.product_id == 1,
+            StockTransaction.lot_number == "LOT",
+            StockTransaction.transaction_type == "in"
+        ),
+        "ix_stock_transactions_product_lot_type"
+    ),
+    (
+        "제품별 LOT 목록",
+        select(*PLAN_CHECK_TRANSACTION_COLUMNS).where(
+            StockTransaction.product_id == 1,
+            StockTransaction.transaction_type == "in",
+            StockTransaction.lot_number.isnot(None)
+        ),
+        # (제품, LOT) 범위 검색은 두 인덱스 모두 가능 (SQLite는 생성 순서에 따라 선택)
+        ("ix_stock_transactions_product_lot_type", "ix_stock_transactions_product_lot_created_at")
+    ),
+    (
+        "자동 LOT 배정 (FIFO)",
+        select(LotBalance.lot_number, LotBalance.quantity).where(
+            LotBalance.product_id == 1,
+            LotBalance.quantity > 0
+        ).order_by(LotBalance.first_received_at, LotBalance.id),
+        "ix_lot_balances_fifo"
+    ),
+    (
+        "거래 내역 최신순",
+        select(*PLAN_CHECK_TRANSACTION_COLUMNS).join(Product).join(User).outerjoin(Supplier)
+        .order_by(StockTransaction.created_at.desc(), StockTransaction.id.desc()).limit(20),
+        "ix_stock_transactions_created_at_id"
+    ),
+    (
+        "거래 내역 다음 페이지 (커서)",
+        select(*PLAN_CHECK_TRANSACTION_COLUMNS).join(Product).join(User).outerjoin(Supplier)
+        .where(keyset_before(StockTransaction.created_at, StockTransaction.id, (datetime(2024, 1, 1), 1)))
+        .order_by(StockTransaction.created_at.desc(), StockTransaction.id.desc()).limit(20),
+        "ix_stock_transactions_created_at_id"
+    ),
+    (
+        "거래처별 거래 내역 최신순",
+        select(*PLAN_CHECK_TRANSACTION_COLUMNS).where(StockTransaction.supplier_id == 1)
+        .order_by(StockTransaction.created_at.desc()).limit(20),
+        "ix_stock_transactions_supplier_created_at"
+    ),
+    (
+        "재고 카드",
+        select(*PLAN_CHECK_TRANSACTION_COLUMNS).where(StockTransaction.product_id == 1)
+        .order_by(StockTransaction.created_at, StockTransaction.id).limit(50),
+        "ix_stock_transactions_product_created_at"
+    ),
+    (
+        "LOT 재고 카드",
+        select(*PLAN_CHECK_TRANSACTION_COLUMNS).where(StockTransaction.product_id == 1, StockTransaction.lot_number == "LOT")
+        .order_by(StockTransaction.created_at, StockTransaction.id).limit(50),
+        "ix_stock_transactions_product_lot_created_at"
+    ),
+    (
+        "감사 로그 최신순",
+        select(AuditLog.id, AuditLog.action, AuditLog.created_at).join(User).order_by(AuditLog.created_at.desc()).limit(20),
+        "ix_audit_logs_created_at"
+    ),
+    (
+        "상태별 주문 목록",
+        select(Order.id, Order.order_number, Order.status, Order.created_at).where(Order.status == "pending").order_by(Order.created_at.desc()),
+        "ix_orders_status_created_at"
+    ),
+]
+
+def ensure_indexes(bind):
+    """기존 테이블에 없는 관리 인덱스를 생성하고 새로 만든 인덱스 이름을 반환합니다."""
+    inspector = inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+    created = []
+    for index in get_managed_indexes():
+        table_name = index.table.name
+        if table_name not in existing_tables:
+            continue
+        if index.name in {existing["name"] for existing in inspector.get_indexes(table_name)}:
+            continue
+        index.create(bind=bind)
+        created.append(index.name)
+    return created
+
+def explain_query_plan(connection, query):
+    """SQLite EXPLAIN QUERY PLAN 결과의 detail 목록을 반환합니다."""
+    compiled = query.compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True})
+    return [row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}")]
+
+def check_index_plans(connection):
+    """주요 조회 쿼리가 기대한 인덱스를 사용하는지 확인합니다."""
+    if connection.dialect.name != "sqlite":
+        # PostgreSQL은 통계에 따라 계획이 달라지므로 인덱스 존재만 보장
+        return []
+    results = []
+    for name, query, index_names in INDEX_PLAN_CHECKS:
+        if isinstance(index_names, str):
+            index_names = (index_names,)
+        plan = explain_query_plan(connection, query)
+        results.append({
+            "name": name,
+            "index": " / ".join(index_names),
+            "uses_index": any(index_name in detail for index_name in index_names for detail in plan),
+            "plan": plan
+        })
+    return results
+
+def verify_index_plans(engine):
+    """새 연결에서 주요 조회 쿼리의 인덱스 사용 여부를 확인합니다."""
+    with engine.connect() as connection:
+        return check_index_plans(connection)
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+입출고 그룹 커밋 벤치마크 스크립트
+작은 입고/출고 요청(바코드 스캔 1건 단위)을 여러 클라이언트에서 동시에 보내
+쓰기 묶음 처리를 켠 경우와 끈 경우(요청마다 커밋)의 처리량과 지연 시간(p50/p99)을 비교합니다.
+묶음 처리를 켠 경우에는 묶음 크기와 큐 대기 시간 통계도 출력합니다.
+DATABASE_URL이 설정되어 있으면 해당 데이터베이스(PostgreSQL 등)에서, 없으면 임시 SQLite에서 실행합니다.
+
+사용법:
+    python group_commit_benchmark.py --requests 2000 --clients 32 --synchronous FULL
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="입출고 그룹 커밋 벤치마크")
+    parser.add_argument("--requests", type=int, default=2000, help="보낼 입출고 요청 수")
+    parser.add_argument("--clients", type=int, default=32, help="동시 클라이언트 수")
+    parser.add_argument("--products", type=int, default=20, help="요청을 나눠 보낼 제품 수")
+    parser.add_argument("--mode", choices=["both", "batched", "direct"], default="both", help="묶음 처리 사용 여부")
+    parser.add_argument("--synchronous", default=None, help="SQLite synchronous 설정 (예: FULL)")
+    parser.add_argument("--port", type=int, default=8767)
+    return parser.parse_args()
+
+def run_mode(args, batched: bool):
+    """현재 프로세스에서 한 가지 모드로 벤치마크를 실행하고 결과를 반환합니다."""
+    db_dir = tempfile.mkdtemp(prefix="erp_group_commit_")
+    os.environ["DB_DIR"] = db_dir
+    os.environ["WRITE_BATCH_ENABLED"] = "true" if batched else "false"
+    if args.synchronous:
+        os.environ["SQLITE_SYNCHRONOUS"] = args.synchronous
+
+    import uvicorn
+    import main as app_module
+    from sqlalchemy import select
+    from auth import create_access_token
+    from database import SessionLocal
+    from models import User, Product
+
+    app_module.initialize_database()
+    db = SessionLocal()
+    user = db.query(User).filter(User.is_admin == True).first()
+    db.close()
+    cookie = f"access_token={create_access_token(data={'sub': user.username})}"
+
+    server = uvicorn.Server(uvicorn.Config(app_module.app, port=args.port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    def request(path, payload=None):
+        data = json.dumps(payload).encode() if payload is not None else None
+        req = urllib.request.Request(base_url + path, data=data, method="POST" if data else "GET",
+                                     headers={"Cookie": cookie, "Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(req, timeout=120) as response:
+                return response.status, json.loads(response.read() or b"null")
+        except urllib.error.HTTPError as e:
+            return e.code, None
+
+    # 제품별 초기 재고 입고
+    prefix = f"그룹 커밋 제품 {time.time_ns()}"
+    for i in range(args.products):
+        request("/inventory/add", {"name": f"{prefix} {i}", "price": 100, "category": "벤치마크"})
+    db = SessionLocal()
+    product_ids = db.scalars(select(Product.id).where(Product.name.like(f"{prefix}%")).order_by(Product.id)).all()
+    db.close()
+    for product_id in product_ids:
+        request("/stock/in", {"product_id": product_id, "quantity": args.requests, "lot_number": "LOT-B"})
+
+    def scan(i):
+        # 입고와 출고를 번갈아 1개씩 요청
+        product_id = product_ids[i % len(product_ids)]
+        path = "/stock/in" if i % 2 else "/stock/out"
+        started = time.perf_counter()
+        status, _ = request(path, {"product_id": product_id, "quantity": 1, "lot_number": "LOT-B"})
+        return status, time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as pool:
+        results = list(pool.map(scan, range(args.requests)))
+    elapsed = time.perf_counter() - started
+
+    _, coordinator_stats = request("/api/debug/write-coordinator")
+    server.should_exit = True
+    time.sleep(0.5)
+    shutil.rmtree(db_dir, ignore_errors=True)
+
+    latencies = sorted(latency for _, latency in results)
+    return {
+        "mode": "batched" if batched else "direct",
+        "requests": len(results),
+        "errors": sum(1 for status, _ in results if status != 200),
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(len(results) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2),
+        "coordinator": coordinator_stats if batched else None
+    }
+
+def main():
+    args = parse_args()
+    if args.mode != "both":
+        print(json.dumps(run_mode(args, args.mode == "batched"), ensure_ascii=False))
+        return
+
+    # 모드마다 새 프로세스에서 실행 (설정은 import 시점에 읽힘)
+    results = []
+    for mode in ("direct", "batched"):
+        command = [sys.executable, __file__, "--mode", mode, "--requests", str(args.requests),
+                   "--clients", str(args.clients), "--products", str(args.products), "--port", str(args.port)]
+        if args.synchronous:
+            command += ["--synchronous", args.synchronous]
+        output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print("=== 입출고 그룹 커밋 벤치마크 결과 ===")
+    print(f"요청 {args.requests}건, 동시 클라이언트 {args.clients}개, 제품 {args.products}개")
+    for result in results:
+        label = "묶음 처리" if result["mode"] == "batched" else "요청별 커밋"
+        print(f"{label}: {result['requests_per_second']}건/초, p50 {result['p50_ms']}ms, p99 {result['p99_ms']}ms, 오류 {result['errors']}건")
+    coordinator = results[1]["coordinator"]
+    if coordinator:
+        print(f"평균 묶음 크기 {coordinator['avg_batch_size']}건 (최대 {coordinator['largest_batch']}건, 분포 {coordinator['batch_sizes']})")
+        print(f"평균 큐 대기 {coordinator['avg_queue_wait_ms']}ms (최대 {coordinator['max_queue_wait_ms']}ms), 평균 커밋 {coordinator['avg_commit_ms']}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Idempotency-Key 처리
+입출고/주문 생성 요청에 Idempotency-Key 헤더가 있으면 (사용자, 키)별로 첫 응답을 저장해 두고,
+같은 키로 다시 들어온 요청(토큰 갱신 후 재시도, 더블 클릭 등)에는 라우트를 실행하지 않고 저장된 응답을 돌려줍니다.
+첫 요청이 처리 중일 때 들어온 중복 요청은 첫 요청이 끝날 때까지 기다립니다.
+저장소는 프로세스 메모리에 있으며 TTL이 지나거나 최대 개수를 넘으면 오래된 항목부터 제거됩니다.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from starlette.requests import HTTPConnection
+
+from auth import get_username_from_cookies
+
+# Idempotency-Key 저장소 설정
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+# 같은 키의 첫 요청을 기다리는 최대 시간
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "30"))
+
+MAX_KEY_LENGTH = 255
+
+# 저장하지 않는 응답 (재시도하면 결과가 달라질 수 있음)
+# 401: 토큰 갱신 후 같은 키로 재시도, 409: 동시 수정 충돌, 5xx: 서버 오류
+UNSTORED_STATUS_CODES = {401, 409}
+
+class IdempotencyEntry:
+    """키 하나의 처리 상태와 저장된 응답"""
+
+    __slots__ = ("fingerprint", "expires_at", "done", "response")
+
+    def __init__(self, fingerprint: bytes, expires_at: float):
+        self.fingerprint = fingerprint
+        self.expires_at = expires_at
+        self.done = asyncio.Event()
+        self.response = None  # (상태 코드, 헤더, 본문)
+
+class IdempotencyStore:
+    """(사용자, Idempotency-Key)별 응답 저장소 (TTL + 최대 개수 제한)"""
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()  # (username, key) -> IdempotencyEntry (생성 순서)
+        self.replays = 0
+        self.waits = 0
+
+    def evict_expired(self):
+        """만료된 항목을 오래된 것부터 제거합니다."""
+        now = time.monotonic()
+        while self.entries:
+            key, entry = next(iter(self.entries.items()))
+            if entry.expires_at >= now and len(self.entries) <= self.max_size:
+                break
+            del self.entries[key]
+
+    def begin(self, store_key: tuple, fingerprint: bytes):
+        """키의 항목과 첫 요청 여부를 반환합니다. (첫 요청이면 처리 중 항목을 새로 등록)"""
+        self.evict_expired()
+        entry = self.entries.get(store_key)
+        if entry is not None:
+            return entry, False
+        entry = IdempotencyEntry(fingerprint, time.monotonic() + self.ttl_seconds)
+        self.entries[store_key] = entry
+        return entry, True
+
+    def complete(self, store_key: tuple, entry: IdempotencyEntry, response):
+        """첫 요청의 응답을 저장하거나(response가 None이면 키를 해제) 기다리는 요청을 깨웁니다."""
+        entry.response = response
+        if response is None and self.entries.get(store_key) is entry:
+            del self.entries[store_key]
+        entry.done.set()
+
+    def stats(self) -> dict:
+        """저장소 크기와 재사용 횟수를 반환합니다."""
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "replays": self.replays,
+            "waits": self.waits
+        }
+
+idempotency_store = IdempotencyStore(IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_TTL_SECONDS)
+
+async def send_json(send, status_code: int, content: dict, extra_headers=()):
+    """JSON 응답을 직접 전송합니다."""
+    body = json.dumps(content, ensure_ascii=False).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())] + list(extra_headers)
+    })
+    await send({"type": "http.response.body", "body": body})
+
+async def replay_response(send, response):
+    """저장된 응답을 다시 전송합니다."""
+    status_code, headers, body = response
+    await send({"type": "http.response.start", "status": status_code, "headers": headers + [(b"idempotent-replayed", b"true")]})
+    await send({"type": "http.response.body", "body": body})
+
+class IdempotencyMiddleware:
+    """지정한 경로의 POST 요청에 Idempotency-Key를 적용하는 ASGI 미들웨어"""
+
+    def __init__(self, app, paths, store: Optional[IdempotencyStore] = None):
+        self.app = app
+        self.paths = set(paths)
+        self.store = store or idempotency_store
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            return await self.app(scope, receive, send)
+
+        connection = HTTPConnection(scope)
+        key = connection.headers.get("idempotency-key")
+        if not key:
+            return await self.app(scope, receive, send)
+        if len(key) > MAX_KEY_LENGTH:
+            return await send_json(send, 400, {"detail": f"Idempotency-Key는 {MAX_KEY_LENGTH}자 이하여야 합니다"})
+
+        # 인증되지 않은 요청은 그대로 라우트에서 401 처리
+        username = get_username_from_cookies(connection.cookies.get("access_token"), connection.cookies.get("refresh_token"))
+        if not username:
+            return await self.app(scope, receive, send)
+
+        # 같은 키로 다른 내용을 보낸 경우를 구분하기 위해 요청 본문을 읽어 지문 계산
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        body = b"".join(chunks)
+        fingerprint = hashlib.blake2b(scope["path"].encode() + b"\0" + body, digest_size=16).digest()
+
+        store_key = (username, key)
+        while True:
+            entry, is_first = self.store.begin(store_key, fingerprint)
+            if entry.fingerprint != fingerprint:
+                return await send_json(send, 422, {"detail": "같은 Idempotency-Key로 다른 요청을 보낼 수 없습니다"})
+            if is_first:
+                break
+
+            # 첫 요청이 처리 중이면 끝날 때까지 대기
+            if not entry.done.is_set():
+                self.store.waits += 1
+                try:
+                    await asyncio.wait_for(entry.done.wait(), IDEMPOTENCY_WAIT_SECONDS)
+                except asyncio.TimeoutError:
+                    return await send_json(send, 409, {"detail": "같은 요청을 아직 처리 중입니다. 잠시 후 다시 시도해 주세요"})
+            if entry.response is not None:
+                self.store.replays += 1
+                return await replay_response(send, entry.response)
+            # 첫 요청이 저장되지 않는 응답으로 끝났으면 이 요청이 새로 처리
+
+        body_sent = False
+
+        async def replay_receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        response_start = None
+        response_body = []
+
+        async def capture_send(message):
+            nonlocal response_start
+            if message["type"] == "http.response.start":
+                response_start = message
+            elif message["type"] == "http.response.body":
+                response_body.append(message.get("body", b""))
+            await send(message)
+
+        stored = None
+        try:
+            await self.app(scope, replay_receive, capture_send)
+            if response_start is not None:
+                status_code = response_start["status"]
+                if status_code < 500 and status_code not in UNSTORED_STATUS_CODES:
+                    stored = (status_code, list(response_start.get("headers", [])), b"".join(response_body))
+        finally:
+            self.store.complete(store_key, entry, stored)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+인덱스 실행 계획 회귀 검사 스크립트
+임시 데이터베이스에 거래 내역을 채운 뒤 관리 인덱스가 없는 상태와 있는 상태에서
+LOT 재고 확인 쿼리 시간을 비교하고, 주요 조회 쿼리가 기대한 인덱스를 사용하는지 확인합니다.
+하나라도 인덱스를 사용하지 않으면 종료 코드 1을 반환합니다.
+
+사용법:
+    python index_plan_check.py --rows 500000
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="인덱스 실행 계획 회귀 검사")
+    parser.add_argument("--rows", type=int, default=500000, help="생성할 거래 내역 수")
+    parser.add_argument("--products", type=int, default=500, help="생성할 제품 수")
+    parser.add_argument("--repeat", type=int, default=50, help="LOT 재고 확인 반복 횟수")
+    return parser.parse_args()
+
+def seed_database(db_path: str, user_id: int, products: int, rows: int):
+    """검사용 제품과 거래 내역을 생성합니다."""
+    connection = sqlite3.connect(db_path)
+    started = datetime(2024, 1, 1)
+    connection.executemany(
+        "INSERT INTO products (name, price, stock_quantity, category, sort_order, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+        [(f"검사 제품 {i}", 1000, rows, "검사", i, started.isoformat(sep=" ")) for i in range(products)]
+    )
+    product_ids = [row[0] for row in connection.execute("SELECT id FROM products")]
+    connection.executemany(
+        "INSERT INTO stock_transactions (product_id, user_id, transaction_type, quantity, lot_number, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            (product_ids[i % len(product_ids)], user_id, "in" if i % 3 else "out", 1, f"LOT-{i % 40}",
+             (started + timedelta(seconds=i)).isoformat(sep=" "))
+            for i in range(rows)
+        ]
+    )
+    connection.commit()
+    connection.close()
+    return product_ids
+
+def time_lot_check(engine, product_ids, repeat):
+    """LOT 재고 확인 쿼리의 평균 실행 시간(ms)을 측정합니다."""
+    from sqlalchemy import select, func
+    from models import StockTransaction
+
+    with engine.connect() as connection:
+        started = time.perf_counter()
+        for i in range(repeat):
+            connection.execute(select(func.sum(StockTransaction.quantity)).where(
+                StockTransaction.product_id == product_ids[i % len(product_ids)],
+                StockTransaction.lot_number == f"LOT-{i % 40}",
+                StockTransaction.transaction_type == "in"
+            )).scalar()
+        return (time.perf_counter() - started) / repeat * 1000
+
+def main():
+    args = parse_args()
+    db_dir = tempfile.mkdtemp(prefix="erp_index_")
+    os.environ["DB_DIR"] = db_dir
+
+    import main as app_module
+    from sqlalchemy import text
+    from database import SessionLocal, engine
+    from db_indexes import MANAGED_INDEX_NAMES, ensure_indexes, verify_index_plans
+    from models import User
+
+    app_module.initialize_database()
+    db = SessionLocal()
+    user = db.query(User).filter(User.is_admin == True).first()
+    db.close()
+
+    # 인덱스가 없던 기존 데이터베이스 상태를 재현
+    with engine.begin() as connection:
+        for name in MANAGED_INDEX_NAMES:
+            connection.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+    product_ids = seed_database(os.path.join(db_dir, "erp_system.db"), user.id, args.products, args.rows)
+
+    before = time_lot_check(engine, product_ids, args.repeat)
+    created = ensure_indexes(engine)
+    after = time_lot_check(engine, product_ids, args.repeat)
+    results = verify_index_plans(engine)
+
+    engine.dispose()
+    shutil.rmtree(db_dir, ignore_errors=True)
+
+    print("=== 인덱스 실행 계획 검사 결과 ===")
+    print(f"거래 내역: {args.rows}건, 생성된 인덱스: {', '.join(created) or '없음'}")
+    print(f"LOT 재고 확인: 인덱스 전 {before:.2f}ms, 인덱스 후 {after:.2f}ms")
+    failed = False
+    for result in results:
+        mark = "✅" if result["uses_index"] else "❌"
+        print(f"{mark} {result['name']} ({result['index']})")
+        for detail in result["plan"]:
+            print(f"    {detail}")
+        failed = failed or not result["uses_index"]
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,6 @@
 도커 환경에서 DB가 없으면 생성하고, 있으면 기존 DB를 사용합니다.
 """
 
-import os
 import sys
 from sqlalchemy.orm import Session
 from sqlalchemy import inspect
@@ -13,10 +12,9 @@ from models import User, Base
 from auth import get_password_hash
 
 def check_database_exists():
-    """데이터베이스 파일 존재 여부 확인"""
-    from database import DB_DIR
-    db_path = os.path.join(DB_DIR, "erp_system.db")
-    return os.path.exists(db_path)
+    """데이터베이스 존재 여부 확인"""
+    from database import database_exists
+    return database_exists()
 
 def check_tables_exist():
     """테이블 존재 여부 확인"""
@@ -77,7 +75,8 @@ def create_admin_user():
     except Exception as e:
         print(f"❌ 관리자 계정 생성 중 오류가 발생했습니다: {e}")
         db.rollback()
-        sys.exit(1)
+        # 서버 시작 시 같은 프로세스에서 호출되므로 종료하지 않고 호출한 쪽으로 예외 전달 (CLI 종료 코드는 main에서 처리)
+        raise
     finally:
         db.close()
     
@@ -0,0 +1,191 @@
+"""
+재고 스냅샷 (기간 마감 재고)
+정해진 주기(매일 또는 월말)마다 제품별/LOT별 마감 재고를 inventory_snapshot_lines에 기록합니다.
+특정 날짜의 재고는 그 날짜 이전의 가장 가까운 스냅샷에 스냅샷 이후 거래만 더해 계산하므로,
+전체 거래 내역을 처음부터 합산하지 않습니다. 새 스냅샷도 직전 스냅샷 + 그 사이 거래로 만듭니다.
+과거 날짜로 입출고하거나 과거 거래를 삭제/수정하면 그 날짜 이후의 스냅샷은 삭제되고 다음 주기에 다시 생성됩니다.
+
+누락된 스냅샷 생성:
+    python inventory_snapshots.py
+"""
+
+import asyncio
+import os
+from datetime import date, datetime, time, timedelta, timezone
+
+from sqlalchemy import select, delete, insert, func, case, literal, text, union_all, Date
+
+from models import StockTransaction, InventorySnapshot, InventorySnapshotLine
+
+# 스냅샷 주기: daily(매일 마감), monthly(월말 마감), off(생성하지 않음)
+INVENTORY_SNAPSHOT_INTERVAL = os.getenv("INVENTORY_SNAPSHOT_INTERVAL", "monthly").lower()
+# 누락된 스냅샷 확인 간격 (초)
+INVENTORY_SNAPSHOT_CHECK_SECONDS = float(os.getenv("INVENTORY_SNAPSHOT_CHECK_SECONDS", "3600"))
+
+SNAPSHOT_INTERVALS = ("daily", "monthly", "off")
+
+KST = timezone(timedelta(hours=9))
+
+def get_kst_today() -> date:
+    return datetime.now(KST).date()
+
+def to_kst_date(value: datetime) -> date:
+    """거래 시각의 서울 시간 기준 날짜 (시간대가 없으면 서울 시간으로 간주)"""
+    if value.tzinfo is not None:
+        value = value.astimezone(KST)
+    return value.date()
+
+def day_end(day: date) -> datetime:
+    """날짜 마감 시각 (다음 날 0시, 서울 시간)"""
+    return datetime.combine(day + timedelta(days=1), time.min, tzinfo=KST)
+
+def snapshot_dates_between(interval: str, start: date, end: date) -> list:
+    """start부터 end까지(포함) 주기에 해당하는 스냅샷 날짜 목록"""
+    if interval == "daily":
+        return [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+    if interval == "monthly":
+        dates = []
+        month_start = start.replace(day=1)
+        while True:
+            next_month = (month_start + timedelta(days=32)).replace(day=1)
+            month_end = next_month - timedelta(days=1)
+            if month_end > end:
+                return dates
+            if month_end >= start:
+                dates.append(month_end)
+            month_start = next_month
+    return []
+
+def closing_balances_query(as_of: date, base_date: date = None, product_id: int = None):
+    """as_of 마감 재고 (제품 ID, LOT 번호, 수량) 조회 쿼리 (base_date 스냅샷 + 이후 거래, 수량이 0인 항목 제외)"""
+    signed_quantity = case(
+        (StockTransaction.transaction_type == "in", StockTransaction.quantity),
+        else_=-StockTransaction.quantity
+    )
+    conditions = [StockTransaction.created_at < day_end(as_of)]
+    if base_date:
+        # 스냅샷 이후 거래만 조회 (created_at 인덱스 범위 검색)
+        conditions.append(StockTransaction.created_at >= day_end(base_date))
+    if product_id:
+        conditions.append(StockTransaction.product_id == product_id)
+
+    parts = [
+        # 제품 전체 재고 (LOT 번호 빈 문자열)
+        select(
+            StockTransaction.product_id.label("product_id"),
+            literal("").label("lot_number"),
+            signed_quantity.label("quantity")
+        ).where(*conditions),
+        # LOT별 재고
+        select(StockTransaction.product_id, StockTransaction.lot_number, signed_quantity).where(
+            *conditions,
+            StockTransaction.lot_number.isnot(None),
+            StockTransaction.lot_number != ""
+        )
+    ]
+    if base_date:
+        base = select(InventorySnapshotLine.product_id, InventorySnapshotLine.lot_number, InventorySnapshotLine.quantity).where(
+            InventorySnapshotLine.snapshot_date == base_date
+        )
+        if product_id:
+            base = base.where(InventorySnapshotLine.product_id == product_id)
+        parts.append(base)
+
+    movements = union_all(*parts).subquery()
+    total = func.sum(movements.c.quantity)
+    return select(
+        movements.c.product_id, movements.c.lot_number, total.label("quantity")
+    ).group_by(movements.c.product_id, movements.c.lot_number).having(total != 0)
+
+def latest_snapshot_before(snapshot_date: date):
+    """snapshot_date 이하의 가장 최근 스냅샷 날짜 조회 쿼리"""
+    return select(func.max(InventorySnapshot.snapshot_date)).where(InventorySnapshot.snapshot_date <= snapshot_date)
+
+def take_snapshot(connection, snapshot_date: date) -> int:
+    """snapshot_date 마감 재고 스냅샷을 생성하고 기록한 항목 수를 반환합니다. (이미 있으면 -1)"""
+    if snapshot_date >= get_kst_today():
+        raise ValueError(f"마감되지 않은 날짜의 스냅샷은 만들 수 없습니다: {snapshot_date}")
+    if connection.dialect.name == "postgresql":
+        # 스냅샷 계산 중 과거 날짜 거래가 커밋되면 그 거래의 스냅샷 무효화가 이 스냅샷 커밋 뒤에 실행되도록 잠금
+        connection.execute(text("LOCK TABLE inventory_snapshots IN EXCLUSIVE MODE"))
+    if connection.scalar(select(InventorySnapshot.id).where(InventorySnapshot.snapshot_date == snapshot_date)):
+        return -1
+
+    base_date = connection.scalar(latest_snapshot_before(snapshot_date - timedelta(days=1)))
+    balances = closing_balances_query(snapshot_date, base_date).subquery()
+    connection.execute(insert(InventorySnapshotLine).from_select(
+        ["snapshot_date", "product_id", "lot_number", "quantity"],
+        select(literal(snapshot_date, Date), balances.c.product_id, balances.c.lot_number, balances.c.quantity)
+    ))
+    line_count = connection.scalar(select(func.count()).select_from(InventorySnapshotLine).where(
+        InventorySnapshotLine.snapshot_date == snapshot_date
+    ))
+    connection.execute(insert(InventorySnapshot).values(
+        snapshot_date=snapshot_date, line_count=line_count, created_at=datetime.now(KST)
+    ))
+    return line_count
+
+def take_due_snapshots(engine, interval: str = INVENTORY_SNAPSHOT_INTERVAL) -> list:
+    """주기에 맞춰 아직 없는 스냅샷을 오래된 날짜부터 생성하고 생성한 날짜 목록을 반환합니다."""
+    if interval not in SNAPSHOT_INTERVALS:
+        raise ValueError(f"지원하지 않는 스냅샷 주기입니다: {interval}")
+    if interval == "off":
+        return []
+
+    with engine.connect() as connection:
+        latest = connection.scalar(select(func.max(InventorySnapshot.snapshot_date)))
+        first_created_at = connection.scalar(select(func.min(StockTransaction.created_at)))
+    if latest:
+        start = latest + timedelta(days=1)
+    elif first_created_at:
+        start = to_kst_date(first_created_at)
+    else:
+        return []  # 거래 내역 없음
+
+    created = []
+    for snapshot_date in snapshot_dates_between(interval, start, get_kst_today() - timedelta(days=1)):
+        # 스냅샷마다 별도 트랜잭션 (오래 걸리는 초기 생성 중에도 쓰기 잠금을 오래 잡지 않음)
+        with engine.begin() as connection:
+            if take_snapshot(connection, snapshot_date) >= 0:
+                created.append(snapshot_date)
+    return created
+
+async def invalidate_snapshots(db, changed_at: datetime):
+    """changed_at 날짜 이후의 스냅샷을 삭제합니다. (과거 날짜 거래 기록/삭제/수정 시, 같은 트랜잭션에서 호출)"""
+    if changed_at is None:
+        return
+    affected_from = to_kst_date(changed_at)
+    if affected_from >= get_kst_today():
+        return  # 마감되지 않은 날짜에는 스냅샷이 없음
+    # 스냅샷 목록을 먼저 삭제 (PostgreSQL에서 스냅샷 생성 잠금과 순서를 맞춤)
+    await db.execute(delete(InventorySnapshot).where(InventorySnapshot.snapshot_date >= affected_from))
+    await db.execute(delete(InventorySnapshotLine).where(InventorySnapshotLine.snapshot_date >= affected_from))
+
+async def get_balances_as_of(db, as_of: date, product_id: int = None):
+    """as_of 마감 재고를 가장 가까운 스냅샷 + 이후 거래로 계산하여 (사용한 스냅샷 날짜, [(제품 ID, LOT 번호, 수량)])을 반환합니다."""
+    base_date = await db.scalar(latest_snapshot_before(as_of))
+    rows = (await db.execute(closing_balances_query(as_of, base_date, product_id))).all()
+    return base_date, rows
+
+async def run_snapshot_schedule(engine, interval: str = INVENTORY_SNAPSHOT_INTERVAL):
+    """주기적으로 누락된 스냅샷을 생성합니다. (백그라운드 작업)"""
+    from starlette.concurrency import run_in_threadpool
+
+    while True:
+        try:
+            created = await run_in_threadpool(take_due_snapshots, engine, interval)
+            if created:
+                print(f"재고 스냅샷 {len(created)}건 생성: {created[0]} ~ {created[-1]}")
+        except Exception as e:
+            print(f"재고 스냅샷 생성 실패: {e}")
+        await asyncio.sleep(INVENTORY_SNAPSHOT_CHECK_SECONDS)
+
+if __name__ == "__main__":
+    from database import engine
+
+    with engine.begin() as connection:
+        InventorySnapshot.__table__.create(bind=connection, checkfirst=True)
+        InventorySnapshotLine.__table__.create(bind=connection, checkfirst=True)
+    interval = INVENTORY_SNAPSHOT_INTERVAL if INVENTORY_SNAPSHOT_INTERVAL != "off" else "monthly"
+    created = take_due_snapshots(engine, interval)
+    print(f"재고 스냅샷 생성 완료 ({interval}): {len(created)}건")
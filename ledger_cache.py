@@ -0,0 +1,128 @@
+"""
+거래 내역 통계 결과 캐시
+/api/transactions/filtered의 통계(전체 건수, 입고/출고 수량, 거래처 수)를 정규화한 필터 조건별로 보관해,
+같은 필터로 페이지를 넘기거나 다시 조회할 때 집계 쿼리를 반복하지 않습니다.
+
+거래 내역을 바꾸는 요청(입출고, 거래 삭제/수량 수정, 제품명/카테고리 변경)은 커밋 후 세대 번호를 올리고,
+캐시 항목은 계산을 시작할 때의 세대 번호와 함께 저장되어 세대가 바뀌면 더 이상 사용되지 않습니다.
+저장소는 프로세스 메모리에 있으며 최대 개수나 메모리 상한을 넘으면 가장 오래 사용하지 않은 항목부터 제거됩니다.
+"""
+
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+# 캐시 설정 (0이면 캐시 사용 안 함)
+LEDGER_CACHE_SIZE = int(os.getenv("LEDGER_CACHE_SIZE", "1024"))
+LEDGER_CACHE_MAX_BYTES = int(os.getenv("LEDGER_CACHE_MAX_BYTES", str(1024 * 1024)))
+
+# OrderedDict 노드와 (세대, 값) 튜플의 대략적인 항목당 메모리
+ENTRY_OVERHEAD_BYTES = 200
+
+def ledger_filter_key(**filters) -> tuple:
+    """필터 조건을 캐시 키로 정규화합니다. (빈 값/전체 카테고리 제외, 날짜는 필터에 쓰이는 부분만)"""
+    normalized = []
+    for name, value in sorted(filters.items()):
+        if isinstance(value, str):
+            value = value.strip()
+        if value is None or value == "" or (name == "category" and value == "all"):
+            continue
+        if name == "date_to":
+            # 종료일은 날짜만 사용 (시각은 무시하고 하루 끝까지 포함)
+            value = value[:10]
+        elif name == "date_from" and value.endswith(" 00:00:00"):
+            value = value[:10]
+        normalized.append((name, value))
+    return tuple(normalized)
+
+def entry_size(key: tuple, value: tuple) -> int:
+    """항목 하나의 대략적인 메모리 사용량 (바이트)"""
+    size = ENTRY_OVERHEAD_BYTES + sys.getsizeof(key) + sys.getsizeof(value)
+    for name, filter_value in key:
+        size += sys.getsizeof((name, filter_value)) + sys.getsizeof(filter_value)
+    return size + sum(sys.getsizeof(part) for part in value)
+
+class LedgerStatsCache:
+    """필터 조건별 거래 내역 통계를 거래 내역 세대 번호와 함께 보관하는 LRU 캐시 (개수 + 메모리 상한)"""
+
+    def __init__(self, max_size: int, max_bytes: int):
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # 필터 키 -> (세대 번호, 통계, 크기)
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    def bump(self):
+        """거래 내역이 바뀌었음을 기록합니다. (변경을 커밋한 뒤 호출, 이전 세대 항목은 모두 무효)"""
+        with self.lock:
+            self.generation += 1
+
+    def get(self, key: tuple) -> Optional[tuple]:
+        """현재 세대에 계산된 통계를 반환합니다. (없거나 이전 세대면 None)"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != self.generation:
+                if entry is not None:
+                    self.remove(key)
+                    self.stale += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: tuple, generation: int, value: tuple):
+        """generation(계산 시작 전에 읽은 세대 번호)에 계산한 통계를 저장합니다. (그사이 세대가 바뀌었으면 저장하지 않음)"""
+        if self.max_size <= 0:
+            return
+        size = entry_size(key, value)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if generation != self.generation:
+                return
+            if key in self.entries:
+                self.remove(key)
+            self.entries[key] = (generation, value, size)
+            self.bytes += size
+            while len(self.entries) > self.max_size or self.bytes > self.max_bytes:
+                oldest_key = next(iter(self.entries))
+                self.remove(oldest_key)
+                self.evictions += 1
+
+    def remove(self, key: tuple):
+        """항목을 제거하고 메모리 사용량을 줄입니다. (lock을 잡은 상태에서 호출)"""
+        _, _, size = self.entries.pop(key)
+        self.bytes -= size
+
+    def clear(self):
+        """모든 항목을 제거합니다."""
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        """캐시 크기, 메모리 사용량, 세대 번호와 적중/실패 횟수를 반환합니다."""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "max_size": self.max_size,
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "generation": self.generation,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "stale": self.stale,
+                "evictions": self.evictions
+            }
+
+ledger_stats_cache = LedgerStatsCache(LEDGER_CACHE_SIZE, LEDGER_CACHE_MAX_BYTES)
@@ -0,0 +1,180 @@
+"""
+LOT별 재고 집계 테이블 관리
+lot_balances 테이블은 (제품, LOT)별 현재 재고를 보관하며, 입고/출고/거래 삭제/수량 수정과
+같은 트랜잭션에서 갱신됩니다. LOT 재고 확인은 거래 내역 합계 대신 이 테이블을 한 번 조회합니다.
+자동 출고는 재고가 남은 LOT을 최초 입고순(FIFO) 또는 유통기한순(FEFO)으로 배정합니다.
+
+전체 재생성:
+    python lot_balances.py
+"""
+
+from datetime import datetime, timezone, timedelta
+
+from sqlalchemy import select, delete, insert, update, and_, func, case, literal, text, tuple_, DateTime
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import LotBalance, StockTransaction
+
+def get_kst_now():
+    return datetime.now(timezone(timedelta(hours=9)))
+
+def lot_delta(transaction_type: str, quantity: int) -> int:
+    """거래 유형에 따른 LOT 재고 변화량 (입고 +, 출고 -)"""
+    return quantity if transaction_type == "in" else -quantity
+
+def add_lot_movement(movements: dict, product_id: int, lot_number, delta: int):
+    """(제품 ID, LOT 번호)별 변화량을 누적합니다. (LOT 번호가 없거나 빈 문자열이면 무시)"""
+    if not lot_number or not delta:
+        return
+    key = (product_id, lot_number)
+    movements[key] = movements.get(key, 0) + delta
+
+def earlier_of(current, incoming):
+    """두 값 중 빠른 값 (NULL이 아닌 쪽 우선) SQL 식"""
+    return case(
+        (incoming.is_(None), current),
+        (current.is_(None), incoming),
+        (incoming < current, incoming),
+        else_=current
+    )
+
+async def apply_lot_movements(db, movements: dict, received_at=None, expiry_dates: dict = None):
+    """누적된 LOT 변화량을 lot_balances에 한 번의 UPSERT로 반영합니다."""
+    # 입고(received_at 지정)는 LOT의 최초 입고 시각을, expiry_dates는 (제품 ID, LOT 번호)별 유통기한을 함께 기록
+    now = get_kst_now()
+    expiry_dates = expiry_dates or {}
+    rows = [
+        {
+            "product_id": product_id,
+            "lot_number": lot_number,
+            "quantity": delta,
+            "first_received_at": received_at if delta > 0 else None,
+            "expiry_date": expiry_dates.get((product_id, lot_number)),
+            "updated_at": now
+        }
+        for (product_id, lot_number), delta in movements.items() if delta
+    ]
+    if not rows:
+        return
+    dialect_insert = postgresql_insert if db.bind.dialect.name == "postgresql" else sqlite_insert
+    statement = dialect_insert(LotBalance).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=[LotBalance.product_id, LotBalance.lot_number],
+        set_={
+            "quantity": LotBalance.quantity + statement.excluded.quantity,
+            "first_received_at": earlier_of(LotBalance.first_received_at, statement.excluded.first_received_at),
+            "expiry_date": earlier_of(LotBalance.expiry_date, statement.excluded.expiry_date),
+            "updated_at": statement.excluded.updated_at
+        }
+    )
+    await db.execute(statement)
+
+async def take_lot_quantity(db, product_id: int, lot_number: str, quantity: int) -> bool:
+    """LOT 재고가 충분할 때만 quantity만큼 차감합니다. (조건부 원자적 UPDATE, 부족하면 False)"""
+    result = await db.execute(update(LotBalance).where(
+        LotBalance.product_id == product_id,
+        LotBalance.lot_number == lot_number,
+        LotBalance.quantity >= quantity
+    ).values(quantity=LotBalance.quantity - quantity).execution_options(synchronize_session=False))
+    return result.rowcount == 1
+
+async def take_lot_quantities(db, quantities: dict) -> set:
+    """여러 LOT의 재고를 UPDATE ... CASE 한 번으로 차감하고 차감된 (제품 ID, LOT 번호)를 반환합니다. (LOT 재고가 부족하면 제외)"""
+    if not quantities:
+        return set()
+    quantity_case = case(*[
+        (and_(LotBalance.product_id == product_id, LotBalance.lot_number == lot_number), quantity)
+        for (product_id, lot_number), quantity in quantities.items()
+    ])
+    statement = update(LotBalance).where(
+        tuple_(LotBalance.product_id, LotBalance.lot_number).in_(list(quantities.keys())),
+        LotBalance.quantity >= quantity_case
+    ).values(quantity=LotBalance.quantity - quantity_case).returning(
+        LotBalance.product_id, LotBalance.lot_number
+    ).execution_options(synchronize_session=False)
+    return {(product_id, lot_number) for product_id, lot_number in await db.execute(statement)}
+
+async def get_lot_quantities(db, keys) -> dict:
+    """(제품 ID, LOT 번호) 목록의 현재 LOT 재고를 한 번에 조회합니다. (없는 LOT은 0)"""
+    keys = list(keys)
+    if not keys:
+        return {}
+    rows = await db.execute(select(LotBalance.product_id, LotBalance.lot_number, LotBalance.quantity).where(
+        tuple_(LotBalance.product_id, LotBalance.lot_number).in_(keys)
+    ))
+    quantities = {key: 0 for key in keys}
+    quantities.update({(product_id, lot_number): quantity for product_id, lot_number, quantity in rows})
+    return quantities
+
+# 자동 LOT 배정 방식별 우선순위 (같으면 먼저 생성된 LOT)
+LOT_ALLOCATION_ORDERS = {
+    "fifo": [LotBalance.first_received_at.asc().nulls_last(), LotBalance.id.asc()],
+    "fefo": [LotBalance.expiry_date.asc().nulls_last(), LotBalance.first_received_at.asc().nulls_last(), LotBalance.id.asc()],
+}
+
+async def allocate_lots(db, quantities: dict, strategy: str = "fifo"):
+    """제품별 요청 수량을 재고가 남은 LOT에 우선순위대로 배정하고 (배정 목록, 제품별 LOT 재고 합계)를 반환합니다."""
+    # 배정 목록: {제품 ID: [(LOT 번호, 수량)]}, LOT 재고 합계가 요청보다 작으면 재고 부족
+    allocations = {product_id: [] for product_id in quantities}
+    available = {product_id: 0 for product_id in quantities}
+    if not quantities:
+        return allocations, available
+
+    # 우선순위 순 누적 재고를 계산하여 요청 수량을 채우는 데 필요한 LOT만 조회 (한 번의 쿼리)
+    running_total = func.sum(LotBalance.quantity).over(
+        partition_by=LotBalance.product_id, order_by=LOT_ALLOCATION_ORDERS[strategy]
+    )
+    ranked = select(
+        LotBalance.product_id, LotBalance.lot_number, LotBalance.quantity, running_total.label("running_total")
+    ).where(
+        LotBalance.product_id.in_(list(quantities)),
+        LotBalance.quantity > 0
+    ).subquery()
+    requested = case(quantities, value=ranked.c.product_id)
+    rows = await db.execute(select(ranked).where(
+        ranked.c.running_total - ranked.c.quantity < requested
+    ).order_by(ranked.c.product_id, ranked.c.running_total))
+
+    for product_id, lot_number, quantity, total in rows:
+        already_allocated = total - quantity
+        allocations[product_id].append((lot_number, min(quantity, quantities[product_id] - already_allocated)))
+        available[product_id] = total
+    return allocations, available
+
+def rebuild_lot_balances(connection) -> int:
+    """stock_transactions에서 lot_balances 전체를 다시 생성하고 LOT 수를 반환합니다."""
+    signed_quantity = case(
+        (StockTransaction.transaction_type == "in", StockTransaction.quantity),
+        else_=-StockTransaction.quantity
+    )
+    source = select(
+        StockTransaction.product_id,
+        StockTransaction.lot_number,
+        func.sum(signed_quantity),
+        func.min(case((StockTransaction.transaction_type == "in", StockTransaction.created_at))),
+        func.min(StockTransaction.expiry_date),
+        literal(get_kst_now(), DateTime(timezone=True))
+    ).where(
+        StockTransaction.lot_number.isnot(None),
+        StockTransaction.lot_number != ""
+    ).group_by(
+        StockTransaction.product_id, StockTransaction.lot_number
+    ).order_by(func.min(StockTransaction.id))  # LOT 목록은 처음 기록된 순서로 표시
+
+    if connection.dialect.name == "postgresql":
+        # 재생성 중 다른 트랜잭션의 재고 이동이 반영되지 않고 사라지지 않도록 집계 테이블 쓰기를 막음
+        connection.execute(text("LOCK TABLE lot_balances IN EXCLUSIVE MODE"))
+    connection.execute(delete(LotBalance))
+    connection.execute(insert(LotBalance).from_select(
+        ["product_id", "lot_number", "quantity", "first_received_at", "expiry_date", "updated_at"], source
+    ))
+    return connection.scalar(select(func.count()).select_from(LotBalance))
+
+if __name__ == "__main__":
+    from database import engine
+
+    with engine.begin() as connection:
+        LotBalance.__table__.create(bind=connection, checkfirst=True)
+        count = rebuild_lot_balances(connection)
+    print(f"lot_balances 재생성 완료: {count}개 LOT")
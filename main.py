@@ -2,414 +2,126 @@ from fastapi import FastAPI, Request, Depends, HTTPException, status, Cookie
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func, text
-import uvicorn
-from datetime import datetime, timedelta
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session, joinedload, selectinload, contains_eager
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, text, select, insert, delete, update, inspect, case
+from datetime import datetime, timedelta, time
 from typing import List, Optional
 import os
 import io
 import csv
+import asyncio
 import pytz
 
-from database import get_db, engine
-from models import User, Product, StockTransaction, Supplier, AuditLog, CategoryOrder, PaymentTransaction, PaymentSchedule, PrepaymentBalance, Order, OrderItem, AdvancePayment, SupplySchedule, DocumentWork, Base
-from auth import get_current_user, get_current_admin, create_access_token, create_refresh_token, verify_password, get_password_hash
-from schemas import UserCreate, UserLogin, ProductCreate, ProductUpdate, StockTransactionCreate, StockTransactionQuantityUpdate, SupplierCreate, SupplierUpdate, BulkStockInCreate, BulkStockOutCreate, PaymentTransactionCreate, PaymentScheduleCreate, PrepaymentBalanceCreate, OrderCreate, OrderUpdate, AdvancePaymentCreate, AdvancePaymentUpdate, SupplyScheduleCreate, SupplyScheduleUpdate, DocumentWorkCreate, DocumentWorkUpdate
-import subprocess
-import sys
+from database import get_db, get_read_db, get_write_db, engine, async_write_engine, IS_SQLITE
+from db_indexes import verify_index_plans
+from lot_balances import add_lot_movement, apply_lot_movements, get_lot_quantities, take_lot_quantity, take_lot_quantities, lot_delta, rebuild_lot_balances, allocate_lots, LOT_ALLOCATION_ORDERS
+from stock_levels import change_product_stock, apply_stock_deltas, get_product_stock, get_product_stock_version
+from prepayments import settle_prepayment, update_prepayment_balance
+from idempotency import IdempotencyMiddleware, idempotency_store
+from write_coordinator import write_coordinator
+from stock_reconciliation import reconcile_stock
+from running_balances import refresh_running_balances
+from daily_rollups import add_rollup_movement, apply_daily_rollups, rollup_stats_query, monthly_out_quantities
+from ledger_cache import ledger_stats_cache, ledger_filter_key
+from pagination import encode_cursor, decode_cursor, keyset_after, keyset_before
+from text_search import product_name_contains, transaction_column_contains, prefers_search_index, product_search_query
+from inventory_snapshots import invalidate_snapshots, get_balances_as_of, take_snapshot, take_due_snapshots, run_snapshot_schedule, get_kst_today, day_end, INVENTORY_SNAPSHOT_INTERVAL, SNAPSHOT_INTERVALS
+from migrations import run_migrations, get_schema_version, LATEST_VERSION
+from models import User, Product, StockTransaction, Supplier, AuditLog, CategoryOrder, PaymentSchedule, Order, OrderItem, AdvancePayment, SupplySchedule, DocumentWork, LotBalance, InventorySnapshot, DailyStockRollup, Base
+from auth import get_current_user, get_current_admin, get_cookie_user, get_cookie_user_read, get_cookie_user_write, user_cache, token_cache, create_access_token, create_refresh_token, verify_password, get_password_hash
+from schemas import UserCreate, UserLogin, UserIdentity, ProductCreate, ProductUpdate, StockTransactionCreate, StockTransactionQuantityUpdate, SupplierCreate, SupplierUpdate, BulkStockInCreate, BulkStockOutCreate, BulkStockItem, AutoStockOutCreate, PaymentTransactionCreate, PaymentScheduleCreate, PrepaymentBalanceCreate, OrderCreate, OrderUpdate, AdvancePaymentCreate, AdvancePaymentUpdate, SupplyScheduleCreate, SupplyScheduleUpdate, DocumentWorkCreate, DocumentWorkUpdate
 
 def check_database_exists():
-    """데이터베이스 파일 존재 여부 확인"""
-    from database import DB_DIR
-    db_path = os.path.join(DB_DIR, "erp_system.db")
-    return os.path.exists(db_path)
+    """데이터베이스 존재 여부 확인"""
+    from database import database_exists
+    return database_exists()
 
-def ensure_all_tables_exist():
-    """모든 필요한 테이블이 존재하는지 확인하고 없으면 생성"""
-    try:
-        from database import SessionLocal, engine
-        db = SessionLocal()
-        
-        # 모든 테이블 존재 여부 확인
-        required_tables = [
-            'users', 'products', 'suppliers', 'stock_transactions', 
-            'audit_logs', 'orders', 'order_items', 'advance_payments',
-            'supply_schedules', 'document_works', 'payment_transactions',
-            'payment_schedules', 'prepayment_balances', 'category_orders'
-        ]
-        
-        missing_tables = []
-        for table in required_tables:
-            try:
-                db.execute(text(f"SELECT 1 FROM {table} LIMIT 1"))
-            except Exception:
-                missing_tables.append(table)
-        
-        db.close()
-        
-        if missing_tables:
-            print(f"누락된 테이블들: {missing_tables}")
-            print("모든 테이블을 생성합니다...")
-            Base.metadata.create_all(bind=engine)
-            print("모든 테이블 생성 완료!")
-            return True
-        else:
-            print("모든 테이블이 존재합니다.")
-            return True
-            
-    except Exception as e:
-        print(f"테이블 확인 중 오류: {e}")
-        # 오류가 발생해도 테이블 생성 시도
-        try:
-            Base.metadata.create_all(bind=engine)
-            print("오류 발생으로 인한 테이블 생성 완료!")
-            return True
-        except Exception as create_error:
-            print(f"테이블 생성 실패: {create_error}")
-            return False
+def get_table_names():
+    """데이터베이스의 테이블 목록 조회 (SQLAlchemy inspect 사용, 데이터베이스 종류 무관)"""
+    return set(inspect(engine).get_table_names())
 
-def check_audit_logs_table_exists():
-    """audit_logs 테이블 존재 여부 확인"""
-    try:
-        from database import SessionLocal
-        db = SessionLocal()
-        db.execute(text("SELECT 1 FROM audit_logs LIMIT 1"))
-        db.close()
-        return True
-    except Exception:
-        return False
-
-def check_sort_order_column_exists():
-    """products 테이블에 sort_order 컬럼 존재 여부 확인"""
-    try:
-        from database import SessionLocal
-        db = SessionLocal()
-        result = db.execute(text("PRAGMA table_info(products)"))
-        columns = result.fetchall()
-        db.close()
-        
-        # 컬럼명 확인
-        column_names = [column[1] for column in columns]
-        return 'sort_order' in column_names
-    except Exception:
-        return False
-
-def check_supplier_sort_order_column_exists():
-    """suppliers 테이블에 sort_order 컬럼 존재 여부 확인"""
-    try:
-        from database import SessionLocal
-        db = SessionLocal()
-        result = db.execute(text("PRAGMA table_info(suppliers)"))
-        columns = result.fetchall()
-        db.close()
-        
-        # 컬럼명 확인
-        column_names = [column[1] for column in columns]
-        return 'sort_order' in column_names
-    except Exception:
-        return False
+# category_orders 테이블 확인 결과 (한 번 확인되면 요청마다 별도 연결로 다시 조회하지 않음)
+category_orders_table_found = False
 
 def check_category_orders_table_exists():
     """category_orders 테이블 존재 여부 확인"""
-    try:
-        from database import SessionLocal
-        db = SessionLocal()
-        db.execute(text("SELECT 1 FROM category_orders LIMIT 1"))
-        db.close()
-        return True
-    except Exception:
-        return False
-
-def check_payment_tables_exist():
-    """결제 관련 테이블들 존재 여부 확인"""
-    try:
-        from database import SessionLocal
-        db = SessionLocal()
-        
-        # 각 테이블 존재 여부 확인
-        tables = ["payment_transactions", "payment_schedules", "prepayment_balances"]
-        for table in tables:
-            db.execute(text(f"SELECT 1 FROM {table} LIMIT 1"))
-        
-        db.close()
-        return True
-    except Exception:
-        return False
-
-def check_order_tables_exist():
-    """주문 관련 테이블들 존재 여부 확인"""
-    try:
-        from database import SessionLocal
-        db = SessionLocal()
-        
-        # 각 테이블 존재 여부 확인
-        tables = ["orders", "order_items", "advance_payments", "supply_schedules", "document_works"]
-        for table in tables:
-            db.execute(text(f"SELECT 1 FROM {table} LIMIT 1"))
-        
-        db.close()
-        return True
-    except Exception:
-        return False
-
-def migrate_add_sort_order():
-    """Product 테이블에 sort_order 컬럼을 추가하고 기존 데이터에 순서를 설정합니다."""
-    try:
-        from database import SessionLocal
-        db = SessionLocal()
-        
-        print("sort_order 컬럼을 추가하는 중...")
-        db.execute(text("ALTER TABLE products ADD COLUMN sort_order INTEGER DEFAULT 0"))
-        
-        # 기존 제품들에 카테고리별 순서 설정
-        print("기존 제품들에 순서를 설정하는 중...")
-        
-        # 카테고리별로 제품 조회
-        result = db.execute(text("""
-            SELECT id, category, name 
-            FROM products 
-            ORDER BY category, name
-        """))
-        products = result.fetchall()
-        
-        # 카테고리별 순서 카운터
-        category_counters = {}
-        
-        for product_id, category, name in products:
-            category_key = category or '미분류'
-            
-            if category_key not in category_counters:
-                category_counters[category_key] = 0
-            
-            category_counters[category_key] += 1
-            sort_order = category_counters[category_key]
-            
-            # sort_order 업데이트
-            db.execute(text("""
-                UPDATE products 
-                SET sort_order = :sort_order 
-                WHERE id = :product_id
-            """), {"sort_order": sort_order, "product_id": product_id})
-            
-            print(f"제품 '{name}' (카테고리: {category_key}) -> 순서: {sort_order}")
-        
-        # 변경사항 저장
-        db.commit()
-        print(f"마이그레이션 완료! 총 {len(products)}개 제품의 순서가 설정되었습니다.")
-        
-        return True
-        
-    except Exception as e:
-        print(f"마이그레이션 중 오류 발생: {e}")
-        db.rollback()
-        return False
-        
-    finally:
-        db.close()
-
-def migrate_add_supplier_sort_order():
-    """Supplier 테이블에 sort_order 컬럼을 추가하고 기존 데이터에 순서를 설정합니다."""
-    try:
-        from database import SessionLocal
-        db = SessionLocal()
-        
-        print("거래처 sort_order 컬럼을 추가하는 중...")
-        db.execute(text("ALTER TABLE suppliers ADD COLUMN sort_order INTEGER DEFAULT 0"))
-        
-        # 기존 거래처들에 타입별 순서 설정
-        print("기존 거래처들에 순서를 설정하는 중...")
-        
-        # 타입별로 거래처 조회
-        result = db.execute(text("""
-            SELECT id, supplier_type, name 
-            FROM suppliers 
-            ORDER BY supplier_type, name
-        """))
-        suppliers = result.fetchall()
-        
-        # 타입별 순서 카운터
-        type_counters = {}
-        
-        for supplier_id, supplier_type, name in suppliers:
-            if supplier_type not in type_counters:
-                type_counters[supplier_type] = 0
-            
-            type_counters[supplier_type] += 1
-            sort_order = type_counters[supplier_type]
-            
-            # sort_order 업데이트
-            db.execute(text("""
-                UPDATE suppliers 
-                SET sort_order = :sort_order 
-                WHERE id = :supplier_id
-            """), {"sort_order": sort_order, "supplier_id": supplier_id})
-            
-        
-        # 변경사항 저장
-        db.commit()
-        
-        return True
-        
-    except Exception as e:
-        print(f"마이그레이션 중 오류 발생: {e}")
-        db.rollback()
-        return False
-    finally:
-        db.close()
-
-def initialize_category_orders():
-    """카테고리 순서를 초기화합니다. (기존 데이터가 없을 때만)"""
-    try:
-        from database import SessionLocal
-        db = SessionLocal()
-        
-        # category_orders 테이블이 존재하지 않으면 생성
-        if not check_category_orders_table_exists():
-            print("category_orders 테이블이 없습니다. 생성합니다.")
-            Base.metadata.create_all(bind=engine)
-        
-        # 기존 카테고리 순서 데이터가 있는지 확인
-        existing_orders = db.query(CategoryOrder).count()
-        if existing_orders > 0:
-            return True
-        
-        # 현재 존재하는 모든 카테고리 조회
-        result = db.execute(text("""
-            SELECT DISTINCT category 
-            FROM products 
-            WHERE category IS NOT NULL
-            ORDER BY category
-        """))
-        categories = [row[0] for row in result.fetchall()]
-        
-        # 미분류 카테고리도 추가
-        categories.append('미분류')
-        
-        # 카테고리 순서 설정
-        for index, category in enumerate(categories):
-            category_order = CategoryOrder(
-                category_name=category,
-                sort_order=index + 1
-            )
-            db.add(category_order)
-            print(f"카테고리 '{category}' -> 순서: {index + 1}")
-        
-        db.commit()
-        print(f"카테고리 순서 초기화 완료! 총 {len(categories)}개 카테고리의 순서가 설정되었습니다.")
-        
-        return True
-        
-    except Exception as e:
-        print(f"카테고리 순서 초기화 중 오류 발생: {e}")
-        db.rollback()
-        return False
-        
-    finally:
-        db.close()
+    global category_orders_table_found
+    if not category_orders_table_found:
+        try:
+            category_orders_table_found = "category_orders" in get_table_names()
+        except Exception:
+            return False
+    return category_orders_table_found
 
-def migrate_supplier_type():
-    """거래처 유형 마이그레이션"""
-    try:
-        from database import SessionLocal
-        db = SessionLocal()
-        
-        # supplier_type 컬럼이 없는 거래처들 확인
-        result = db.execute(text("""
-            SELECT id, name, supplier_type 
-            FROM suppliers 
-            WHERE supplier_type IS NULL OR supplier_type = ''
-        """))
-        suppliers_without_type = result.fetchall()
-        
-        if suppliers_without_type:
-            print(f"supplier_type이 없는 거래처 {len(suppliers_without_type)}개를 발견했습니다.")
-            
-            for supplier_id, name, current_type in suppliers_without_type:
-                # 기본값으로 'out' (입고처) 설정
-                db.execute(text("""
-                    UPDATE suppliers 
-                    SET supplier_type = 'out' 
-                    WHERE id = :supplier_id
-                """), {"supplier_id": supplier_id})
-                print(f"거래처 '{name}' (ID: {supplier_id})의 유형을 '출고처처'로 설정했습니다.")
-            
-            db.commit()
-            print("거래처 유형 마이그레이션이 완료되었습니다.")
-            return True
-        else:
-            print("마이그레이션이 필요한 거래처가 없습니다.")
-            return True
-            
-    except Exception as e:
-        print(f"거래처 유형 마이그레이션 중 오류: {e}")
-        db.rollback()
-        return False
-    finally:
-        db.close()
+# 프로세스에서 데이터베이스 초기화를 이미 수행했는지 여부
+database_initialized = False
 
 def initialize_database():
-    """데이터베이스 초기화"""  # 먼저 테이블 생성 (데이터베이스 파일이 없어도 생성됨)  
+    """데이터베이스 초기화 (schema_version 기준으로 필요한 마이그레이션만 실행, 여러 번 호출해도 한 번만 수행)"""
+    global database_initialized
+    if database_initialized:
+        return
     
-    if not check_database_exists():
-        print("데이터베이스가 없습니다. 초기화를 시작합니다...")
-        try:
-            # init_admin.py 실행
-            result = subprocess.run([sys.executable, "init_admin.py"], 
-                                  capture_output=True, text=True, check=True)
-            print("데이터베이스 초기화 완료:")
-            print(result.stdout)
-        except subprocess.CalledProcessError as e:
-            print(f"데이터베이스 초기화 실패: {e}")
-            print(f"에러 출력: {e.stderr}")
-            sys.exit(1)
-    else:
-        print("기존 데이터베이스를 사용합니다.")
-        init_audit_logs_table()
+    # SQLite는 연결하면 파일이 생기므로 버전 조회 전에 파일 존재 여부 확인 (쿼리 없음)
+    is_new_database = IS_SQLITE and not check_database_exists()
     
-    # sort_order 컬럼 마이그레이션 확인 및 실행
-    if not check_sort_order_column_exists():
-        print("sort_order 컬럼이 없습니다. 마이그레이션을 시작합니다...")
-        if migrate_add_sort_order():
-            print("sort_order 컬럼 마이그레이션이 완료되었습니다.")
-        else:
-            print("❌ sort_order 컬럼 마이그레이션에 실패했습니다.")
-    else:
-        print("sort_order 컬럼이 이미 존재합니다.")
+    # 최신 스키마면 버전 조회 한 번으로 끝남
+    if not is_new_database and get_schema_version(engine) >= LATEST_VERSION:
+        print("기존 데이터베이스를 사용합니다.")
+        database_initialized = True
+        return
     
-    # 거래처 유형 마이그레이션
-    print("거래처 유형 마이그레이션을 확인합니다...")
-    try:
-        if migrate_supplier_type():
-            print("거래처 유형 마이그레이션이 완료되었습니다.")
-        else:
-            print("❌ 거래처 유형 마이그레이션에 실패했습니다.")
-    except Exception as e:
-        print(f"❌ 거래처 유형 마이그레이션 중 예외 발생: {e}")
+    is_new_database = is_new_database or not check_database_exists()
+    if is_new_database:
+        print("데이터베이스가 없습니다. 초기화를 시작합니다...")
     
-    # 카테고리 순서 초기화
-    print("카테고리 순서를 초기화합니다...")
     try:
-        if initialize_category_orders():
-            print("카테고리 순서 초기화가 완료되었습니다.")
-        else:
-            print("❌ 카테고리 순서 초기화에 실패했습니다.")
+        version = run_migrations(engine)
+        print(f"스키마 버전: {version}")
     except Exception as e:
-        print(f"❌ 카테고리 순서 초기화 중 예외 발생: {e}")
-        # 카테고리 순서 초기화 실패해도 애플리케이션은 계속 실행
+        # 스키마가 최신이 아니면 요청을 처리할 수 없으므로 시작을 중단 (실패한 마이그레이션은 롤백되어 다음 시작 시 재시도)
+        print(f"❌ 스키마 마이그레이션 중 예외 발생: {e}")
+        raise
 
-def init_audit_logs_table():
-    """감사 로그 테이블 생성"""
-    if not check_audit_logs_table_exists():
-        print("감사 로그 테이블이 없습니다. 생성합니다.")
-        Base.metadata.create_all(bind=engine)
-        print("감사 로그 테이블 생성 완료")
+    # 마이그레이션 후 주요 조회 쿼리가 관리 인덱스를 사용하는지 확인 (경고만 출력)
+    for result in verify_index_plans(engine):
+        if not result["uses_index"]:
+            print(f"⚠️ '{result['name']}' 쿼리가 {result['index']} 인덱스를 사용하지 않습니다: {result['plan']}")
+
+    # 새 데이터베이스에만 관리자 계정 생성 (별도 프로세스 없이 같은 프로세스에서 실행)
+    if is_new_database:
+        from init_admin import create_admin_user
+        create_admin_user()
+    
+    database_initialized = True
 
-# 애플리케이션 시작 전 데이터베이스 초기화
-initialize_database()
 
 app = FastAPI(title="웹 기반 재고관리 시스템", description="웹 기반 재고관리 시스템")
 
+# 중복 제출(재시도, 더블 클릭)로 거래가 두 번 기록되지 않도록 Idempotency-Key를 적용하는 경로
+IDEMPOTENT_PATHS = ["/stock/in", "/stock/in/bulk", "/stock/out", "/stock/out/bulk", "/stock/out/auto", "/api/orders"]
+app.add_middleware(IdempotencyMiddleware, paths=IDEMPOTENT_PATHS)
+
+# 시작 시 데이터베이스 초기화 (모듈 import 시에는 데이터베이스 작업을 하지 않음)
+@app.on_event("startup")
+def initialize_database_on_startup():
+    initialize_database()
+
+# 입출고 쓰기 묶음 처리 시작 (요청과 같은 이벤트 루프에서 실행)
+@app.on_event("startup")
+async def start_write_coordinator():
+    write_coordinator.start()
+
+# 재고 스냅샷 주기 생성 시작
+@app.on_event("startup")
+async def start_inventory_snapshots():
+    app.state.snapshot_task = None
+    if INVENTORY_SNAPSHOT_INTERVAL == "off":
+        return
+    app.state.snapshot_task = asyncio.create_task(run_snapshot_schedule(engine))
+
 # 서울 시간대 설정
 SEOUL_TZ = pytz.timezone('Asia/Seoul')
 
@@ -452,51 +164,6 @@ def format_datetime_for_display(dt: datetime) -> str:
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
-# 쿠키 기반 인증 헬퍼 함수
-def get_current_user_from_cookie(access_token: str = Cookie(None), refresh_token: str = Cookie(None)):
-
-    
-    if not access_token and not refresh_token:
-
-        return None
-    
-    from auth import verify_token, verify_refresh_token, is_token_expired, create_access_token
-    from database import SessionLocal
-    
-    # 액세스 토큰이 있고 유효한 경우
-    if access_token and not is_token_expired(access_token):
-        username = verify_token(access_token)
-        if username:
-            db = SessionLocal()
-            try:
-                user = db.query(User).filter(User.username == username).first()
-                if user and user.is_approved:
-
-                    return user
-            except Exception as e:
-                print(f"DEBUG: 데이터베이스 조회 중 오류: {e}")
-            finally:
-                db.close()
-    
-    # 액세스 토큰이 만료되었거나 없고, 리프레시 토큰이 있는 경우
-    if refresh_token and refresh_token != "None":
-        username = verify_refresh_token(refresh_token)
-        if username:
-
-            db = SessionLocal()
-            try:
-                user = db.query(User).filter(User.username == username).first()
-                if user and user.is_approved:
-
-                    return user
-            except Exception as e:
-                print(f"DEBUG: 데이터베이스 조회 중 오류: {e}")
-            finally:
-                db.close()
-    
-
-    return None
-
 # 메인 페이지 - 로그인 페이지로 리다이렉트
 @app.get("/", response_class=HTMLResponse)
 async def root():
@@ -564,14 +231,14 @@ async def pending_approval_page(request: Request):
 
 # 회원가입 처리
 @app.post("/register")
-async def register(user: UserCreate, db: Session = Depends(get_db)):
+async def register(user: UserCreate, db: AsyncSession = Depends(get_write_db)):
     # 사용자명 중복 확인
-    db_user = db.query(User).filter(User.username == user.username).first()
+    db_user = await db.scalar(select(User).where(User.username == user.username))
     if db_user:
         raise HTTPException(status_code=400, detail="이미 등록된 사용자명입니다")
     
     # 이메일 중복 확인
-    db_user = db.query(User).filter(User.email == user.email).first()
+    db_user = await db.scalar(select(User).where(User.email == user.email))
     if db_user:
         raise HTTPException(status_code=400, detail="이미 등록된 이메일입니다")
     
@@ -586,8 +253,7 @@ async def register(user: UserCreate, db: Session = Depends(get_db)):
         is_admin=False
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
     
     response = RedirectResponse(url="/pending-approval", status_code=302)
     return response
@@ -602,16 +268,14 @@ async def logout():
 
 # 대시보드
 @app.get("/dashboard", response_class=HTMLResponse)
-async def dashboard(request: Request, access_token: str = Cookie(None)):
-    user = get_current_user_from_cookie(access_token)
+async def dashboard(request: Request, user: Optional[UserIdentity] = Depends(get_cookie_user), db: Session = Depends(get_db)):
     if not user:
         return RedirectResponse(url="/login", status_code=302)
     
-    db = next(get_db())
-    
     # 기본 통계 데이터
     total_products = db.query(Product).count()
-    total_transactions = db.query(StockTransaction).count()
+    # 거래 수는 일별 입출고 집계의 건수 합계 (거래 내역 전체를 세지 않음)
+    total_transactions = db.query(func.sum(DailyStockRollup.transaction_count)).scalar() or 0
     total_stock = db.query(func.sum(Product.stock_quantity)).scalar() or 0
     
     # 최근 거래 내역 (거래처 정보 포함)
@@ -649,8 +313,7 @@ async def dashboard(request: Request, access_token: str = Cookie(None)):
 
 # 관리자 페이지
 @app.get("/admin", response_class=HTMLResponse)
-async def admin_page(request: Request, access_token: str = Cookie(None)):
-    user = get_current_user_from_cookie(access_token)
+async def admin_page(request: Request, user: Optional[UserIdentity] = Depends(get_cookie_user), db: Session = Depends(get_db)):
     if not user:
         return RedirectResponse(url="/login", status_code=302)
     
@@ -661,7 +324,6 @@ async def admin_page(request: Request, access_token: str = Cookie(None)):
             detail="관리자 권한이 필요합니다"
         )
     
-    db = next(get_db())
     pending_users = db.query(User).filter(User.is_approved == False).all()
     return templates.TemplateResponse("admin.html", {
         "request": request,
@@ -670,8 +332,7 @@ async def admin_page(request: Request, access_token: str = Cookie(None)):
 
 # 감사 로그 페이지
 @app.get("/audit-logs", response_class=HTMLResponse)
-async def audit_logs_page(request: Request, access_token: str = Cookie(None)):
-    user = get_current_user_from_cookie(access_token)
+async def audit_logs_page(request: Request, user: Optional[UserIdentity] = Depends(get_cookie_user_read)):
     if not user:
         return RedirectResponse(url="/login", status_code=302)
     
@@ -690,8 +351,7 @@ async def audit_logs_page(request: Request, access_token: str = Cookie(None)):
 
 # 사용자 승인
 @app.post("/admin/approve/{user_id}")
-async def approve_user(user_id: int, access_token: str = Cookie(None), db: Session = Depends(get_db)):
-    current_user = get_current_user_from_cookie(access_token)
+async def approve_user(user_id: int, current_user: Optional[UserIdentity] = Depends(get_cookie_user_write), db: AsyncSession = Depends(get_write_db)):
     if not current_user:
         raise HTTPException(status_code=401, detail="인증이 필요합니다")
     
@@ -702,18 +362,18 @@ async def approve_user(user_id: int, access_token: str = Cookie(None), db: Sessi
             detail="관리자 권한이 필요합니다"
         )
     
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="사용자를 찾을 수 없습니다")
     
     user.is_approved = True
-    db.commit()
+    await db.commit()
+    user_cache.invalidate(user.username)
     return {"message": "사용자가 승인되었습니다"}
 
 # 사용자 거부 (삭제)
 @app.delete("/admin/reject/{user_id}")
-async def reject_user(user_id: int, access_token: str = Cookie(None), db: Session = Depends(get_db)):
-    current_user = get_current_user_from_cookie(access_token)
+async def reject_user(user_id: int, current_user: Optional[UserIdentity] = Depends(get_cookie_user_write), db: AsyncSession = Depends(get_write_db)):
     if not current_user:
         raise HTTPException(status_code=401, detail="인증이 필요합니다")
     
@@ -724,7 +384,7 @@ async def reject_user(user_id: int, access_token: str = Cookie(None), db: Sessio
             detail="관리자 권한이 필요합니다"
         )
     
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="사용자를 찾을 수 없습니다")
     
@@ -732,18 +392,18 @@ async def reject_user(user_id: int, access_token: str = Cookie(None), db: Sessio
     if user.is_admin:
         raise HTTPException(status_code=400, detail="관리자는 삭제할 수 없습니다")
     
-    db.delete(user)
-    db.commit()
+    username = user.username
+    await db.delete(user)
+    await db.commit()
+    user_cache.invalidate(username)
     return {"message": "사용자가 거부되었습니다"}
 
 # 재고 관리 페이지
 @app.get("/inventory", response_class=HTMLResponse)
-async def inventory_page(request: Request, access_token: str = Cookie(None)):
-    user = get_current_user_from_cookie(access_token)
+async def inventory_page(request: Request, user: Optional[UserIdentity] = Depends(get_cookie_user), db: Session = Depends(get_db)):
     if not user:
         return RedirectResponse(url="/login", status_code=302)
     
-    db = next(get_db())
     products = db.query(Product).all()
     
     # 카테고리별 제품 그룹화 (카테고리 순서 고려)
@@ -781,8 +441,7 @@ async def inventory_page(request: Request, access_token: str = Cookie(None)):
 
 # 제품 추가
 @app.post("/inventory/add")
-async def add_product(product: ProductCreate, access_token: str = Cookie(None), db: Session = Depends(get_db)):
-    user = get_current_user_from_cookie(access_token)
+async def add_product(product: ProductCreate, user: Optional[UserIdentity] = Depends(get_cookie_user_write), db: AsyncSession = Depends(get_write_db)):
     if not user:
         raise HTTPException(status_code=401, detail="인증이 필요합니다")
     
@@ -799,18 +458,18 @@ async def add_product(product: ProductCreate, access_token: str = Cookie(None),
     
     # 새로운 카테고리인 경우 카테고리 순서에 추가
     if product.category and check_category_orders_table_exists():
-        existing_category_order = db.query(CategoryOrder).filter(CategoryOrder.category_name == product.category).first()
+        existing_category_order = await db.scalar(select(CategoryOrder).where(CategoryOrder.category_name == product.category))
         if not existing_category_order:
             # 새로운 카테고리 순서 생성 (가장 마지막 순서로)
-            max_order = db.query(func.max(CategoryOrder.sort_order)).scalar() or 0
+            max_order = await db.scalar(select(func.max(CategoryOrder.sort_order))) or 0
             new_category_order = CategoryOrder(
                 category_name=product.category,
                 sort_order=max_order + 1
             )
             db.add(new_category_order)
     
-    db.commit()
-    db.refresh(db_product)
+    await db.commit()
+    await db.refresh(db_product)
     return {"message": "제품이 추가되었습니다", "product": db_product}
 
 # 제품 목록 조회 API
@@ -819,10 +478,9 @@ async def get_products(
     sort_by: str = "custom", 
     sort_order: str = "asc", 
     category: str = None,
-    access_token: str = Cookie(None), 
+    user: Optional[UserIdentity] = Depends(get_cookie_user), 
     db: Session = Depends(get_db)
 ):
-    user = get_current_user_from_cookie(access_token)
     if not user:
         # 임시로 인증 없이 테스트
         pass
@@ -916,6 +574,7 @@ async def get_products(
             "name": product.name,
             "price": product.price,
             "stock_quantity": product.stock_quantity,
+            "version": product.version,
             "safety_stock": product.safety_stock,
             "safety_stock_level": product.safety_stock_level,
             "category": product.category,
@@ -931,11 +590,10 @@ async def get_products(
 @app.put("/api/products/reorder")
 async def reorder_products(
     reorder_data: dict,
-    access_token: str = Cookie(None), 
-    db: Session = Depends(get_db)
+    user: Optional[UserIdentity] = Depends(get_cookie_user_write), 
+    db: AsyncSession = Depends(get_write_db)
 ):
     """제품들의 순서를 변경합니다."""
-    user = get_current_user_from_cookie(access_token)
     if not user:
         raise HTTPException(status_code=401, detail="인증이 필요합니다")
     
@@ -954,34 +612,35 @@ async def reorder_products(
             if not product_id or sort_order is None:
                 continue
                 
-            product = db.query(Product).filter(Product.id == product_id).first()
+            product = await db.get(Product, product_id)
             if product:
                 product.sort_order = sort_order
         
-        db.commit()
+        await db.commit()
         
         return {"message": "제품 순서가 변경되었습니다", "updated_count": len(product_orders)}
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"순서 변경 중 오류가 발생했습니다: {str(e)}")
 
 # 카테고리 순서 변경 API
 @app.put("/api/categories/reorder")
 async def reorder_categories(
     reorder_data: dict,
-    access_token: str = Cookie(None), 
-    db: Session = Depends(get_db)
+    user: Optional[UserIdentity] = Depends(get_cookie_user_write), 
+    db: AsyncSession = Depends(get_write_db)
 ):
     """카테고리들의 순서를 변경합니다."""
-    user = get_current_user_from_cookie(access_token)
     if not user:
         raise HTTPException(status_code=401, detail="인증이 필요합니다")
     
     try:
         # category_orders 테이블이 존재하지 않으면 생성
         if not check_category_orders_table_exists():
-            Base.metadata.create_all(bind=engine)
+            # 요청 세션의 쓰기 연결에서 생성 (단일 쓰기 연결을 다른 연결로 다시 기다리지 않음)
+            connection = await db.connection()
+            await connection.run_sync(Base.metadata.create_all)
         
         # reorder_data 형식: {"category_orders": [{"category_name": "카테고리1", "sort_order": 1}, ...]}
         category_orders = reorder_data.get("category_orders", [])
@@ -999,14 +658,14 @@ async def reorder_categories(
                 continue
                 
             # 기존 카테고리 순서 조회 또는 생성
-            category_order = db.query(CategoryOrder).filter(CategoryOrder.category_name == category_name).first()
+            category_order = await db.scalar(select(CategoryOrder).where(CategoryOrder.category_name == category_name))
             if category_order:
                 category_order.sort_order = sort_order
             else:
                 # 새로운 카테고리 순서 생성
                 # 만약 sort_order가 999라면 (새 카테고리 추가), 마지막 순서로 설정
                 if sort_order == 999:
-                    max_order = db.query(db.func.max(CategoryOrder.sort_order)).scalar() or 0
+                    max_order = await db.scalar(select(func.max(CategoryOrder.sort_order))) or 0
                     sort_order = max_order + 1
                 
                 category_order = CategoryOrder(
@@ -1017,19 +676,18 @@ async def reorder_categories(
             
             updated_count += 1
         
-        db.commit()
+        await db.commit()
         
         return {"message": "카테고리 순서가 변경되었습니다", "updated_count": updated_count}
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"카테고리 순서 변경 중 오류가 발생했습니다: {str(e)}")
 
 # 카테고리 목록 조회 API
 @app.get("/api/categories")
-async def get_categories(access_token: str = Cookie(None), db: Session = Depends(get_db)):
+async def get_categories(user: Optional[UserIdentity] = Depends(get_cookie_user), db: Session = Depends(get_db)):
     """모든 카테고리 목록을 조회합니다."""
-    user = get_current_user_from_cookie(access_token)
     if not user:
         raise HTTPException(status_code=401, detail="인증이 필요합니다")
     
@@ -1064,9 +722,8 @@ async def get_categories(access_token: str = Cookie(None), db: Session = Depends
 
 # 카테고리 순서 조회 API
 @app.get("/api/categories/order")
-async def get_category_orders(access_token: str = Cookie(None), db: Session = Depends(get_db)):
+async def get_category_orders(user: Optional[UserIdentity] = Depends(get_cookie_user), db: Session = Depends(get_db)):
     """카테고리 순서를 조회합니다."""
-    user = get_current_user_from_cookie(access_token)
     if not user:
         raise HTTPException(status_code=401, detail="인증이 필요합니다")
     
@@ -1086,11 +743,12 @@ async def get_category_orders(access_token: str = Cookie(None), db: Session = De
 
 # 현재 사용자 정보 조회 API
 @app.get("/api/user/me")
-async def get_current_user_info(access_token: str = Cookie(None), db: Session = Depends(get_db)):
-    user = get_current_user_from_cookie(access_token)
+async def get_current_user_info(user: Optional[UserIdentity] = Depends(get_cookie_user), db: Session = Depends(get_db)):
     if not user:
         raise HTTPException(status_code=401, detail="인증이 필요합니다")
     
+    # 이메일/가입일은 인증 캐시에 없으므로 조회
+    user = db.get(User, user.id)
     return {
         "id": user.id,
         "username": user.username,
@@ -1101,10 +759,40 @@ async def get_current_user_info(access_token: str = Cookie(None), db: Session =
         "created_at": user.created_at
     }
 
+# 제품 검색 API (/api/products/{product_id}보다 먼저 등록해야 함)
+@app.get("/api/products/search")
+async def search_products(
+    q: str,
+    limit: int = 20,
+    user: Optional[UserIdentity] = Depends(get_cookie_user_read),
+    db: AsyncSession = Depends(get_read_db)
+):
+    if not user:
+        raise HTTPException(status_code=401, detail="인증이 필요합니다")
+    
+    term = q.strip()
+    if not term:
+        raise HTTPException(status_code=400, detail="검색어를 입력해주세요")
+    limit = max(1, min(limit, 100))
+    
+    # 제품명/카테고리 검색 인덱스 (앞부분 일치 우선, 세 글자 이상은 trigram 인덱스 사용)
+    products = (await db.scalars(product_search_query(term, limit))).all()
+    return {
+        "query": term,
+        "products": [
+            {
+                "id": product.id,
+                "name": product.name,
+                "category": product.category,
+                "stock_quantity": product.stock_quantity
+            }
+            for product in products
+        ]
+    }
+
 # 제품 정보 조회 API
 @app.get("/api/products/{product_id}")
-async def get_product(product_id: int, access_token: str = Cookie(None), db: Session = Depends(get_db)):
-    user = get_current_user_from_cookie(access_token)
+async def get_product(product_id: int, user: Optional[UserIdentity] = Depends(get_cookie_user), db: Session = Depends(get_db)):
     if not user:
         raise HTTPException(status_code=401, detail="인증이 필요합니다")
     
@@ -1119,10 +807,9 @@ async def get_product(product_id: int, access_token: str = Cookie(None), db: Ses
 async def get_product_consumption_analysis(
     product_id: int, 
     months: int = 6,  # 분석할 개월 수 (기본 6개월)
-    access_token: str = Cookie(None), 
+    user: Optional[UserIdentity] = Depends(get_cookie_user), 
     db: Session = Depends(get_db)
 ):
-    user = get_current_user_from_cookie(access_token)
     if not user:
         raise HTTPException(status_code=401, detail="인증이 필요합니다")
     
@@ -1134,21 +821,8 @@ async def get_product_consumption_analysis(
     current_time = get_seoul_time()
     start_date = current_time - timedelta(days=months * 30)  # 대략적인 개월 계산
     
-    # 해당 기간 동안의 출고 거래 조회
-    out_transactions = db.query(StockTransaction).filter(
-        StockTransaction.product_id == product_id,
-        StockTransaction.transaction_type == "out",
-        StockTransaction.created_at >= start_date
-    ).order_by(StockTransaction.created_at.asc()).all()
-    
-    # 월별 소모량 계산
-    monthly_consumption = {}
-    for transaction in out_transactions:
-        # 거래 날짜를 월 단위로 그룹화 (YYYY-MM 형식)
-        month_key = transaction.created_at.strftime('%Y-%m')
-        if month_key not in monthly_consumption:
-            monthly_consumption[month_key] = 0
-        monthly_consumption[month_key] += transaction.quantity
+    # 월별 소모량 계산 (YYYY-MM 형식, 출고 거래를 모두 읽는 대신 일별 입출고 집계를 합산)
+    monthly_consumption = monthly_out_quantities(db, product_id, start_date)
     
     # 월별 소모량 리스트 생성 (월 순서대로)
     monthly_data = []
@@ -1184,18 +858,17 @@ async def get_product_consumption_analysis(
 
 # 제품 수정 API
 @app.put("/api/products/{product_id}")
-async def update_product(product_id: int, product_update: ProductUpdate, access_token: str = Cookie(None), db: Session = Depends(get_db)):
-    user = get_current_user_from_cookie(access_token)
+async def update_product(product_id: int, product_update: ProductUpdate, user: Optional[UserIdentity] = Depends(get_cookie_user_write), db: AsyncSession = Depends(get_write_db)):
     if not user:
         raise HTTPException(status_code=401, detail="인증이 필요합니다")
     
-    db_product = db.query(Product).filter(Product.id == product_id).first()
+    db_product = await db.get(Product, product_id)
     if not db_product:
         raise HTTPException(status_code=404, detail="제품을 찾을 수 없습니다")
     
     # 제품명 중복 확인 (자기 자신 제외)
     if product_update.name and product_update.name != db_product.name:
-        existing_product = db.query(Product).filter(Product.name == product_update.name).first()
+        existing_product = await db.scalar(select(Product).where(Product.name == product_update.name))
         if existing_product:
             raise HTTPException(status_code=400, detail="이미 존재하는 제품명입니다")
     
@@ -1210,30 +883,31 @@ async def update_product(product_id: int, product_update: ProductUpdate, access_
     
     # 새로운 카테고리인 경우 카테고리 순서에 추가
     if new_category and new_category != old_category and check_category_orders_table_exists():
-        existing_category_order = db.query(CategoryOrder).filter(CategoryOrder.category_name == new_category).first()
+        existing_category_order = await db.scalar(select(CategoryOrder).where(CategoryOrder.category_name == new_category))
         if not existing_category_order:
             # 새로운 카테고리 순서 생성 (가장 마지막 순서로)
-            max_order = db.query(func.max(CategoryOrder.sort_order)).scalar() or 0
+            max_order = await db.scalar(select(func.max(CategoryOrder.sort_order))) or 0
             new_category_order = CategoryOrder(
                 category_name=new_category,
                 sort_order=max_order + 1
             )
             db.add(new_category_order)
     
-    db.commit()
-    db.refresh(db_product)
+    await db.commit()
+    await db.refresh(db_product)
+    
+    # 제품명/카테고리가 바뀌면 제품명 검색/카테고리 필터의 거래 내역 통계가 달라짐
+    if "name" in update_data or "category" in update_data:
+        ledger_stats_cache.bump()
     
     return {"message": "제품이 수정되었습니다", "product": db_product}
 
 # 입고 페이지
 @app.get("/stock/in", response_class=HTMLResponse)
-async def stock_in_page(request: Request, access_token: str = Cookie(None)):
-    user = get_current_user_from_cookie(access_token)
+async def stock_in_page(request: Request, user: Optional[UserIdentity] = Depends(get_cookie_user), db: Session = Depends(get_db)):
     if not user:
         return RedirectResponse(url="/login", status_code=302)
     
-    db = next(get_db())
-    
     # 카테고리 순서 조회 (테이블이 존재할 때만)
     category_order_dict = {}
     try:
@@ -1259,13 +933,10 @@ async def stock_in_page(request: Request, access_token: str = Cookie(None)):
 
 # 출고 페이지
 @app.get("/stock/out", response_class=HTMLResponse)
-async def stock_out_page(request: Request, access_token: str = Cookie(None)):
-    user = get_current_user_from_cookie(access_token)
+async def stock_out_page(request: Request, user: Optional[UserIdentity] = Depends(get_cookie_user), db: Session = Depends(get_db)):
     if not user:
         return RedirectResponse(url="/login", status_code=302)
     
-    db = next(get_db())
-    
     # 카테고리 순서 조회 (테이블이 존재할 때만)
     category_order_dict = {}
     try:
@@ -1289,19 +960,28 @@ async def stock_out_page(request: Request, access_token: str = Cookie(None)):
         "products": sorted_products
     })
 
-# 입고 처리
+# 거래 내역을 바꾸는 쓰기 단위 실행 (커밋된 뒤 거래 내역 통계 캐시의 세대를 올림)
+async def submit_ledger_write(function, *args):
+    result = await write_coordinator.submit(function, *args)
+    ledger_stats_cache.bump()
+    return result
+
+# 입고 처리 (쓰기 묶음 처리기에서 다른 입출고와 함께 커밋)
 @app.post("/stock/in")
-async def process_stock_in(transaction: StockTransactionCreate, access_token: str = Cookie(None), db: Session = Depends(get_db)):
-    user = get_current_user_from_cookie(access_token)
+async def process_stock_in(transaction: StockTransactionCreate, user: Optional[UserIdentity] = Depends(get_cookie_user_read)):
     if not user:
         raise HTTPException(status_code=401, detail="인증이 필요합니다")
     
-    product = db.query(Product).filter(Product.id == transaction.product_id).first()
+    return await submit_ledger_write(apply_stock_in, transaction, user)
+
+async def apply_stock_in(db: AsyncSession, transaction: StockTransactionCreate, user: UserIdentity):
+    """입고 한 건을 반영합니다. (커밋은 쓰기 묶음 처리기에서)"""
+    product = await db.get(Product, transaction.product_id)
     if not product:
         raise HTTPException(status_code=404, detail="제품을 찾을 수 없습니다")
     
-    # 재고 수량 증가
-    product.stock_quantity += transaction.quantity
+    # 재고 수량 증가 (원자적 UPDATE)
+    stock_after, version = await change_product_stock(db, transaction.product_id, transaction.quantity)
     
     # 입고 거래 기록 (서울 시간대 사용)
     current_time = get_seoul_time()
@@ -1313,37 +993,90 @@ async def process_stock_in(transaction: StockTransactionCreate, access_token: st
         transaction_type="in",
         quantity=transaction.quantity,
         lot_number=transaction.lot_number,
+        expiry_date=transaction.expiry_date,
         location=transaction.location,
         notes=transaction.notes,
         created_at=transaction_time
     )
     db.add(stock_transaction)
-    db.flush()  # ID를 얻기 위해 flush
+    await db.flush()  # ID를 얻기 위해 flush
+    
+    # 과거 날짜 입고는 그 날짜 이후 재고 스냅샷 무효화
+    await invalidate_snapshots(db, transaction.transaction_date)
+    
+    # 거래 후 재고 기록 (현재 시각 거래는 새 행만, 과거 날짜 거래는 이후 거래까지 갱신)
+    await refresh_running_balances(db, [transaction.product_id], stock_transaction.created_at, stock_transaction.id)
+    
+    # 일별 입출고 집계 반영
+    rollup_movements = {}
+    add_rollup_movement(rollup_movements, db.bind.dialect.name, transaction_time, transaction.product_id, transaction.supplier_id, stock_transaction.transaction_type, transaction.quantity)
+    await apply_daily_rollups(db, rollup_movements)
+    
+    # LOT별 재고 집계 반영
+    lot_movements = {}
+    add_lot_movement(lot_movements, transaction.product_id, transaction.lot_number, transaction.quantity)
+    expiry_dates = {(transaction.product_id, transaction.lot_number): transaction.expiry_date} if transaction.expiry_date else None
+    await apply_lot_movements(db, lot_movements, received_at=transaction_time, expiry_dates=expiry_dates)
     
     # 선납금 자동 차감 (입고 시)
     if transaction.supplier_id:
         total_amount = product.price * transaction.quantity
-        auto_deduct_prepayment(db, transaction.supplier_id, total_amount, stock_transaction.id, user.id)
-    
-    db.commit()
-    
-    return {"message": "입고가 완료되었습니다"}
+        await settle_prepayment(db, transaction.supplier_id, [(stock_transaction.id, total_amount)], user.id)
+    
+    return {"message": "입고가 완료되었습니다", "stock_quantity": stock_after, "version": version}
+
+# 다중 입출고 거래 기록 (한 번의 INSERT)
+async def insert_bulk_transactions(db: AsyncSession, bulk_data, transaction_type: str, user_id: int) -> list:
+    """다중 입출고 거래 내역을 한 번의 INSERT로 기록하고 항목 순서대로 거래 ID를 반환합니다."""
+    # 서울 시간대 사용
+    transaction_time = bulk_data.transaction_date if bulk_data.transaction_date else get_seoul_time()
+    rows = [
+        {
+            "product_id": item.product_id,
+            "user_id": user_id,
+            "supplier_id": bulk_data.supplier_id,
+            "transaction_type": transaction_type,
+            "quantity": item.quantity,
+            "lot_number": item.lot_number,
+            "expiry_date": item.expiry_date,
+            "location": None,
+            "notes": bulk_data.notes,
+            "created_at": transaction_time
+        }
+        for item in bulk_data.items
+    ]
+    transaction_ids = (await db.scalars(
+        insert(StockTransaction).returning(StockTransaction.id, sort_by_parameter_order=True), rows
+    )).all()
+    
+    # 거래 후 재고 기록 (재고 변경 후 호출되므로 제품 행 잠금 이후 계산)
+    await refresh_running_balances(db, [row["product_id"] for row in rows], transaction_time, min(transaction_ids))
+    
+    # 일별 입출고 집계 반영 (집계 키별로 합쳐 UPSERT 한 번)
+    rollup_movements = {}
+    for row in rows:
+        add_rollup_movement(rollup_movements, db.bind.dialect.name, transaction_time, row["product_id"], row["supplier_id"], transaction_type, row["quantity"])
+    await apply_daily_rollups(db, rollup_movements)
+    return transaction_ids
 
 # 다중 제품 입고 처리
 @app.post("/stock/in/bulk")
-async def process_bulk_stock_in(bulk_data: BulkStockInCreate, access_token: str = Cookie(None), db: Session = Depends(get_db)):
-    user = get_current_user_from_cookie(access_token)
+async def process_bulk_stock_in(bulk_data: BulkStockInCreate, user: Optional[UserIdentity] = Depends(get_cookie_user_read)):
     if not user:
         raise HTTPException(status_code=401, detail="인증이 필요합니다")
     
     if not bulk_data.items:
         raise HTTPException(status_code=400, detail="입고할 제품이 없습니다")
     
-    # 모든 제품의 존재 확인 (중복 제거)
+    return await submit_ledger_write(apply_bulk_stock_in, bulk_data, user)
+
+async def apply_bulk_stock_in(db: AsyncSession, bulk_data: BulkStockInCreate, user: UserIdentity):
+    """다중 입고를 반영합니다. (커밋은 쓰기 묶음 처리기에서)"""
+    # 모든 제품의 존재 확인 (중복 제거, 한 번 조회하여 ID별로 색인)
     product_ids = list(set([item.product_id for item in bulk_data.items]))  # 중복 제거
-    products = db.query(Product).filter(Product.id.in_(product_ids)).all()
+    products_by_id = {product.id: product for product in (await db.scalars(select(Product).where(Product.id.in_(product_ids)))).all()}
     
-    if len(products) != len(product_ids):
+    if len(products_by_id) != len(product_ids):
         raise HTTPException(status_code=404, detail="일부 제품을 찾을 수 없습니다")
     
     # 제품별 입고 수량 집계
@@ -1366,53 +1099,35 @@ async def process_bulk_stock_in(bulk_data: BulkStockInCreate, access_token: str
     duplicate_lots = []
     for (product_id, lot_number), quantities in lot_duplicates.items():
         if len(quantities) > 1:
-            product = next(p for p in products if p.id == product_id)
             total_quantity = sum(quantities)
-            duplicate_lots.append(f"제품 '{product.name}' LOT {lot_number}: {len(quantities)}번 입력, 총 {total_quantity}개")
+            duplicate_lots.append(f"제품 '{products_by_id[product_id].name}' LOT {lot_number}: {len(quantities)}번 입력, 총 {total_quantity}개")
     
-    # 모든 검증이 통과하면 입고 처리
-    transactions = []
-    current_time = get_seoul_time()
-    transaction_time = bulk_data.transaction_date if bulk_data.transaction_date else current_time
+    # 제품별 총 입고량을 UPDATE ... CASE 한 번으로 반영
+    await apply_stock_deltas(db, product_in_totals)
     
-    # 제품별 총 입고량을 먼저 계산하여 재고 업데이트
-    for product_id, total_in_quantity in product_in_totals.items():
-        product = next(p for p in products if p.id == product_id)
-        product.stock_quantity += total_in_quantity
+    # 거래 기록 생성 (한 번의 INSERT)
+    transaction_ids = await insert_bulk_transactions(db, bulk_data, "in", user.id)
     
-    # 각 아이템별로 거래 기록 생성
-    for item in bulk_data.items:
-        # 입고 거래 기록 (서울 시간대 사용)
-        stock_transaction = StockTransaction(
-            product_id=item.product_id,
-            user_id=user.id,
-            supplier_id=bulk_data.supplier_id,
-            transaction_type="in",
-            quantity=item.quantity,
-            lot_number=item.lot_number,
-            location=None,
-            notes=bulk_data.notes,
-            created_at=transaction_time
-        )
-        transactions.append(stock_transaction)
-        db.add(stock_transaction)
+    # 과거 날짜 입고는 그 날짜 이후 재고 스냅샷 무효화
+    await invalidate_snapshots(db, bulk_data.transaction_date)
     
-    db.flush()  # ID를 얻기 위해 flush
+    # LOT별 재고 집계 반영
+    lot_movements = {}
+    expiry_dates = {}
+    for item in bulk_data.items:
+        add_lot_movement(lot_movements, item.product_id, item.lot_number, item.quantity)
+        if item.lot_number and item.expiry_date:
+            lot_key = (item.product_id, item.lot_number)
+            expiry_dates[lot_key] = min(item.expiry_date, expiry_dates.get(lot_key, item.expiry_date))
+    received_at = bulk_data.transaction_date if bulk_data.transaction_date else get_seoul_time()
+    await apply_lot_movements(db, lot_movements, received_at=received_at, expiry_dates=expiry_dates)
     
-    # 선납금 자동 차감 (다중 입고 시)
+    # 선납금 자동 차감 (다중 입고 시 - 거래별 금액을 한 번에 정산)
     if bulk_data.supplier_id:
-        total_amount = 0
-        for item in bulk_data.items:
-            product = next(p for p in products if p.id == item.product_id)
-            total_amount += product.price * item.quantity
-        
-        # 각 거래에 대해 선납금 차감
-        for transaction in transactions:
-            product = next(p for p in products if p.id == transaction.product_id)
-            item_amount = product.price * transaction.quantity
-            auto_deduct_prepayment(db, bulk_data.supplier_id, item_amount, transaction.id, user.id)
-    
-    db.commit()
+        await settle_prepayment(db, bulk_data.supplier_id, [
+            (transaction_id, products_by_id[item.product_id].price * item.quantity)
+            for item, transaction_id in zip(bulk_data.items, transaction_ids)
+        ], user.id)
     
     # 응답 메시지 구성
     message = f"{len(bulk_data.items)}개 제품의 입고가 완료되었습니다"
@@ -1425,43 +1140,35 @@ async def process_bulk_stock_in(bulk_data: BulkStockInCreate, access_token: str
         "duplicate_lots": duplicate_lots if duplicate_lots else None
     }
 
-# 출고 처리
+# 출고 처리 (쓰기 묶음 처리기에서 다른 입출고와 함께 커밋)
 @app.post("/stock/out")
-async def process_stock_out(transaction: StockTransactionCreate, access_token: str = Cookie(None), db: Session = Depends(get_db)):
-    user = get_current_user_from_cookie(access_token)
+async def process_stock_out(transaction: StockTransactionCreate, user: Optional[UserIdentity] = Depends(get_cookie_user_read)):
     if not user:
         raise HTTPException(status_code=401, detail="인증이 필요합니다")
     
-    product = db.query(Product).filter(Product.id == transaction.product_id).first()
-    if not product:
-        raise HTTPException(status_code=404, detail="제품을 찾을 수 없습니다")
-    
     # 수량 유효성 검사
     if transaction.quantity <= 0:
         raise HTTPException(status_code=400, detail="출고 수량은 1 이상이어야 합니다.")
     
-    # 전체 재고 확인
-    if product.stock_quantity < transaction.quantity:
-        raise HTTPException(status_code=400, detail=f"재고가 부족합니다. (현재 재고: {product.stock_quantity}개, 요청 수량: {transaction.quantity}개)")
-    
-    # LOT별 재고 확인 (LOT 번호가 있는 경우)
-    if transaction.lot_number:
-        # 해당 LOT의 입고 수량 계산
-        in_quantity = db.query(func.sum(StockTransaction.quantity)).filter(
-            StockTransaction.product_id == transaction.product_id,
-            StockTransaction.lot_number == transaction.lot_number,
-            StockTransaction.transaction_type == "in"
-        ).scalar() or 0
-        
-        # 해당 LOT의 출고 수량 계산
-        out_quantity = db.query(func.sum(StockTransaction.quantity)).filter(
-            StockTransaction.product_id == transaction.product_id,
-            StockTransaction.lot_number == transaction.lot_number,
-            StockTransaction.transaction_type == "out"
-        ).scalar() or 0
-        
-        # LOT별 현재 재고
-        lot_current_stock = in_quantity - out_quantity
+    return await submit_ledger_write(apply_stock_out, transaction, user)
+
+async def apply_stock_out(db: AsyncSession, transaction: StockTransactionCreate, user: UserIdentity):
+    """출고 한 건을 반영합니다. (커밋은 쓰기 묶음 처리기에서, 실패하면 이 출고만 롤백)"""
+    product = await db.get(Product, transaction.product_id)
+    if not product:
+        raise HTTPException(status_code=404, detail="제품을 찾을 수 없습니다")
+    
+    # 재고 확인과 차감을 하나의 조건부 UPDATE로 처리 (동시 출고 시 초과 출고 방지)
+    stock_result = await change_product_stock(db, transaction.product_id, -transaction.quantity)
+    if not stock_result:
+        current_stock = await get_product_stock(db, transaction.product_id)
+        raise HTTPException(status_code=400, detail=f"재고가 부족합니다. (현재 재고: {current_stock}개, 요청 수량: {transaction.quantity}개)")
+    stock_after, version = stock_result
+    
+    # LOT별 재고 확인 및 차감 (LOT 번호가 있는 경우)
+    if transaction.lot_number and not await take_lot_quantity(db, transaction.product_id, transaction.lot_number, transaction.quantity):
+        lot_key = (transaction.product_id, transaction.lot_number)
+        lot_current_stock = (await get_lot_quantities(db, [lot_key]))[lot_key]
         
         # LOT 재고가 0 이하인 경우
         if lot_current_stock <= 0:
@@ -1471,14 +1178,10 @@ async def process_stock_out(transaction: StockTransactionCreate, access_token: s
             )
         
         # 요청 수량이 LOT 재고를 초과하는 경우
-        if lot_current_stock < transaction.quantity:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"LOT {transaction.lot_number}의 재고가 부족합니다. (LOT 재고: {lot_current_stock}개, 요청 수량: {transaction.quantity}개, 부족 수량: {transaction.quantity - lot_current_stock}개)"
-            )
-    
-    # 재고 수량 감소
-    product.stock_quantity -= transaction.quantity
+        raise HTTPException(
+            status_code=400, 
+            detail=f"LOT {transaction.lot_number}의 재고가 부족합니다. (LOT 재고: {lot_current_stock}개, 요청 수량: {transaction.quantity}개, 부족 수량: {transaction.quantity - lot_current_stock}개)"
+        )
     
     # 출고 거래 기록 (서울 시간대 사용)
     current_time = get_seoul_time()
@@ -1495,21 +1198,29 @@ async def process_stock_out(transaction: StockTransactionCreate, access_token: s
         created_at=transaction_time
     )
     db.add(stock_transaction)
-    db.flush()  # ID를 얻기 위해 flush
+    await db.flush()  # ID를 얻기 위해 flush
+    
+    # 과거 날짜 출고는 그 날짜 이후 재고 스냅샷 무효화
+    await invalidate_snapshots(db, transaction.transaction_date)
+    
+    # 거래 후 재고 기록 (현재 시각 거래는 새 행만, 과거 날짜 거래는 이후 거래까지 갱신)
+    await refresh_running_balances(db, [transaction.product_id], stock_transaction.created_at, stock_transaction.id)
+    
+    # 일별 입출고 집계 반영
+    rollup_movements = {}
+    add_rollup_movement(rollup_movements, db.bind.dialect.name, transaction_time, transaction.product_id, transaction.supplier_id, stock_transaction.transaction_type, transaction.quantity)
+    await apply_daily_rollups(db, rollup_movements)
     
     # 선납금 자동 차감 (출고 시 - 고객으로부터 선납금을 받은 경우)
     if transaction.supplier_id:
         total_amount = product.price * transaction.quantity
-        auto_deduct_prepayment(db, transaction.supplier_id, total_amount, stock_transaction.id, user.id)
-    
-    db.commit()
+        await settle_prepayment(db, transaction.supplier_id, [(stock_transaction.id, total_amount)], user.id)
     
-    return {"message": "출고가 완료되었습니다"}
+    return {"message": "출고가 완료되었습니다", "stock_quantity": stock_after, "version": version}
 
 # 다중 제품 출고 처리
 @app.post("/stock/out/bulk")
-async def process_bulk_stock_out(bulk_data: BulkStockOutCreate, access_token: str = Cookie(None), db: Session = Depends(get_db)):
-    user = get_current_user_from_cookie(access_token)
+async def process_bulk_stock_out(bulk_data: BulkStockOutCreate, user: Optional[UserIdentity] = Depends(get_cookie_user_read)):
     if not user:
         raise HTTPException(status_code=401, detail="인증이 필요합니다")
     
@@ -1521,11 +1232,15 @@ async def process_bulk_stock_out(bulk_data: BulkStockOutCreate, access_token: st
         if item.quantity <= 0:
             raise HTTPException(status_code=400, detail=f"출고 수량은 1 이상이어야 합니다. (제품 ID: {item.product_id})")
     
-    # 모든 제품의 재고 확인 (중복 제거)
+    return await submit_ledger_write(apply_bulk_stock_out, bulk_data, user)
+
+async def apply_bulk_stock_out(db: AsyncSession, bulk_data: BulkStockOutCreate, user: UserIdentity):
+    """다중 출고를 반영합니다. (커밋은 쓰기 묶음 처리기에서, 하나라도 부족하면 이 요청 전체가 롤백)"""
+    # 모든 제품의 존재 확인 (중복 제거, 한 번 조회하여 ID별로 색인)
     product_ids = list(set([item.product_id for item in bulk_data.items]))  # 중복 제거
-    products = db.query(Product).filter(Product.id.in_(product_ids)).all()
+    products_by_id = {product.id: product for product in (await db.scalars(select(Product).where(Product.id.in_(product_ids)))).all()}
     
-    if len(products) != len(product_ids):
+    if len(products_by_id) != len(product_ids):
         raise HTTPException(status_code=404, detail="일부 제품을 찾을 수 없습니다")
     
     # 제품별 출고 수량 집계 (LOT 무관)
@@ -1535,16 +1250,7 @@ async def process_bulk_stock_out(bulk_data: BulkStockOutCreate, access_token: st
             product_out_totals[item.product_id] = 0
         product_out_totals[item.product_id] += item.quantity
     
-    # 전체 재고 확인 (제품별 총 출고량 vs 현재 재고)
-    for product_id, total_out_quantity in product_out_totals.items():
-        product = next(p for p in products if p.id == product_id)
-        if product.stock_quantity < total_out_quantity:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"제품 '{product.name}'의 재고가 부족합니다. (현재 재고: {product.stock_quantity}개, 총 출고 수량: {total_out_quantity}개)"
-            )
-    
-    # LOT별 재고 확인 및 LOT별 출고량 집계
+    # LOT별 출고량 집계
     lot_out_totals = {}  # (product_id, lot_number) -> total_quantity
     for item in bulk_data.items:
         if item.lot_number:
@@ -1553,142 +1259,246 @@ async def process_bulk_stock_out(bulk_data: BulkStockOutCreate, access_token: st
                 lot_out_totals[lot_key] = 0
             lot_out_totals[lot_key] += item.quantity
     
-    # 각 LOT별 재고 확인
-    for (product_id, lot_number), total_lot_out in lot_out_totals.items():
-        # 해당 LOT의 입고 수량 계산
-        in_quantity = db.query(func.sum(StockTransaction.quantity)).filter(
-            StockTransaction.product_id == product_id,
-            StockTransaction.lot_number == lot_number,
-            StockTransaction.transaction_type == "in"
-        ).scalar() or 0
-        
-        # 해당 LOT의 출고 수량 계산
-        out_quantity = db.query(func.sum(StockTransaction.quantity)).filter(
-            StockTransaction.product_id == product_id,
-            StockTransaction.lot_number == lot_number,
-            StockTransaction.transaction_type == "out"
-        ).scalar() or 0
+    # 전체 재고 확인 및 차감 (제품별 총 출고량, 조건부 UPDATE ... CASE 한 번)
+    # 하나라도 부족하면 예외로 트랜잭션 전체가 롤백됨
+    updated_products = await apply_stock_deltas(db, {product_id: -quantity for product_id, quantity in product_out_totals.items()})
+    for product_id, total_out_quantity in product_out_totals.items():
+        if product_id not in updated_products:
+            current_stock = await get_product_stock(db, product_id)
+            raise HTTPException(
+                status_code=400, 
+                detail=f"제품 '{products_by_id[product_id].name}'의 재고가 부족합니다. (현재 재고: {current_stock}개, 총 출고 수량: {total_out_quantity}개)"
+            )
+    
+    # 각 LOT별 재고 확인 및 차감 (조건부 UPDATE ... CASE 한 번, 부족한 LOT은 한 번에 조회하여 안내)
+    taken_lots = await take_lot_quantities(db, lot_out_totals)
+    short_lots = [lot_key for lot_key in lot_out_totals if lot_key not in taken_lots]
+    if short_lots:
+        lot_quantities = await get_lot_quantities(db, short_lots)
+        product_id, lot_number = short_lots[0]
+        total_lot_out = lot_out_totals[(product_id, lot_number)]
         
         # LOT별 현재 재고
-        lot_current_stock = in_quantity - out_quantity
+        lot_current_stock = lot_quantities[(product_id, lot_number)]
         
         # LOT 재고가 0 이하인 경우
         if lot_current_stock <= 0:
-            product = next(p for p in products if p.id == product_id)
             raise HTTPException(
                 status_code=400, 
-                detail=f"제품 '{product.name}' LOT {lot_number}의 재고가 없습니다. (LOT 재고: {lot_current_stock}개)"
+                detail=f"제품 '{products_by_id[product_id].name}' LOT {lot_number}의 재고가 없습니다. (LOT 재고: {lot_current_stock}개)"
             )
         
         # 요청 수량이 LOT 재고를 초과하는 경우
-        if lot_current_stock < total_lot_out:
-            product = next(p for p in products if p.id == product_id)
-            raise HTTPException(
-                status_code=400, 
-                detail=f"제품 '{product.name}' LOT {lot_number}의 재고가 부족합니다. (LOT 재고: {lot_current_stock}개, 총 출고 수량: {total_lot_out}개, 부족 수량: {total_lot_out - lot_current_stock}개)"
-            )
-    
-    # 모든 검증이 통과하면 출고 처리
-    transactions = []
-    current_time = get_seoul_time()
-    transaction_time = bulk_data.transaction_date if bulk_data.transaction_date else current_time
-    
-    # 제품별 총 출고량을 먼저 계산하여 재고 업데이트
-    for product_id, total_out_quantity in product_out_totals.items():
-        product = next(p for p in products if p.id == product_id)
-        product.stock_quantity -= total_out_quantity
-    
-    # 각 아이템별로 거래 기록 생성
-    for item in bulk_data.items:
-        # 출고 거래 기록 (서울 시간대 사용)
-        stock_transaction = StockTransaction(
-            product_id=item.product_id,
-            user_id=user.id,
-            supplier_id=bulk_data.supplier_id,
-            transaction_type="out",
-            quantity=item.quantity,
-            lot_number=item.lot_number,
-            location=None,
-            notes=bulk_data.notes,
-            created_at=transaction_time
+        raise HTTPException(
+            status_code=400, 
+            detail=f"제품 '{products_by_id[product_id].name}' LOT {lot_number}의 재고가 부족합니다. (LOT 재고: {lot_current_stock}개, 총 출고 수량: {total_lot_out}개, 부족 수량: {total_lot_out - lot_current_stock}개)"
         )
-        transactions.append(stock_transaction)
-        db.add(stock_transaction)
     
-    db.flush()  # ID를 얻기 위해 flush
+    # 모든 검증이 통과하면 출고 거래 기록 생성 (한 번의 INSERT)
+    transaction_ids = await insert_bulk_transactions(db, bulk_data, "out", user.id)
     
-    # 선납금 자동 차감 (다중 출고 시)
-    if bulk_data.supplier_id:
-        # 각 거래에 대해 선납금 차감
-        for transaction in transactions:
-            product = next(p for p in products if p.id == transaction.product_id)
-            item_amount = product.price * transaction.quantity
-            auto_deduct_prepayment(db, bulk_data.supplier_id, item_amount, transaction.id, user.id)
+    # 과거 날짜 출고는 그 날짜 이후 재고 스냅샷 무효화
+    await invalidate_snapshots(db, bulk_data.transaction_date)
     
-    db.commit()
+    # 선납금 자동 차감 (다중 출고 시 - 거래별 금액을 한 번에 정산)
+    if bulk_data.supplier_id:
+        await settle_prepayment(db, bulk_data.supplier_id, [
+            (transaction_id, products_by_id[item.product_id].price * item.quantity)
+            for item, transaction_id in zip(bulk_data.items, transaction_ids)
+        ], user.id)
     
     return {
         "message": f"{len(bulk_data.items)}개 제품의 출고가 완료되었습니다",
         "processed_items": len(bulk_data.items)
     }
 
+# LOT 자동 배정 출고 (FIFO: 먼저 입고된 LOT부터, FEFO: 유통기한이 빠른 LOT부터)
+@app.post("/stock/out/auto")
+async def process_auto_stock_out(auto_data: AutoStockOutCreate, user: Optional[UserIdentity] = Depends(get_cookie_user_read)):
+    if not user:
+        raise HTTPException(status_code=401, detail="인증이 필요합니다")
+    
+    if not auto_data.items:
+        raise HTTPException(status_code=400, detail="출고할 제품이 없습니다")
+    
+    if auto_data.strategy not in LOT_ALLOCATION_ORDERS:
+        raise HTTPException(status_code=400, detail=f"지원하지 않는 LOT 배정 방식입니다: {auto_data.strategy} (fifo 또는 fefo)")
+    
+    # 수량 유효성 검사
+    for item in auto_data.items:
+        if item.quantity <= 0:
+            raise HTTPException(status_code=400, detail=f"출고 수량은 1 이상이어야 합니다. (제품 ID: {item.product_id})")
+    
+    return await submit_ledger_write(apply_auto_stock_out, auto_data, user)
+
+async def apply_auto_stock_out(db: AsyncSession, auto_data: AutoStockOutCreate, user: UserIdentity):
+    """LOT을 자동 배정하여 LOT별 출고 라인으로 나눠 다중 출고로 반영합니다. (배정과 출고가 같은 SAVEPOINT에서 처리)"""
+    # 제품별 출고 수량 집계 (요청 순서 유지)
+    product_out_totals = {}
+    for item in auto_data.items:
+        product_out_totals[item.product_id] = product_out_totals.get(item.product_id, 0) + item.quantity
+    
+    products_by_id = {product.id: product for product in (await db.scalars(select(Product).where(Product.id.in_(list(product_out_totals))))).all()}
+    if len(products_by_id) != len(product_out_totals):
+        raise HTTPException(status_code=404, detail="일부 제품을 찾을 수 없습니다")
+    
+    # 재고가 남은 LOT을 우선순위대로 배정 (한 번의 조회)
+    allocations, available = await allocate_lots(db, product_out_totals, auto_data.strategy)
+    for product_id, total_out_quantity in product_out_totals.items():
+        if available[product_id] < total_out_quantity:
+            raise HTTPException(
+                status_code=400, 
+                detail=f"제품 '{products_by_id[product_id].name}'의 LOT 재고가 부족합니다. (LOT 재고 합계: {available[product_id]}개, 총 출고 수량: {total_out_quantity}개)"
+            )
+    
+    # 배정 결과를 LOT별 출고 라인으로 만들어 다중 출고와 같은 경로로 처리 (재고/LOT 차감, 거래 기록, 선납금 정산)
+    bulk_data = BulkStockOutCreate(
+        items=[
+            BulkStockItem(product_id=product_id, quantity=quantity, lot_number=lot_number)
+            for product_id, lots in allocations.items()
+            for lot_number, quantity in lots
+        ],
+        supplier_id=auto_data.supplier_id,
+        notes=auto_data.notes,
+        transaction_date=auto_data.transaction_date
+    )
+    await apply_bulk_stock_out(db, bulk_data, user)
+    
+    return {
+        "message": f"{len(product_out_totals)}개 제품을 LOT {len(bulk_data.items)}건으로 나눠 출고했습니다",
+        "strategy": auto_data.strategy,
+        "processed_items": len(bulk_data.items),
+        "allocations": [
+            {"product_id": item.product_id, "product_name": products_by_id[item.product_id].name, "lot_number": item.lot_number, "quantity": item.quantity}
+            for item in bulk_data.items
+        ]
+    }
+
 # 제품별 LOT 목록 조회 API
 @app.get("/api/products/{product_id}/lots")
-async def get_product_lots(product_id: int, access_token: str = Cookie(None), db: Session = Depends(get_db)):
-    user = get_current_user_from_cookie(access_token)
+async def get_product_lots(product_id: int, user: Optional[UserIdentity] = Depends(get_cookie_user_read), db: AsyncSession = Depends(get_read_db)):
     if not user:
         raise HTTPException(status_code=401, detail="인증이 필요합니다")
     
     # 제품 존재 확인
-    product = db.query(Product).filter(Product.id == product_id).first()
+    product = await db.get(Product, product_id)
     if not product:
         raise HTTPException(status_code=404, detail="제품을 찾을 수 없습니다")
     
-    # 입고 거래에서 LOT별 재고 계산
-    lot_stocks = {}
-    
-    # 입고 거래 조회
-    in_transactions = db.query(StockTransaction).filter(
-        StockTransaction.product_id == product_id,
-        StockTransaction.transaction_type == "in",
-        StockTransaction.lot_number.isnot(None)
-    ).all()
-    
-    # 출고 거래 조회
-    out_transactions = db.query(StockTransaction).filter(
-        StockTransaction.product_id == product_id,
-        StockTransaction.transaction_type == "out",
-        StockTransaction.lot_number.isnot(None)
-    ).all()
-    
-    # LOT별 입고 수량 계산
-    for transaction in in_transactions:
-        lot_number = transaction.lot_number
-        if lot_number not in lot_stocks:
-            lot_stocks[lot_number] = 0
-        lot_stocks[lot_number] += transaction.quantity
-    
-    # LOT별 출고 수량 계산
-    for transaction in out_transactions:
-        lot_number = transaction.lot_number
-        if lot_number in lot_stocks:
-            lot_stocks[lot_number] -= transaction.quantity
-    
-    # 재고가 있는 LOT만 반환
-    available_lots = []
-    for lot_number, quantity in lot_stocks.items():
-        if quantity > 0:
-            available_lots.append({
-                "lot_number": lot_number,
-                "quantity": quantity
-            })
+    # 재고가 있는 LOT만 반환 (lot_balances, 처음 기록된 순서)
+    rows = await db.execute(select(LotBalance.lot_number, LotBalance.quantity, LotBalance.expiry_date).where(
+        LotBalance.product_id == product_id,
+        LotBalance.quantity > 0
+    ).order_by(LotBalance.id))
+    available_lots = [
+        {"lot_number": lot_number, "quantity": quantity, "expiry_date": expiry_date.isoformat() if expiry_date else None}
+        for lot_number, quantity, expiry_date in rows
+    ]
     
     return available_lots
 
+# 재고 카드 조회 API (거래 순서대로 거래 후 재고 포함, 커서 기반 페이지)
+@app.get("/api/products/{product_id}/stock-card")
+async def get_stock_card(
+    product_id: int,
+    lot_number: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = 50,
+    user: Optional[UserIdentity] = Depends(get_cookie_user_read),
+    db: AsyncSession = Depends(get_read_db)
+):
+    if not user:
+        raise HTTPException(status_code=401, detail="인증이 필요합니다")
+    
+    product = await db.get(Product, product_id)
+    if not product:
+        raise HTTPException(status_code=404, detail="제품을 찾을 수 없습니다")
+    
+    limit = max(1, min(limit, 500))
+    # LOT 재고 카드는 LOT 누적 재고, 제품 재고 카드는 제품 누적 재고
+    balance_column = StockTransaction.lot_balance_after if lot_number else StockTransaction.balance_after
+    scope = [StockTransaction.product_id == product_id]
+    if lot_number:
+        scope.append(StockTransaction.lot_number == lot_number)
+    conditions = list(scope)
+    
+    # 날짜 범위 (서울 시간대, 종료일 포함)
+    try:
+        if date_from:
+            conditions.append(StockTransaction.created_at >= parse_date_with_timezone(date_from))
+        range_end = parse_date_with_timezone(date_to) + timedelta(days=1) if date_to else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if range_end:
+        conditions.append(StockTransaction.created_at < range_end)
+    
+    # 이전 페이지 마지막 거래 이후부터 (제품/LOT별 거래 순서 인덱스 범위 검색)
+    if cursor:
+        try:
+            cursor_key = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="잘못된 페이지 커서입니다")
+        conditions.append(keyset_after(StockTransaction.created_at, StockTransaction.id, cursor_key))
+    
+    rows = (await db.execute(select(
+        StockTransaction.id,
+        StockTransaction.created_at,
+        StockTransaction.transaction_type,
+        StockTransaction.quantity,
+        StockTransaction.lot_number,
+        StockTransaction.notes,
+        balance_column,
+        Supplier.name,
+        User.full_name
+    ).join(User, StockTransaction.user_id == User.id).outerjoin(Supplier, StockTransaction.supplier_id == Supplier.id).where(
+        *conditions
+    ).order_by(StockTransaction.created_at, StockTransaction.id).limit(limit + 1))).all()
+    
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    entries = [
+        {
+            "id": transaction_id,
+            "created_at": created_at.isoformat() if created_at else None,
+            "transaction_type": transaction_type,
+            "quantity": quantity,
+            "lot_number": row_lot_number,
+            "notes": notes,
+            "balance_after": balance_after,
+            "supplier_name": supplier_name,
+            "user_name": user_name
+        }
+        for transaction_id, created_at, transaction_type, quantity, row_lot_number, notes, balance_after, supplier_name, user_name in rows
+    ]
+    
+    if entries:
+        # 기초 재고는 첫 거래의 거래 후 재고에서 그 거래 수량을 되돌린 값
+        first = entries[0]
+        opening_balance = (first["balance_after"] or 0) - lot_delta(first["transaction_type"], first["quantity"])
+        closing_balance = entries[-1]["balance_after"]
+    else:
+        # 범위 안에 거래가 없으면 범위 끝 이전 마지막 거래의 재고 (인덱스 역방향 검색 한 번)
+        previous_conditions = scope + [StockTransaction.created_at < range_end] if range_end else scope
+        opening_balance = closing_balance = await db.scalar(select(balance_column).where(*previous_conditions).order_by(
+            StockTransaction.created_at.desc(), StockTransaction.id.desc()
+        ).limit(1)) or 0
+    
+    last_row = rows[-1] if rows else None
+    return {
+        "product_id": product.id,
+        "product_name": product.name,
+        "lot_number": lot_number,
+        "opening_balance": opening_balance,
+        "closing_balance": closing_balance,
+        "entries": entries,
+        "next_cursor": encode_cursor(last_row[1], last_row[0]) if has_more else None
+    }
+
 # 거래처 관리 페이지
 @app.get("/suppliers", response_class=HTMLResponse)
-async def suppliers_page(request: Request, access_token: str = Cookie(None)):
-    user = get_current_user_from_cookie(access_token)
+async def suppliers_page(request: Request, user: Optional[UserIdentity] = Depends(get_cookie_user_read)):
     if not user:
         return RedirectResponse(url="/login", status_code=302)
     
@@ -1699,8 +1509,7 @@ async def suppliers_page(request: Request, access_token: str = Cookie(None)):
 
 # 장부 페이지
 @app.get("/ledger", response_class=HTMLResponse)
-async def ledger_page(request: Request, access_token: str = Cookie(None)):
-    user = get_current_user_from_cookie(access_token)
+async def ledger_page(request: Request, user: Optional[UserIdentity] = Depends(get_cookie_user_read)):
     if not user:
         return RedirectResponse(url="/login", status_code=302)
     
@@ -1711,15 +1520,14 @@ async def ledger_page(request: Request, access_token: str = Cookie(None)):
 
 # 거래처 목록 조회 API
 @app.get("/api/suppliers")
-async def get_suppliers(access_token: str = Cookie(None), db: Session = Depends(get_db)):
-    user = get_current_user_from_cookie(access_token)
+async def get_suppliers(user: Optional[UserIdentity] = Depends(get_cookie_user_read), db: AsyncSession = Depends(get_read_db)):
     if not user:
         raise HTTPException(status_code=401, detail="인증이 필요합니다")
     
     try:
         # 테이블 존재 여부 확인
-        db.execute(text("SELECT 1 FROM suppliers LIMIT 1"))
-        suppliers = db.query(Supplier).order_by(Supplier.supplier_type.asc(), Supplier.sort_order.asc(), Supplier.name.asc()).all()
+        await db.execute(text("SELECT 1 FROM suppliers LIMIT 1"))
+        suppliers = (await db.scalars(select(Supplier).order_by(Supplier.supplier_type.asc(), Supplier.sort_order.asc(), Supplier.name.asc()))).all()
         return {
             "suppliers": [
                 {
@@ -1741,7 +1549,8 @@ async def get_suppliers(access_token: str = Cookie(None), db: Session = Depends(
         print(f"DEBUG: suppliers 테이블 조회 중 오류: {e}")
         # 테이블이 없으면 생성 시도
         try:
-            Base.metadata.create_all(bind=engine)
+            async with async_write_engine.begin() as connection:
+                await connection.run_sync(Base.metadata.create_all)
             print("suppliers 테이블을 생성했습니다.")
             return {"suppliers": []}
         except Exception as create_error:
@@ -1750,13 +1559,12 @@ async def get_suppliers(access_token: str = Cookie(None), db: Session = Depends(
 
 # 거래처 추가 API
 @app.post("/api/suppliers")
-async def create_supplier(supplier: SupplierCreate, access_token: str = Cookie(None), db: Session = Depends(get_db)):
-    user = get_current_user_from_cookie(access_token)
+async def create_supplier(supplier: SupplierCreate, user: Optional[UserIdentity] = Depends(get_cookie_user_write), db: AsyncSession = Depends(get_write_db)):
     if not user:
         raise HTTPException(status_code=401, detail="인증이 필요합니다")
     
     # 거래처명 중복 확인
-    existing_supplier = db.query(Supplier).filter(Supplier.name == supplier.name).first()
+    existing_supplier = await db.scalar(select(Supplier).where(Supplier.name == supplier.name))
     if existing_supplier:
         raise HTTPException(status_code=400, detail="이미 존재하는 거래처명입니다")
     
@@ -1769,15 +1577,14 @@ async def create_supplier(supplier: SupplierCreate, access_token: str = Cookie(N
         supplier_type=supplier.supplier_type
     )
     db.add(db_supplier)
-    db.commit()
-    db.refresh(db_supplier)
+    await db.commit()
+    await db.refresh(db_supplier)
     
     return {"message": "거래처가 추가되었습니다", "supplier": db_supplier}
 
 # 거래처 정렬 순서 업데이트 API (더 구체적인 경로를 먼저 정의)
 @app.put("/api/suppliers/update-sort-order")
-async def update_supplier_sort_order(request: Request, access_token: str = Cookie(None), db: Session = Depends(get_db)):
-    user = get_current_user_from_cookie(access_token)
+async def update_supplier_sort_order(request: Request, user: Optional[UserIdentity] = Depends(get_cookie_user_write), db: AsyncSession = Depends(get_write_db)):
     if not user:
         raise HTTPException(status_code=401, detail="인증이 필요합니다")
     
@@ -1789,32 +1596,31 @@ async def update_supplier_sort_order(request: Request, access_token: str = Cooki
         sort_orders = body.get("sort_orders", {})
         
         for supplier_id, sort_order in sort_orders.items():
-            db_supplier = db.query(Supplier).filter(Supplier.id == int(supplier_id)).first()
+            db_supplier = await db.get(Supplier, int(supplier_id))
             if db_supplier:
                 db_supplier.sort_order = int(sort_order)
         
-        db.commit()
+        await db.commit()
         return {"message": "거래처 정렬 순서가 업데이트되었습니다"}
     
     except Exception as e:
         print(f"Error in sort order update: {str(e)}")
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail=f"정렬 순서 업데이트 중 오류가 발생했습니다: {str(e)}")
 
 # 거래처 수정 API
 @app.put("/api/suppliers/{supplier_id}")
-async def update_supplier(supplier_id: int, supplier_update: SupplierUpdate, access_token: str = Cookie(None), db: Session = Depends(get_db)):
-    user = get_current_user_from_cookie(access_token)
+async def update_supplier(supplier_id: int, supplier_update: SupplierUpdate, user: Optional[UserIdentity] = Depends(get_cookie_user_write), db: AsyncSession = Depends(get_write_db)):
     if not user:
         raise HTTPException(status_code=401, detail="인증이 필요합니다")
     
-    db_supplier = db.query(Supplier).filter(Supplier.id == supplier_id).first()
+    db_supplier = await db.get(Supplier, supplier_id)
     if not db_supplier:
         raise HTTPException(status_code=404, detail="거래처를 찾을 수 없습니다")
     
     # 거래처명 중복 확인 (자기 자신 제외)
     if supplier_update.name and supplier_update.name != db_supplier.name:
-        existing_supplier = db.query(Supplier).filter(Supplier.name == supplier_update.name).first()
+        existing_supplier = await db.scalar(select(Supplier).where(Supplier.name == supplier_update.name))
         if existing_supplier:
             raise HTTPException(status_code=400, detail="이미 존재하는 거래처명입니다")
     
@@ -1823,36 +1629,41 @@ async def update_supplier(supplier_id: int, supplier_update: SupplierUpdate, acc
     for field, value in update_data.items():
         setattr(db_supplier, field, value)
     
-    db.commit()
-    db.refresh(db_supplier)
+    await db.commit()
+    await db.refresh(db_supplier)
     
     return {"message": "거래처가 수정되었습니다", "supplier": db_supplier}
 
 # 거래처 삭제 API
 @app.delete("/api/suppliers/{supplier_id}")
-async def delete_supplier(supplier_id: int, access_token: str = Cookie(None), db: Session = Depends(get_db)):
-    user = get_current_user_from_cookie(access_token)
+async def delete_supplier(supplier_id: int, user: Optional[UserIdentity] = Depends(get_cookie_user_write), db: AsyncSession = Depends(get_write_db)):
     if not user:
         raise HTTPException(status_code=401, detail="인증이 필요합니다")
     
-    db_supplier = db.query(Supplier).filter(Supplier.id == supplier_id).first()
+    db_supplier = await db.get(Supplier, supplier_id)
     if not db_supplier:
         raise HTTPException(status_code=404, detail="거래처를 찾을 수 없습니다")
     
     # 거래 내역이 있는지 확인
-    transaction_count = db.query(StockTransaction).filter(StockTransaction.supplier_id == supplier_id).count()
+    transaction_count = await db.scalar(select(func.count(StockTransaction.id)).where(StockTransaction.supplier_id == supplier_id))
     if transaction_count > 0:
         raise HTTPException(status_code=400, detail="거래 내역이 있는 거래처는 삭제할 수 없습니다. 비활성화를 사용하세요.")
     
-    db.delete(db_supplier)
-    db.commit()
+    # ORM delete는 stock_transactions 컬렉션을 지연 로딩하므로 직접 DELETE 실행
+    await db.execute(delete(Supplier).where(Supplier.id == supplier_id))
+    await db.commit()
     
     return {"message": "거래처가 삭제되었습니다"}
 
-# 재고 수량 동기화 API (거래 내역 기반으로 재계산)
+# 재고 수량 동기화 API (거래 내역 합계와 비교, 다른 제품만 재계산)
+# dry_run: 불일치만 보고, incremental: 마지막 검증 이후 변경된 제품만 검사
 @app.post("/api/admin/sync-stock-quantities")
-async def sync_stock_quantities(access_token: str = Cookie(None), db: Session = Depends(get_db)):
-    user = get_current_user_from_cookie(access_token)
+async def sync_stock_quantities(
+    dry_run: bool = False,
+    incremental: bool = False,
+    user: Optional[UserIdentity] = Depends(get_cookie_user_read),
+    db: AsyncSession = Depends(get_read_db)
+):
     if not user:
         raise HTTPException(status_code=401, detail="인증이 필요합니다")
     
@@ -1860,77 +1671,181 @@ async def sync_stock_quantities(access_token: str = Cookie(None), db: Session =
     if not user.is_admin:
         raise HTTPException(status_code=403, detail="관리자 권한이 필요합니다")
     
-    try:
-        # 모든 제품 조회
-        products = db.query(Product).all()
-        sync_results = []
+    import json
+    
+    async def stream_results():
+        # 불일치 제품을 읽는 대로 내보내고 요약은 마지막에 추가 (응답 전체는 하나의 JSON 객체)
+        summary = {}
+        yield '{"sync_results": ['
+        separator = ""
+        try:
+            async for row in reconcile_stock(db, write_coordinator.submit, summary, dry_run, incremental):
+                yield separator + json.dumps(row, ensure_ascii=False)
+                separator = ","
+        except Exception as e:
+            print(f"재고 동기화 오류: {e}")
+            yield '], "error": ' + json.dumps(f"재고 동기화 중 오류가 발생했습니다: {str(e)}", ensure_ascii=False) + '}'
+            return
         
-        for product in products:
-            # 해당 제품의 모든 거래 내역 조회
-            transactions = db.query(StockTransaction).filter(
-                StockTransaction.product_id == product.id
-            ).all()
-            
-            # 거래 내역 기반으로 재고 수량 계산
-            calculated_stock = 0
-            for transaction in transactions:
-                if transaction.transaction_type == "in":
-                    calculated_stock += transaction.quantity
-                elif transaction.transaction_type == "out":
-                    calculated_stock -= transaction.quantity
-            
-            # 기존 재고와 계산된 재고 비교
-            old_stock = product.stock_quantity
-            product.stock_quantity = calculated_stock
-            
-            sync_results.append({
+        scope = "변경된 " if summary["mode"] == "incremental" else ""
+        if dry_run:
+            message = f"{scope}{summary['checked_count']}개 제품 중 {summary['drift_count']}개 제품의 재고가 거래 내역과 다릅니다"
+        else:
+            message = f"{scope}{summary['checked_count']}개 제품을 확인하여 {summary['fixed_count']}개 제품의 재고 수량이 동기화되었습니다"
+        print(f"재고 동기화 ({summary['mode']}, 보고만: {dry_run}): 검사 {summary['checked_count']}, 불일치 {summary['drift_count']}, 수정 {summary['fixed_count']}")
+        yield '], ' + json.dumps(dict(summary, message=message), ensure_ascii=False)[1:]
+    
+    return StreamingResponse(stream_results(), media_type="application/json")
+
+# LOT별 재고 집계 재생성 API (관리자용)
+@app.post("/api/admin/rebuild-lot-balances")
+async def rebuild_lot_balances_api(user: Optional[UserIdentity] = Depends(get_cookie_user_read)):
+    if not user:
+        raise HTTPException(status_code=401, detail="인증이 필요합니다")
+
+    # 관리자 권한 확인
+    if not user.is_admin:
+        raise HTTPException(status_code=403, detail="관리자 권한이 필요합니다")
+
+    try:
+        # 입출고와 같은 쓰기 연결에서 실행하여 재생성 중 재고 이동과 섞이지 않도록 함
+        async with async_write_engine.begin() as connection:
+            count = await connection.run_sync(rebuild_lot_balances)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"LOT 재고 집계 재생성 중 오류가 발생했습니다: {str(e)}")
+
+    return {"message": f"{count}개 LOT의 재고 집계가 재생성되었습니다", "lot_count": count}
+
+# 특정 날짜 마감 재고 조회 API (가장 가까운 스냅샷 + 이후 거래)
+@app.get("/api/inventory/as-of")
+async def get_inventory_as_of(
+    date: str,
+    product_id: Optional[int] = None,
+    user: Optional[UserIdentity] = Depends(get_cookie_user_read),
+    db: AsyncSession = Depends(get_read_db)
+):
+    if not user:
+        raise HTTPException(status_code=401, detail="인증이 필요합니다")
+    
+    try:
+        as_of = datetime.strptime(date, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"잘못된 날짜 형식입니다: {date} (YYYY-MM-DD)")
+    
+    snapshot_date, rows = await get_balances_as_of(db, as_of, product_id)
+    
+    # 제품별로 묶기 (LOT 번호가 빈 문자열이면 제품 전체 재고)
+    balances = {}
+    for row_product_id, lot_number, quantity in rows:
+        balance = balances.setdefault(row_product_id, {"quantity": 0, "lots": []})
+        if lot_number:
+            balance["lots"].append({"lot_number": lot_number, "quantity": quantity})
+        else:
+            balance["quantity"] = quantity
+    
+    products = (await db.execute(select(Product.id, Product.name, Product.category).where(
+        Product.id.in_(list(balances))
+    ).order_by(Product.category, Product.sort_order, Product.name))).all()
+    
+    return {
+        "date": as_of.isoformat(),
+        "snapshot_date": snapshot_date.isoformat() if snapshot_date else None,
+        "products": [
+            {
                 "product_id": product.id,
                 "product_name": product.name,
-                "old_stock": old_stock,
-                "new_stock": calculated_stock,
-                "difference": calculated_stock - old_stock
-            })
-        
-        # 데이터베이스 커밋
-        db.commit()
+                "category": product.category,
+                "quantity": balances[product.id]["quantity"],
+                "lots": sorted(balances[product.id]["lots"], key=lambda lot: lot["lot_number"])
+            }
+            for product in products
+        ],
+        "total_quantity": sum(balance["quantity"] for balance in balances.values())
+    }
+
+# 재고 스냅샷 목록 조회 API
+@app.get("/api/inventory/snapshots")
+async def get_inventory_snapshots(user: Optional[UserIdentity] = Depends(get_cookie_user_read), db: AsyncSession = Depends(get_read_db)):
+    if not user:
+        raise HTTPException(status_code=401, detail="인증이 필요합니다")
+    
+    snapshots = (await db.scalars(select(InventorySnapshot).order_by(InventorySnapshot.snapshot_date.desc()))).all()
+    return {
+        "interval": INVENTORY_SNAPSHOT_INTERVAL,
+        "snapshots": [
+            {
+                "snapshot_date": snapshot.snapshot_date.isoformat(),
+                "line_count": snapshot.line_count,
+                "created_at": snapshot.created_at.isoformat() if snapshot.created_at else None
+            }
+            for snapshot in snapshots
+        ]
+    }
+
+# 재고 스냅샷 생성 API (관리자, 날짜를 지정하지 않으면 주기에 맞춰 누락된 스냅샷 생성)
+@app.post("/api/admin/inventory-snapshots")
+async def create_inventory_snapshots(
+    date: Optional[str] = None,
+    interval: Optional[str] = None,
+    user: Optional[UserIdentity] = Depends(get_cookie_user_read)
+):
+    if not user:
+        raise HTTPException(status_code=401, detail="인증이 필요합니다")
+    
+    # 관리자 권한 확인
+    if not user.is_admin:
+        raise HTTPException(status_code=403, detail="관리자 권한이 필요합니다")
+    
+    if date:
+        try:
+            snapshot_date = datetime.strptime(date, "%Y-%m-%d").date()
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"잘못된 날짜 형식입니다: {date} (YYYY-MM-DD)")
+        if snapshot_date >= get_kst_today():
+            raise HTTPException(status_code=400, detail="오늘 이후 날짜는 마감되지 않아 스냅샷을 만들 수 없습니다")
         
-        return {
-            "message": f"{len(products)}개 제품의 재고 수량이 동기화되었습니다",
-            "sync_results": sync_results
-        }
+        def create_one():
+            with engine.begin() as connection:
+                return take_snapshot(connection, snapshot_date)
         
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"재고 동기화 중 오류가 발생했습니다: {str(e)}")
+        line_count = await run_in_threadpool(create_one)
+        if line_count < 0:
+            return {"message": f"{snapshot_date} 스냅샷이 이미 있습니다", "created": []}
+        return {"message": f"{snapshot_date} 스냅샷이 생성되었습니다 ({line_count}건)", "created": [snapshot_date.isoformat()]}
+    
+    interval = interval or INVENTORY_SNAPSHOT_INTERVAL
+    if interval not in SNAPSHOT_INTERVALS or interval == "off":
+        raise HTTPException(status_code=400, detail=f"지원하지 않는 스냅샷 주기입니다: {interval} (daily 또는 monthly)")
+    
+    created = await run_in_threadpool(take_due_snapshots, engine, interval)
+    return {"message": f"재고 스냅샷 {len(created)}건이 생성되었습니다", "created": [snapshot_date.isoformat() for snapshot_date in created]}
 
 # 안전 재고 설정 API
 @app.put("/api/products/{product_id}/safety-stock")
 async def update_safety_stock(
     product_id: int, 
     safety_stock_data: dict, 
-    access_token: str = Cookie(None), 
-    db: Session = Depends(get_db)
+    user: Optional[UserIdentity] = Depends(get_cookie_user_write), 
+    db: AsyncSession = Depends(get_write_db)
 ):
-    user = get_current_user_from_cookie(access_token)
     if not user:
         raise HTTPException(status_code=401, detail="인증이 필요합니다")
     
-    product = db.query(Product).filter(Product.id == product_id).first()
+    product = await db.get(Product, product_id)
     if not product:
         raise HTTPException(status_code=404, detail="제품을 찾을 수 없습니다")
     
     # 안전재고 수량만 설정 (단계는 변경하지 않음)
     product.safety_stock = safety_stock_data.get('safety_stock', 0)
     
-    db.commit()
-    db.refresh(product)
+    await db.commit()
+    await db.refresh(product)
     
     return {"message": "안전 재고가 설정되었습니다", "product": product}
 
 # 안전 재고 알림 조회 API
 @app.get("/api/safety-stock-alerts")
-async def get_safety_stock_alerts(access_token: str = Cookie(None), db: Session = Depends(get_db)):
-    user = get_current_user_from_cookie(access_token)
+async def get_safety_stock_alerts(user: Optional[UserIdentity] = Depends(get_cookie_user), db: Session = Depends(get_db)):
     if not user:
         raise HTTPException(status_code=401, detail="인증이 필요합니다")
     
@@ -1959,9 +1874,8 @@ async def get_safety_stock_alerts(access_token: str = Cookie(None), db: Session
         "total_alerts": len(critical_products) + len(warning_products)
     }
 
-# 필터링된 거래 내역 조회 API
-@app.get("/api/transactions/filtered")
-async def get_filtered_transactions(
+async def build_transaction_filters(
+    db: AsyncSession,
     date_from: Optional[str] = None,
     date_to: Optional[str] = None,
     supplier_id: Optional[int] = None,
@@ -1970,131 +1884,301 @@ async def get_filtered_transactions(
     product_search: Optional[str] = None,
     category: Optional[str] = None,
     lot_number: Optional[str] = None,
-    page: int = 1,
-    per_page: int = 20,
-    access_token: str = Cookie(None),
-    db: Session = Depends(get_db)
+    notes_search: Optional[str] = None
 ):
-    user = get_current_user_from_cookie(access_token)
-    if not user:
-        raise HTTPException(status_code=401, detail="인증이 필요합니다")
-    
-    # 기본 쿼리 (관계 포함)
-    query = db.query(StockTransaction).join(Product).join(User).outerjoin(Supplier)
+    """거래 내역 필터 조건 목록, 제품 조인 필요 여부, 일별 집계 조건 목록(날짜 단위 필터가 아니면 None)을 반환합니다. (날짜 형식 오류는 400)"""
+    conditions = []
+    rollup_conditions = []
     
     # 날짜 필터 (서울 시간대 사용)
-    if date_from:
-        try:
+    try:
+        if date_from:
             from_date = parse_date_with_timezone(date_from)
-            query = query.filter(StockTransaction.created_at >= from_date)
-        except ValueError as e:
-            raise HTTPException(status_code=400, detail=str(e))
-    
-    if date_to:
-        try:
-            to_date = parse_date_with_timezone(date_to)
-            # 종료일은 23:59:59까지 포함
-            to_date = to_date.replace(hour=23, minute=59, second=59)
-            query = query.filter(StockTransaction.created_at <= to_date)
-        except ValueError as e:
-            raise HTTPException(status_code=400, detail=str(e))
-    
-    # 거래처 필터
+            conditions.append(StockTransaction.created_at >= from_date)
+            if from_date.time() == time.min:
+                rollup_conditions.append(DailyStockRollup.day >= from_date.date())
+            else:
+                # 시작 시각이 하루 중간이면 일별 집계로 계산할 수 없음
+                rollup_conditions = None
+        if date_to:
+            # 종료일은 하루 끝까지 포함 (다음 날 0시 미만)
+            to_day = parse_date_with_timezone(date_to).date()
+            conditions.append(StockTransaction.created_at < day_end(to_day))
+            if rollup_conditions is not None:
+                rollup_conditions.append(DailyStockRollup.day <= to_day)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # 거래처 / 거래 유형 / 제품 ID 필터
     if supplier_id:
-        query = query.filter(StockTransaction.supplier_id == supplier_id)
-    
-    # 거래 유형 필터
+        conditions.append(StockTransaction.supplier_id == supplier_id)
     if transaction_type:
-        query = query.filter(StockTransaction.transaction_type == transaction_type)
-    
-    # 제품 ID 필터
+        conditions.append(StockTransaction.transaction_type == transaction_type)
     if product_id:
-        query = query.filter(StockTransaction.product_id == product_id)
+        conditions.append(StockTransaction.product_id == product_id)
     
-    # 제품명 검색 필터
+    # 제품명 검색 (검색 인덱스로 제품 ID를 먼저 찾음) / 카테고리 필터 (제품 조인 필요)
+    needs_product = False
+    product_conditions = []
     if product_search:
-        query = query.filter(Product.name.contains(product_search))
-    
-    # 카테고리 필터
+        product_conditions.append(product_name_contains(product_search))
+        conditions.append(StockTransaction.product_id.in_(select(Product.id).where(product_name_contains(product_search))))
     if category and category != "all":
         if category == "uncategorized":
-            query = query.filter(Product.category.is_(None))
+            category_condition = Product.category.is_(None)
         else:
-            query = query.filter(Product.category == category)
-    
-    # 라트 번호 검색 필터
-    if lot_number:
-        query = query.filter(StockTransaction.lot_number.contains(lot_number))
+            category_condition = Product.category == category
+        product_conditions.append(category_condition)
+        conditions.append(category_condition)
+        needs_product = True
     
-    # 전체 개수 계산
-    total_transactions = query.count()
-    total_pages = (total_transactions + per_page - 1) // per_page
-    
-    # 페이지네이션 적용 (관계 미리 로드)
-    offset = (page - 1) * per_page
-    transactions = query.options(
-        joinedload(StockTransaction.product),
-        joinedload(StockTransaction.supplier),
-        joinedload(StockTransaction.user)
-    ).order_by(StockTransaction.created_at.desc()).offset(offset).limit(per_page).all()
-    
-    # 통계 계산
-    stats_query = db.query(StockTransaction)
-    
-    # 동일한 필터 적용 (서울 시간대 사용)
-    if date_from:
-        from_date = parse_date_with_timezone(date_from)
-        stats_query = stats_query.filter(StockTransaction.created_at >= from_date)
-    if date_to:
-        to_date = parse_date_with_timezone(date_to)
-        to_date = to_date.replace(hour=23, minute=59, second=59)
-        stats_query = stats_query.filter(StockTransaction.created_at <= to_date)
-    if supplier_id:
-        stats_query = stats_query.filter(StockTransaction.supplier_id == supplier_id)
-    if transaction_type:
-        stats_query = stats_query.filter(StockTransaction.transaction_type == transaction_type)
-    if product_id:
-        stats_query = stats_query.filter(StockTransaction.product_id == product_id)
-    if product_search:
-        stats_query = stats_query.join(Product).filter(Product.name.contains(product_search))
-    if category and category != "all":
-        if not product_search:  # 이미 join이 되어있지 않은 경우
-            stats_query = stats_query.join(Product)
-        if category == "uncategorized":
-            stats_query = stats_query.filter(Product.category.is_(None))
-        else:
-            stats_query = stats_query.filter(Product.category == category)
+    # 라트 번호 / 비고 검색 필터 (일치 건수가 적으면 검색 인덱스, 거래 단위 필터라 일별 집계 사용 불가)
     if lot_number:
-        stats_query = stats_query.filter(StockTransaction.lot_number.contains(lot_number))
+        use_index = await prefers_search_index(db, "lot_number", lot_number)
+        conditions.append(transaction_column_contains("lot_number", lot_number, use_index))
+        rollup_conditions = None
+    if notes_search:
+        use_index = await prefers_search_index(db, "notes", notes_search)
+        conditions.append(transaction_column_contains("notes", notes_search, use_index))
+        rollup_conditions = None
+    
+    # 일별 집계 조건 (거래처 / 유형 / 제품은 집계 키, 제품명 / 카테고리는 제품 ID 목록으로)
+    if rollup_conditions is not None:
+        if supplier_id:
+            rollup_conditions.append(DailyStockRollup.supplier_id == supplier_id)
+        if transaction_type:
+            rollup_conditions.append(DailyStockRollup.transaction_type == transaction_type)
+        if product_id:
+            rollup_conditions.append(DailyStockRollup.product_id == product_id)
+        if product_conditions:
+            rollup_conditions.append(DailyStockRollup.product_id.in_(select(Product.id).where(*product_conditions)))
+    
+    return conditions, needs_product, rollup_conditions
+
+def transaction_stats_query(conditions: list, needs_product: bool):
+    """필터된 거래의 건수, 입고/출고 수량, 거래처 수를 조건부 집계 한 번으로 계산하는 쿼리"""
+    query = select(
+        func.count(),
+        func.coalesce(func.sum(case((StockTransaction.transaction_type == "in", StockTransaction.quantity), else_=0)), 0),
+        func.coalesce(func.sum(case((StockTransaction.transaction_type == "out", StockTransaction.quantity), else_=0)), 0),
+        func.count(func.distinct(StockTransaction.supplier_id))
+    ).select_from(StockTransaction)
+    if needs_product:
+        query = query.join(Product, StockTransaction.product_id == Product.id)
+    return query.where(*conditions)
+
+# 필터링된 거래 내역 조회 API
+@app.get("/api/transactions/filtered")
+async def get_filtered_transactions(
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    supplier_id: Optional[int] = None,
+    transaction_type: Optional[str] = None,
+    product_id: Optional[int] = None,
+    product_search: Optional[str] = None,
+    category: Optional[str] = None,
+    lot_number: Optional[str] = None,
+    notes_search: Optional[str] = None,
+    cursor: Optional[str] = None,
+    direction: str = "next",
+    page: Optional[int] = None,
+    per_page: int = 20,
+    include_stats: Optional[bool] = None,
+    user: Optional[UserIdentity] = Depends(get_cookie_user_read),
+    db: AsyncSession = Depends(get_read_db)
+):
+    if not user:
+        raise HTTPException(status_code=401, detail="인증이 필요합니다")
     
-    # 입고/출고 수량 통계
-    in_quantity = stats_query.filter(StockTransaction.transaction_type == "in").with_entities(func.sum(StockTransaction.quantity)).scalar() or 0
-    out_quantity = stats_query.filter(StockTransaction.transaction_type == "out").with_entities(func.sum(StockTransaction.quantity)).scalar() or 0
+    if direction not in ("next", "prev"):
+        raise HTTPException(status_code=400, detail="direction은 next 또는 prev여야 합니다")
+    per_page = max(1, min(per_page, 500))
+    cursor_key = None
+    if cursor and page is None:
+        try:
+            cursor_key = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="잘못된 페이지 커서입니다")
     
-    # 거래처 수 계산
-    total_suppliers = stats_query.filter(StockTransaction.supplier_id.isnot(None)).with_entities(StockTransaction.supplier_id).distinct().count()
+    # 필터 조건은 한 번만 만들어 목록 조회와 통계 집계에 함께 사용
+    conditions, needs_product, rollup_conditions = await build_transaction_filters(
+        db, date_from, date_to, supplier_id, transaction_type, product_id, product_search, category, lot_number, notes_search
+    )
     
-    return {
+    # 목록 쿼리 (관계 미리 로드)
+    page_query = select(StockTransaction).join(Product).join(User).outerjoin(Supplier).where(*conditions).options(
+        contains_eager(StockTransaction.product),
+        contains_eager(StockTransaction.supplier),
+        contains_eager(StockTransaction.user)
+    )
+    newest_first = (StockTransaction.created_at.desc(), StockTransaction.id.desc())
+    next_cursor = prev_cursor = None
+    if page is not None:
+        # 페이지 번호 방식 (기존 클라이언트 호환용, 뒤 페이지일수록 OFFSET 건너뛰기 비용 증가)
+        page = max(page, 1)
+        transactions = (await db.scalars(page_query.order_by(*newest_first).offset((page - 1) * per_page).limit(per_page))).all()
+    elif cursor_key and direction == "prev":
+        # 커서보다 최신 거래를 오래된 순으로 한 건 더 읽어 더 최신 페이지가 있는지 확인한 뒤 최신순으로 뒤집음
+        rows = (await db.scalars(page_query.where(
+            keyset_after(StockTransaction.created_at, StockTransaction.id, cursor_key)
+        ).order_by(StockTransaction.created_at, StockTransaction.id).limit(per_page + 1))).all()
+        transactions = rows[:per_page][::-1]
+        if len(rows) > per_page:
+            prev_cursor = encode_cursor(transactions[0].created_at, transactions[0].id)
+        next_cursor = encode_cursor(transactions[-1].created_at, transactions[-1].id) if transactions else cursor
+    else:
+        # 최신순으로 커서 이전 거래를 (created_at, id) 인덱스 범위 검색 (첫 페이지는 커서 없음)
+        if cursor_key:
+            page_query = page_query.where(keyset_before(StockTransaction.created_at, StockTransaction.id, cursor_key))
+        rows = (await db.scalars(page_query.order_by(*newest_first).limit(per_page + 1))).all()
+        transactions = rows[:per_page]
+        if len(rows) > per_page:
+            next_cursor = encode_cursor(transactions[-1].created_at, transactions[-1].id)
+        if cursor_key:
+            prev_cursor = encode_cursor(transactions[0].created_at, transactions[0].id) if transactions else cursor
+    
+    result = {
         "recent_transactions": transactions,
+        "next_cursor": next_cursor,
+        "prev_cursor": prev_cursor,
+        "per_page": per_page
+    }
+    # 통계는 기본적으로 첫 페이지(또는 페이지 번호 방식)에서만 계산 (include_stats로 지정 가능)
+    if include_stats is None:
+        include_stats = cursor_key is None
+    if not include_stats:
+        return result
+    
+    # 같은 필터의 통계는 거래 내역이 바뀌기 전까지 캐시에서 반환 (페이지를 넘길 때는 목록 조회 비용만 발생)
+    stats_key = ledger_filter_key(
+        date_from=date_from, date_to=date_to, supplier_id=supplier_id, transaction_type=transaction_type, product_id=product_id,
+        product_search=product_search, category=category, lot_number=lot_number, notes_search=notes_search
+    )
+    stats = ledger_stats_cache.get(stats_key)
+    if stats is None:
+        # 세대 번호는 집계 전에 읽음 (집계 중 커밋된 변경이 있으면 저장하지 않음)
+        generation = ledger_stats_cache.generation
+        # 건수, 입고/출고 수량, 거래처 수 (날짜 단위 필터면 일별 집계, 아니면 거래 내역 조건부 집계 한 번)
+        if rollup_conditions is not None:
+            stats_query = rollup_stats_query(rollup_conditions)
+        else:
+            stats_query = transaction_stats_query(conditions, needs_product)
+        stats = tuple((await db.execute(stats_query)).one())
+        ledger_stats_cache.put(stats_key, generation, stats)
+    total_transactions, in_quantity, out_quantity, total_suppliers = stats
+    result.update({
         "total_transactions": total_transactions,
-        "total_pages": total_pages,
-        "current_page": page,
+        "total_pages": (total_transactions + per_page - 1) // per_page,
+        "current_page": page or 1,
         "total_in_quantity": in_quantity,
         "total_out_quantity": out_quantity,
         "total_suppliers": total_suppliers
-    }
+    })
+    return result
+
+# 거래 내역 엑셀 다운로드 API (/api/transactions/{transaction_id}보다 먼저 등록해야 함)
+@app.get("/api/transactions/export")
+async def export_transactions(
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    supplier_id: Optional[int] = None,
+    transaction_type: Optional[str] = None,
+    product_id: Optional[int] = None,
+    product_search: Optional[str] = None,
+    category: Optional[str] = None,
+    lot_number: Optional[str] = None,
+    notes_search: Optional[str] = None,
+    user: Optional[UserIdentity] = Depends(get_cookie_user_read),
+    db: AsyncSession = Depends(get_read_db)
+):
+    if not user:
+        raise HTTPException(status_code=401, detail="인증이 필요합니다")
+    
+    # 기본 쿼리 (관계 포함, 거래 내역 조회와 같은 필터)
+    conditions, _, _ = await build_transaction_filters(
+        db, date_from, date_to, supplier_id, transaction_type, product_id, product_search, category, lot_number, notes_search
+    )
+    query = select(StockTransaction).join(Product).join(User).outerjoin(Supplier).where(*conditions)
+    
+    # 모든 거래 내역 조회 (ORM 객체 대신 CSV에 필요한 컬럼만 조회)
+    query = query.with_only_columns(
+        StockTransaction.created_at,
+        Product.name,
+        StockTransaction.transaction_type,
+        StockTransaction.quantity,
+        StockTransaction.lot_number,
+        Supplier.name,
+        User.full_name,
+        StockTransaction.notes
+    ).order_by(StockTransaction.created_at.desc())
+    
+    # 청크 단위로 읽고 CSV 변환은 스레드풀에서 실행 (이벤트 루프 차단 방지)
+    output = io.StringIO()
+    output.write(await run_in_threadpool(build_transactions_csv, [], True))
+    result = await db.stream(query)
+    async for rows in result.partitions(EXPORT_CHUNK_SIZE):
+        output.write(await run_in_threadpool(build_transactions_csv, rows))
+    csv_data = output.getvalue()
+    output.close()
+    
+    # 파일명 생성 (서울 시간대 사용)
+    current_time = get_seoul_time()
+    filename = f"거래내역_{current_time.strftime('%Y%m%d_%H%M%S')}.csv"
+    
+    # 한글 파일명을 위한 인코딩
+    encoded_filename = filename.encode('utf-8').decode('latin-1')
+    
+    return StreamingResponse(
+        io.BytesIO(csv_data.encode('utf-8-sig')),  # BOM 추가로 한글 지원
+        media_type='text/csv',
+        headers={'Content-Disposition': f'attachment; filename="{encoded_filename}"'}
+    )
+
+# 엑셀 다운로드 시 한 번에 읽어 변환할 행 수
+EXPORT_CHUNK_SIZE = 2000
+
+def build_transactions_csv(rows, include_header: bool = False) -> str:
+    """거래 내역 행 목록을 CSV 문자열로 변환합니다."""
+    output = io.StringIO()
+    writer = csv.writer(output)
+    
+    # 헤더 작성
+    if include_header:
+        writer.writerow([
+            '거래일시', '제품명', '거래유형', '수량', 'LOT번호', 
+            '거래처', '담당자', '비고'
+        ])
+    
+    # 데이터 작성
+    for created_at, product_name, transaction_type, quantity, lot_number, supplier_name, user_name, notes in rows:
+        # 시간대를 고려한 날짜 포맷팅
+        formatted_time = format_datetime_for_display(created_at)
+        writer.writerow([
+            formatted_time,
+            product_name,
+            '입고' if transaction_type == 'in' else '출고',
+            quantity,
+            lot_number or '',
+            supplier_name or '',
+            user_name,
+            notes or ''
+        ])
+    
+    # CSV 데이터를 문자열로 변환
+    csv_data = output.getvalue()
+    output.close()
+    return csv_data
 
 # 거래 내역 삭제 API
 @app.delete("/api/transactions/{transaction_id}")
 async def delete_transaction(
     transaction_id: int, 
     request: Request,
-    access_token: str = Cookie(None), 
-    db: Session = Depends(get_db)
+    user: Optional[UserIdentity] = Depends(get_cookie_user_write), 
+    db: AsyncSession = Depends(get_write_db)
 ):
     print(f"DEBUG: 거래 내역 삭제 요청 - ID: {transaction_id}")
     
-    user = get_current_user_from_cookie(access_token)
     if not user:
         print("DEBUG: 인증 실패")
         raise HTTPException(status_code=401, detail="인증이 필요합니다")
@@ -2107,7 +2191,10 @@ async def delete_transaction(
     print(f"DEBUG: 관리자 인증 성공 - 사용자: {user.username}")
     
     # 거래 내역 조회
-    transaction = db.query(StockTransaction).filter(StockTransaction.id == transaction_id).first()
+    transaction = await db.scalar(select(StockTransaction).options(
+        selectinload(StockTransaction.supplier),
+        selectinload(StockTransaction.user)
+    ).where(StockTransaction.id == transaction_id))
     if not transaction:
         print(f"DEBUG: 거래 내역을 찾을 수 없음 - ID: {transaction_id}")
         raise HTTPException(status_code=404, detail="거래 내역을 찾을 수 없습니다")
@@ -2115,10 +2202,26 @@ async def delete_transaction(
     print(f"DEBUG: 거래 내역 발견 - ID: {transaction.id}, 제품: {transaction.product_id}, 유형: {transaction.transaction_type}, 수량: {transaction.quantity}")
     
     # 제품 정보 조회
-    product = db.query(Product).filter(Product.id == transaction.product_id).first()
+    product = await db.get(Product, transaction.product_id)
     if not product:
         raise HTTPException(status_code=404, detail="관련 제품을 찾을 수 없습니다")
     
+    # 거래 내역 삭제 (동시에 같은 거래를 삭제한 경우 재고가 두 번 복원되지 않도록 먼저 삭제하고 확인)
+    deleted = await db.execute(delete(StockTransaction).where(StockTransaction.id == transaction_id))
+    if deleted.rowcount != 1:
+        raise HTTPException(status_code=409, detail="다른 요청에서 이미 삭제된 거래 내역입니다")
+    
+    # 재고 수량 복원 (삭제 시 반대 작업 수행, 입고 거래 삭제 시 재고 감소 / 출고 거래 삭제 시 재고 증가)
+    stock_delta = -lot_delta(transaction.transaction_type, transaction.quantity)
+    stock_result = await change_product_stock(db, transaction.product_id, stock_delta)
+    if not stock_result:
+        current_stock = await get_product_stock(db, transaction.product_id)
+        raise HTTPException(
+            status_code=400, 
+            detail=f"재고가 부족하여 삭제할 수 없습니다. (현재 재고: {current_stock}개, 삭제할 수량: {transaction.quantity}개)"
+        )
+    stock_after, version = stock_result
+    
     # 삭제 전 정보 저장 (로그용)
     transaction_details = {
         "product_name": product.name,
@@ -2132,27 +2235,25 @@ async def delete_transaction(
         "original_user_id": transaction.user_id,
         "notes": transaction.notes,
         "created_at": transaction.created_at.isoformat() if transaction.created_at else None,
-        "stock_before": product.stock_quantity
+        "stock_before": stock_after - stock_delta,
+        "stock_after": stock_after
     }
     
-    # 재고 수량 복원 (삭제 시 반대 작업 수행)
-    if transaction.transaction_type == "in":
-        # 입고 거래 삭제 시 재고 감소
-        if product.stock_quantity < transaction.quantity:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"재고가 부족하여 삭제할 수 없습니다. (현재 재고: {product.stock_quantity}개, 삭제할 수량: {transaction.quantity}개)"
-            )
-        product.stock_quantity -= transaction.quantity
-    else:
-        # 출고 거래 삭제 시 재고 증가
-        product.stock_quantity += transaction.quantity
+    # LOT별 재고 집계 되돌리기
+    lot_movements = {}
+    add_lot_movement(lot_movements, transaction.product_id, transaction.lot_number, stock_delta)
+    await apply_lot_movements(db, lot_movements)
+    
+    # 일별 입출고 집계에서 제외
+    rollup_movements = {}
+    add_rollup_movement(rollup_movements, db.bind.dialect.name, transaction.created_at, transaction.product_id, transaction.supplier_id, transaction.transaction_type, -transaction.quantity, -1)
+    await apply_daily_rollups(db, rollup_movements)
     
-    # 삭제 후 재고 정보 추가
-    transaction_details["stock_after"] = product.stock_quantity
+    # 삭제한 거래 날짜 이후의 재고 스냅샷 무효화
+    await invalidate_snapshots(db, transaction.created_at)
     
-    # 거래 내역 삭제
-    db.delete(transaction)
+    # 삭제한 거래 이후 거래들의 거래 후 재고 다시 계산
+    await refresh_running_balances(db, [transaction.product_id], transaction.created_at, transaction.id)
     
     # 감사 로그 기록 (테이블이 있을 때만)
     try:
@@ -2173,29 +2274,29 @@ async def delete_transaction(
         print(f"DEBUG: 감사 로그 기록 실패 (테이블 없음): {e}")
         # 감사 로그 기록 실패해도 거래 내역 삭제는 계속 진행
     
-    db.commit()
+    await db.commit()
+    ledger_stats_cache.bump()
     
     print(f"DEBUG: 거래 내역 삭제 완료 - ID: {transaction_id}, 관리자: {user.username}")
     
-    return {"message": "거래 내역이 삭제되었습니다"}
+    return {"message": "거래 내역이 삭제되었습니다", "stock_quantity": stock_after, "version": version}
 
 # 거래 내역 상세 조회 API
 @app.get("/api/transactions/{transaction_id}")
 async def get_transaction_detail(
     transaction_id: int,
-    access_token: str = Cookie(None),
-    db: Session = Depends(get_db)
+    user: Optional[UserIdentity] = Depends(get_cookie_user_read),
+    db: AsyncSession = Depends(get_read_db)
 ):
-    user = get_current_user_from_cookie(access_token)
     if not user:
         raise HTTPException(status_code=401, detail="인증이 필요합니다")
     
     # 거래 내역 조회
-    transaction = db.query(StockTransaction).options(
+    transaction = await db.scalar(select(StockTransaction).options(
         joinedload(StockTransaction.product),
         joinedload(StockTransaction.supplier),
         joinedload(StockTransaction.user)
-    ).filter(StockTransaction.id == transaction_id).first()
+    ).where(StockTransaction.id == transaction_id))
     
     if not transaction:
         raise HTTPException(status_code=404, detail="거래 내역을 찾을 수 없습니다")
@@ -2208,10 +2309,9 @@ async def update_transaction_quantity(
     transaction_id: int,
     update_data: StockTransactionQuantityUpdate,
     request: Request,
-    access_token: str = Cookie(None),
-    db: Session = Depends(get_db)
+    user: Optional[UserIdentity] = Depends(get_cookie_user_write),
+    db: AsyncSession = Depends(get_write_db)
 ):
-    user = get_current_user_from_cookie(access_token)
     if not user:
         raise HTTPException(status_code=401, detail="인증이 필요합니다")
     
@@ -2220,19 +2320,17 @@ async def update_transaction_quantity(
         raise HTTPException(status_code=403, detail="관리자 권한이 필요합니다")
     
     # 거래 내역 조회
-    transaction = db.query(StockTransaction).options(
-        joinedload(StockTransaction.product)
-    ).filter(StockTransaction.id == transaction_id).first()
+    transaction = await db.get(StockTransaction, transaction_id)
     
     if not transaction:
         raise HTTPException(status_code=404, detail="거래 내역을 찾을 수 없습니다")
     
     # 제품 조회
-    product = transaction.product
+    product = await db.get(Product, transaction.product_id)
     if not product:
         raise HTTPException(status_code=404, detail="제품 정보를 찾을 수 없습니다")
     
-    # 기존 수량과 새 수량
+    # 기존 수량과 새 수량 (검증을 모두 마친 뒤에 변경)
     old_quantity = transaction.quantity
     new_quantity = update_data.new_quantity
     
@@ -2242,23 +2340,55 @@ async def update_transaction_quantity(
     # 수량 차이 계산
     quantity_diff = new_quantity - old_quantity
     
-    # 재고 조정 (입고는 +, 출고는 -)
-    if transaction.transaction_type == "in":
-        # 입고 수량 수정: 차이만큼 재고 조정
-        product.stock_quantity += quantity_diff
-    else:
-        # 출고 수량 수정: 차이만큼 재고 조정 (차이가 음수면 재고 증가, 양수면 재고 감소)
-        product.stock_quantity -= quantity_diff
-        
-        # 출고 수량이 증가하는 경우 재고 부족 확인
-        if quantity_diff > 0 and product.stock_quantity < 0:
+    # 거래 내역 수량 업데이트 (조회한 수량 그대로일 때만 변경, 동시에 수정한 경우 충돌로 처리)
+    updated = await db.execute(update(StockTransaction).where(
+        StockTransaction.id == transaction_id,
+        StockTransaction.quantity == old_quantity
+    ).values(quantity=new_quantity).execution_options(synchronize_session=False))
+    if updated.rowcount != 1:
+        raise HTTPException(status_code=409, detail="다른 요청에서 거래 내역이 변경되었습니다. 새로고침 후 다시 시도해 주세요")
+    
+    # 일별 입출고 집계에 수량 차이 반영 (건수는 그대로)
+    rollup_movements = {}
+    add_rollup_movement(rollup_movements, db.bind.dialect.name, transaction.created_at, transaction.product_id, transaction.supplier_id, transaction.transaction_type, quantity_diff, 0)
+    await apply_daily_rollups(db, rollup_movements)
+    
+    # 재고 조정 (입고는 +, 출고는 -) - 재고가 줄어드는 경우 부족하거나,
+    # 화면에서 본 재고 버전(expected_version) 이후 다른 재고 변경이 있으면 조건부 UPDATE가 실패
+    stock_delta = lot_delta(transaction.transaction_type, quantity_diff)
+    stock_result = await change_product_stock(db, transaction.product_id, stock_delta, update_data.expected_version)
+    if not stock_result:
+        current_stock, current_version = await get_product_stock_version(db, transaction.product_id)
+        if update_data.expected_version is not None and current_version != update_data.expected_version:
+            raise HTTPException(
+                status_code=409,
+                detail=f"다른 요청에서 재고가 변경되었습니다. 새로고침 후 다시 시도해 주세요 (현재 재고: {current_stock}개)"
+            )
+        raise HTTPException(
+            status_code=400, 
+            detail=f"재고가 부족합니다. (현재 재고: {current_stock}개, 재고 감소량: {-stock_delta}개)"
+        )
+    stock_after, version = stock_result
+    
+    # LOT별 재고 집계 조정 (LOT 재고가 줄어드는 경우 부족하면 실패)
+    if transaction.lot_number and stock_delta < 0:
+        if not await take_lot_quantity(db, transaction.product_id, transaction.lot_number, -stock_delta):
+            lot_key = (transaction.product_id, transaction.lot_number)
+            lot_current_stock = (await get_lot_quantities(db, [lot_key]))[lot_key]
             raise HTTPException(
                 status_code=400, 
-                detail=f"재고가 부족합니다. (현재 재고: {product.stock_quantity + quantity_diff}개, 추가 출고 요청: {quantity_diff}개)"
+                detail=f"LOT {transaction.lot_number}의 재고가 부족합니다. (LOT 재고: {lot_current_stock}개, 재고 감소량: {-stock_delta}개)"
             )
+    else:
+        lot_movements = {}
+        add_lot_movement(lot_movements, transaction.product_id, transaction.lot_number, stock_delta)
+        await apply_lot_movements(db, lot_movements)
+    
+    # 수정한 거래 날짜 이후의 재고 스냅샷 무효화
+    await invalidate_snapshots(db, transaction.created_at)
     
-    # 거래 내역 수량 업데이트
-    transaction.quantity = new_quantity
+    # 수정한 거래부터 거래 후 재고 다시 계산
+    await refresh_running_balances(db, [transaction.product_id], transaction.created_at, transaction.id)
     
     # 감사 로그 기록
     try:
@@ -2290,15 +2420,15 @@ async def update_transaction_quantity(
         print(f"감사 로그 기록 실패: {e}")
         # 감사 로그 기록 실패해도 수정은 계속 진행
     
-    db.commit()
+    await db.commit()
+    ledger_stats_cache.bump()
     
-    return {"message": "수량이 성공적으로 수정되었습니다"}
+    return {"message": "수량이 성공적으로 수정되었습니다", "stock_quantity": stock_after, "version": version}
 
 # audit_logs 테이블 생성 API
 @app.post("/api/debug/create-audit-logs-table")
-async def create_audit_logs_table(access_token: str = Cookie(None), db: Session = Depends(get_db)):
+async def create_audit_logs_table(user: Optional[UserIdentity] = Depends(get_cookie_user), db: Session = Depends(get_db)):
     """audit_logs 테이블을 수동으로 생성합니다."""
-    user = get_current_user_from_cookie(access_token)
     if not user:
         raise HTTPException(status_code=401, detail="인증이 필요합니다")
     
@@ -2307,29 +2437,13 @@ async def create_audit_logs_table(access_token: str = Cookie(None), db: Session
         raise HTTPException(status_code=403, detail="관리자 권한이 필요합니다")
     
     try:
-        # audit_logs 테이블을 직접 SQL로 생성
-        create_table_sql = """
-        CREATE TABLE IF NOT EXISTS audit_logs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            action VARCHAR(50) NOT NULL,
-            target_type VARCHAR(50) NOT NULL,
-            target_id INTEGER,
-            details TEXT,
-            ip_address VARCHAR(45),
-            user_agent TEXT,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-        """
-        db.execute(create_table_sql)
-        db.commit()
+        # audit_logs 테이블을 모델 정의로 생성 (데이터베이스 종류에 맞는 DDL 사용)
+        AuditLog.__table__.create(bind=engine, checkfirst=True)
         
         # 인덱스 생성
-        db.execute("CREATE INDEX IF NOT EXISTS ix_audit_logs_id ON audit_logs (id)")
-        db.execute("CREATE INDEX IF NOT EXISTS ix_audit_logs_user_id ON audit_logs (user_id)")
-        db.execute("CREATE INDEX IF NOT EXISTS ix_audit_logs_created_at ON audit_logs (created_at)")
-        db.commit()
+        with engine.begin() as connection:
+            connection.execute(text("CREATE INDEX IF NOT EXISTS ix_audit_logs_user_id ON audit_logs (user_id)"))
+            connection.execute(text("CREATE INDEX IF NOT EXISTS ix_audit_logs_created_at ON audit_logs (created_at)"))
         
         return {"message": "audit_logs 테이블이 성공적으로 생성되었습니다"}
     except Exception as e:
@@ -2337,9 +2451,8 @@ async def create_audit_logs_table(access_token: str = Cookie(None), db: Session
 
 # 거래 내역 디버깅 API (임시)
 @app.get("/api/debug/transactions")
-async def debug_transactions(access_token: str = Cookie(None), db: Session = Depends(get_db)):
+async def debug_transactions(user: Optional[UserIdentity] = Depends(get_cookie_user), db: Session = Depends(get_db)):
     """거래 내역 디버깅 정보를 반환합니다."""
-    user = get_current_user_from_cookie(access_token)
     if not user:
         raise HTTPException(status_code=401, detail="인증이 필요합니다")
     
@@ -2363,11 +2476,10 @@ async def debug_transactions(access_token: str = Cookie(None), db: Session = Dep
 async def get_audit_logs(
     page: int = 1,
     per_page: int = 20,
-    access_token: str = Cookie(None),
+    user: Optional[UserIdentity] = Depends(get_cookie_user),
     db: Session = Depends(get_db)
 ):
     """감사 로그를 조회합니다. (관리자만 접근 가능)"""
-    user = get_current_user_from_cookie(access_token)
     if not user:
         raise HTTPException(status_code=401, detail="인증이 필요합니다")
     
@@ -2449,116 +2561,6 @@ async def debug_timezone():
         "environment_tz": os.environ.get('TZ', 'Not set')
     }
 
-# 거래 내역 엑셀 다운로드 API
-@app.get("/api/transactions/export")
-async def export_transactions(
-    date_from: Optional[str] = None,
-    date_to: Optional[str] = None,
-    supplier_id: Optional[int] = None,
-    transaction_type: Optional[str] = None,
-    product_id: Optional[int] = None,
-    product_search: Optional[str] = None,
-    category: Optional[str] = None,
-    lot_number: Optional[str] = None,
-    access_token: str = Cookie(None),
-    db: Session = Depends(get_db)
-):
-    user = get_current_user_from_cookie(access_token)
-    if not user:
-        raise HTTPException(status_code=401, detail="인증이 필요합니다")
-    
-    # 기본 쿼리 (관계 포함)
-    query = db.query(StockTransaction).join(Product).join(User).outerjoin(Supplier)
-    
-    # 날짜 필터 (서울 시간대 사용)
-    if date_from:
-        try:
-            from_date = parse_date_with_timezone(date_from)
-            query = query.filter(StockTransaction.created_at >= from_date)
-        except ValueError as e:
-            raise HTTPException(status_code=400, detail=str(e))
-    
-    if date_to:
-        try:
-            to_date = parse_date_with_timezone(date_to)
-            to_date = to_date.replace(hour=23, minute=59, second=59)
-            query = query.filter(StockTransaction.created_at <= to_date)
-        except ValueError as e:
-            raise HTTPException(status_code=400, detail=str(e))
-    
-    # 거래처 필터
-    if supplier_id:
-        query = query.filter(StockTransaction.supplier_id == supplier_id)
-    
-    # 거래 유형 필터
-    if transaction_type:
-        query = query.filter(StockTransaction.transaction_type == transaction_type)
-    
-    # 제품 ID 필터
-    if product_id:
-        query = query.filter(StockTransaction.product_id == product_id)
-    
-    # 제품명 검색 필터
-    if product_search:
-        query = query.filter(Product.name.contains(product_search))
-    
-    # 카테고리 필터
-    if category and category != "all":
-        if category == "uncategorized":
-            query = query.filter(Product.category.is_(None))
-        else:
-            query = query.filter(Product.category == category)
-    
-    # 라트 번호 검색 필터
-    if lot_number:
-        query = query.filter(StockTransaction.lot_number.contains(lot_number))
-    
-    # 모든 거래 내역 조회
-    transactions = query.order_by(StockTransaction.created_at.desc()).all()
-    
-    # CSV 생성
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # 헤더 작성
-    writer.writerow([
-        '거래일시', '제품명', '거래유형', '수량', 'LOT번호', 
-        '거래처', '담당자', '비고'
-    ])
-    
-    # 데이터 작성
-    for transaction in transactions:
-        # 시간대를 고려한 날짜 포맷팅
-        formatted_time = format_datetime_for_display(transaction.created_at)
-        writer.writerow([
-            formatted_time,
-            transaction.product.name,
-            '입고' if transaction.transaction_type == 'in' else '출고',
-            transaction.quantity,
-            transaction.lot_number or '',
-            transaction.supplier.name if transaction.supplier else '',
-            transaction.user.full_name,
-            transaction.notes or ''
-        ])
-    
-    # 파일명 생성 (서울 시간대 사용)
-    current_time = get_seoul_time()
-    filename = f"거래내역_{current_time.strftime('%Y%m%d_%H%M%S')}.csv"
-    
-    # CSV 데이터를 바이트로 변환
-    output.seek(0)
-    csv_data = output.getvalue()
-    output.close()
-    
-    # 한글 파일명을 위한 인코딩
-    encoded_filename = filename.encode('utf-8').decode('latin-1')
-    
-    return StreamingResponse(
-        io.BytesIO(csv_data.encode('utf-8-sig')),  # BOM 추가로 한글 지원
-        media_type='text/csv',
-        headers={'Content-Disposition': f'attachment; filename="{encoded_filename}"'}
-    )
-
 # 토큰 갱신 API
 @app.post("/api/refresh-token")
 async def refresh_token(refresh_token: str = Cookie(None)):
@@ -2595,34 +2597,25 @@ async def refresh_token(refresh_token: str = Cookie(None)):
 @app.get("/api/token-status")
 async def get_token_status(access_token: str = Cookie(None), refresh_token: str = Cookie(None)):
     """토큰의 상태를 확인합니다."""
-    from auth import is_token_expired, get_token_expiry_time
+    from auth import decode_token
     
     if not access_token and not refresh_token:
         return {"status": "no_token", "message": "토큰이 없습니다"}
     
     result = {}
     
-    if access_token:
-        is_expired = is_token_expired(access_token)
-        expiry_time = get_token_expiry_time(access_token)
-        result["access_token"] = {
-            "exists": True,
-            "expired": is_expired,
-            "expiry_time": expiry_time.isoformat() if expiry_time else None
-        }
-    else:
-        result["access_token"] = {"exists": False}
-    
-    if refresh_token:
-        is_expired = is_token_expired(refresh_token)
-        expiry_time = get_token_expiry_time(refresh_token)
-        result["refresh_token"] = {
+    # 토큰마다 한 번만 디코딩해 만료 여부와 만료 시간을 함께 계산
+    for name, token in (("access_token", access_token), ("refresh_token", refresh_token)):
+        if not token:
+            result[name] = {"exists": False}
+            continue
+        decoded = decode_token(token)
+        expires_at = decoded.expires_at if decoded else None
+        result[name] = {
             "exists": True,
-            "expired": is_expired,
-            "expiry_time": expiry_time.isoformat() if expiry_time else None
+            "expired": decoded is None or decoded.expired,
+            "expiry_time": datetime.fromtimestamp(expires_at).isoformat() if expires_at else None
         }
-    else:
-        result["refresh_token"] = {"exists": False}
     
     return result
 
@@ -2638,31 +2631,129 @@ async def get_pool_status():
 async def reset_pool():
     """데이터베이스 연결 풀을 리셋합니다."""
     from database import reset_pool
-    reset_pool()
+    await reset_pool()
     return {"message": "연결 풀이 리셋되었습니다."}
 
+# WAL 체크포인트 엔드포인트 (디버그용)
+@app.post("/api/debug/wal-checkpoint")
+async def run_wal_checkpoint(mode: Optional[str] = None, user: Optional[UserIdentity] = Depends(get_cookie_user_read)):
+    """WAL 체크포인트를 수동으로 실행합니다."""
+    if not user:
+        raise HTTPException(status_code=401, detail="인증이 필요합니다")
+    
+    # 관리자 권한 확인
+    if not user.is_admin:
+        raise HTTPException(status_code=403, detail="관리자 권한이 필요합니다")
+    
+    from database import checkpoint_wal
+    try:
+        return checkpoint_wal(mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# 인증 사용자 캐시 상태 엔드포인트 (디버그용)
+@app.get("/api/debug/auth-cache")
+async def get_auth_cache_status(user: Optional[UserIdentity] = Depends(get_cookie_user_read)):
+    """인증 사용자/검증 토큰 캐시의 크기와 적중/실패 횟수를 반환합니다."""
+    if not user:
+        raise HTTPException(status_code=401, detail="인증이 필요합니다")
+    
+    # 관리자 권한 확인
+    if not user.is_admin:
+        raise HTTPException(status_code=403, detail="관리자 권한이 필요합니다")
+    
+    return {"users": user_cache.stats(), "tokens": token_cache.stats()}
+
+# 거래 내역 통계 캐시 상태 엔드포인트 (디버그용)
+@app.get("/api/debug/ledger-cache")
+async def get_ledger_cache_status(user: Optional[UserIdentity] = Depends(get_cookie_user_read)):
+    """거래 내역 통계 캐시의 크기, 메모리 사용량, 세대 번호와 적중/실패 횟수를 반환합니다."""
+    if not user:
+        raise HTTPException(status_code=401, detail="인증이 필요합니다")
+    
+    # 관리자 권한 확인
+    if not user.is_admin:
+        raise HTTPException(status_code=403, detail="관리자 권한이 필요합니다")
+    
+    return ledger_stats_cache.stats()
+
+# Idempotency-Key 저장소 상태 엔드포인트 (디버그용)
+@app.get("/api/debug/idempotency")
+async def get_idempotency_status(user: Optional[UserIdentity] = Depends(get_cookie_user_read)):
+    """Idempotency-Key 저장소 크기와 재사용/대기 횟수를 반환합니다."""
+    if not user:
+        raise HTTPException(status_code=401, detail="인증이 필요합니다")
+    
+    # 관리자 권한 확인
+    if not user.is_admin:
+        raise HTTPException(status_code=403, detail="관리자 권한이 필요합니다")
+    
+    return idempotency_store.stats()
+
+# 쓰기 묶음 처리 통계 엔드포인트 (디버그용)
+@app.get("/api/debug/write-coordinator")
+async def get_write_coordinator_status(user: Optional[UserIdentity] = Depends(get_cookie_user_read)):
+    """입출고 쓰기 묶음 크기와 큐 대기 시간 통계를 반환합니다."""
+    if not user:
+        raise HTTPException(status_code=401, detail="인증이 필요합니다")
+    
+    # 관리자 권한 확인
+    if not user.is_admin:
+        raise HTTPException(status_code=403, detail="관리자 권한이 필요합니다")
+    
+    return write_coordinator.stats()
+
+# 인덱스 실행 계획 확인 엔드포인트 (디버그용)
+@app.get("/api/debug/index-plans")
+async def get_index_plans(user: Optional[UserIdentity] = Depends(get_cookie_user_read)):
+    """주요 조회 쿼리의 실행 계획과 인덱스 사용 여부를 반환합니다."""
+    if not user:
+        raise HTTPException(status_code=401, detail="인증이 필요합니다")
+    
+    # 관리자 권한 확인
+    if not user.is_admin:
+        raise HTTPException(status_code=403, detail="관리자 권한이 필요합니다")
+    
+    return await run_in_threadpool(verify_index_plans, engine)
+
+# 종료 시 WAL 체크포인트 (재시작 시 WAL 재생 시간 단축) 및 비동기 연결 정리
+@app.on_event("shutdown")
+async def checkpoint_on_shutdown():
+    # 큐에 남은 입출고를 먼저 커밋
+    await write_coordinator.stop()
+    snapshot_task = getattr(app.state, "snapshot_task", None)
+    if snapshot_task:
+        snapshot_task.cancel()
+    from database import checkpoint_wal
+    try:
+        checkpoint_wal()
+    except Exception as e:
+        print(f"WAL 체크포인트 실패: {e}")
+    # aiosqlite 연결 스레드가 남아 있으면 프로세스가 종료되지 않음
+    from database import dispose_async_engines
+    await dispose_async_engines()
+
 # ==================== 새로운 주문 관리 시스템 API ====================
 
 # 주문 생성
 @app.post("/api/orders")
 async def create_order(
     order: OrderCreate,
-    access_token: str = Cookie(None),
-    db: Session = Depends(get_db)
+    user: Optional[UserIdentity] = Depends(get_cookie_user_write),
+    db: AsyncSession = Depends(get_write_db)
 ):
     """새로운 주문을 생성합니다."""
-    user = get_current_user_from_cookie(access_token)
     if not user:
         raise HTTPException(status_code=401, detail="인증이 필요합니다")
     
     # 거래처 존재 확인
-    supplier = db.query(Supplier).filter(Supplier.id == order.supplier_id).first()
+    supplier = await db.get(Supplier, order.supplier_id)
     if not supplier:
         raise HTTPException(status_code=404, detail="거래처를 찾을 수 없습니다")
     
     # 주문번호 생성 (YYYYMMDD-XXXX 형식)
     today = datetime.utcnow().strftime("%Y%m%d")
-    last_order = db.query(Order).filter(Order.order_number.like(f"{today}-%")).order_by(Order.id.desc()).first()
+    last_order = await db.scalar(select(Order).where(Order.order_number.like(f"{today}-%")).order_by(Order.id.desc()).limit(1))
     if last_order:
         last_number = int(last_order.order_number.split('-')[1])
         order_number = f"{today}-{last_number + 1:04d}"
@@ -2699,12 +2790,12 @@ async def create_order(
     )
     
     db.add(db_order)
-    db.flush()  # ID를 얻기 위해 flush
+    await db.flush()  # ID를 얻기 위해 flush
     
     # 주문 아이템 생성
     for item in order.items:
         # 제품 존재 확인
-        product = db.query(Product).filter(Product.id == item.product_id).first()
+        product = await db.get(Product, item.product_id)
         if not product:
             raise HTTPException(status_code=404, detail=f"제품 ID {item.product_id}를 찾을 수 없습니다")
         
@@ -2720,8 +2811,8 @@ async def create_order(
         )
         db.add(db_item)
     
-    db.commit()
-    db.refresh(db_order)
+    await db.commit()
+    await db.refresh(db_order)
     
     return {"message": "주문이 생성되었습니다", "order_id": db_order.id, "order_number": order_number}
 
@@ -2730,28 +2821,27 @@ async def create_order(
 async def get_orders(
     supplier_id: Optional[int] = None,
     status: Optional[str] = None,
-    access_token: str = Cookie(None),
-    db: Session = Depends(get_db)
+    user: Optional[UserIdentity] = Depends(get_cookie_user_read),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """주문 목록을 조회합니다."""
-    user = get_current_user_from_cookie(access_token)
     if not user:
         # 임시로 인증 없이 테스트
         pass
     
     try:
         # 테이블 존재 여부 확인
-        db.execute(text("SELECT 1 FROM orders LIMIT 1"))
-        db.execute(text("SELECT 1 FROM suppliers LIMIT 1"))
+        await db.execute(text("SELECT 1 FROM orders LIMIT 1"))
+        await db.execute(text("SELECT 1 FROM suppliers LIMIT 1"))
         
-        query = db.query(Order).join(Supplier)
+        query = select(Order).join(Supplier).options(contains_eager(Order.supplier))
         
         if supplier_id:
-            query = query.filter(Order.supplier_id == supplier_id)
+            query = query.where(Order.supplier_id == supplier_id)
         if status:
-            query = query.filter(Order.status == status)
+            query = query.where(Order.status == status)
         
-        orders = query.order_by(Order.created_at.desc()).all()
+        orders = (await db.scalars(query.order_by(Order.created_at.desc()))).all()
         
         return {
             "orders": [
@@ -2777,7 +2867,8 @@ async def get_orders(
         print(f"DEBUG: orders 테이블 조회 중 오류: {e}")
         # 테이블이 없으면 생성 시도
         try:
-            Base.metadata.create_all(bind=engine)
+            async with async_write_engine.begin() as connection:
+                await connection.run_sync(Base.metadata.create_all)
             print("orders 테이블을 생성했습니다.")
             return {"orders": []}
         except Exception as create_error:
@@ -2788,20 +2879,19 @@ async def get_orders(
 @app.get("/api/orders/{order_id}")
 async def get_order_detail(
     order_id: int,
-    access_token: str = Cookie(None),
-    db: Session = Depends(get_db)
+    user: Optional[UserIdentity] = Depends(get_cookie_user_read),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """주문 상세 정보를 조회합니다."""
-    user = get_current_user_from_cookie(access_token)
     if not user:
         raise HTTPException(status_code=401, detail="인증이 필요합니다")
     
-    order = db.query(Order).filter(Order.id == order_id).first()
+    order = await db.scalar(select(Order).options(selectinload(Order.supplier)).where(Order.id == order_id))
     if not order:
         raise HTTPException(status_code=404, detail="주문을 찾을 수 없습니다")
     
     # 주문 아이템 조회
-    order_items = db.query(OrderItem).join(Product).filter(OrderItem.order_id == order_id).all()
+    order_items = (await db.scalars(select(OrderItem).join(Product).options(contains_eager(OrderItem.product)).where(OrderItem.order_id == order_id))).all()
     
     return {
         "order": {
@@ -2837,16 +2927,15 @@ async def get_order_detail(
 async def add_advance_payment(
     order_id: int,
     payment: AdvancePaymentCreate,
-    access_token: str = Cookie(None),
-    db: Session = Depends(get_db)
+    user: Optional[UserIdentity] = Depends(get_cookie_user_write),
+    db: AsyncSession = Depends(get_write_db)
 ):
     """주문에 대한 선납금을 추가합니다."""
-    user = get_current_user_from_cookie(access_token)
     if not user:
         raise HTTPException(status_code=401, detail="인증이 필요합니다")
     
     # 주문 존재 확인
-    order = db.query(Order).filter(Order.id == order_id).first()
+    order = await db.get(Order, order_id)
     if not order:
         raise HTTPException(status_code=404, detail="주문을 찾을 수 없습니다")
     
@@ -2864,11 +2953,12 @@ async def add_advance_payment(
     )
     
     db.add(db_payment)
-    db.commit()
-    db.refresh(db_payment)
     
-    # 선납금 잔액 업데이트
-    update_prepayment_balance(db, order.supplier_id, payment.amount, "add")
+    # 선납금 잔액 업데이트 (선납금 기록과 같은 트랜잭션)
+    await update_prepayment_balance(db, order.supplier_id, payment.amount, "add")
+    
+    await db.commit()
+    await db.refresh(db_payment)
     
     return {"message": "선납금이 추가되었습니다", "payment_id": db_payment.id}
 
@@ -2876,15 +2966,14 @@ async def add_advance_payment(
 @app.get("/api/orders/{order_id}/advance-payments")
 async def get_advance_payments(
     order_id: int,
-    access_token: str = Cookie(None),
-    db: Session = Depends(get_db)
+    user: Optional[UserIdentity] = Depends(get_cookie_user_read),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """주문의 선납금 목록을 조회합니다."""
-    user = get_current_user_from_cookie(access_token)
     if not user:
         raise HTTPException(status_code=401, detail="인증이 필요합니다")
     
-    payments = db.query(AdvancePayment).filter(AdvancePayment.order_id == order_id).all()
+    payments = (await db.scalars(select(AdvancePayment).where(AdvancePayment.order_id == order_id))).all()
     
     return {
         "payments": [
@@ -2908,16 +2997,15 @@ async def get_advance_payments(
 async def create_supply_schedule(
     order_id: int,
     schedule_data: dict,
-    access_token: str = Cookie(None),
-    db: Session = Depends(get_db)
+    user: Optional[UserIdentity] = Depends(get_cookie_user_write),
+    db: AsyncSession = Depends(get_write_db)
 ):
     """주문에 대한 공급 일정을 생성합니다."""
-    user = get_current_user_from_cookie(access_token)
     if not user:
         raise HTTPException(status_code=401, detail="인증이 필요합니다")
     
     # 주문 존재 확인
-    order = db.query(Order).filter(Order.id == order_id).first()
+    order = await db.get(Order, order_id)
     if not order:
         raise HTTPException(status_code=404, detail="주문을 찾을 수 없습니다")
     
@@ -2955,7 +3043,7 @@ async def create_supply_schedule(
     )
     
     db.add(db_schedule)
-    db.flush()  # ID를 얻기 위해 flush
+    await db.flush()  # ID를 얻기 위해 flush
     
     # 각 품목별로 주문 아이템 업데이트 (공급된 수량 증가)
     for item in items:
@@ -2964,7 +3052,7 @@ async def create_supply_schedule(
         
         if planned_quantity > 0:
             # 주문 아이템 조회 및 업데이트
-            order_item = db.query(OrderItem).filter(OrderItem.id == order_item_id).first()
+            order_item = await db.get(OrderItem, order_item_id) if order_item_id else None
             if order_item:
                 # 공급된 수량 증가
                 order_item.supplied_quantity += planned_quantity
@@ -2974,8 +3062,8 @@ async def create_supply_schedule(
                 if order_item.remaining_quantity < 0:
                     order_item.remaining_quantity = 0
     
-    db.commit()
-    db.refresh(db_schedule)
+    await db.commit()
+    await db.refresh(db_schedule)
     
     return {"message": "공급 일정이 생성되었습니다", "schedule_id": db_schedule.id}
 
@@ -2983,15 +3071,14 @@ async def create_supply_schedule(
 @app.get("/api/orders/{order_id}/supply-schedules")
 async def get_supply_schedules(
     order_id: int,
-    access_token: str = Cookie(None),
-    db: Session = Depends(get_db)
+    user: Optional[UserIdentity] = Depends(get_cookie_user_read),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """주문의 공급 일정 목록을 조회합니다."""
-    user = get_current_user_from_cookie(access_token)
     if not user:
         raise HTTPException(status_code=401, detail="인증이 필요합니다")
     
-    schedules = db.query(SupplySchedule).filter(SupplySchedule.order_id == order_id).all()
+    schedules = (await db.scalars(select(SupplySchedule).where(SupplySchedule.order_id == order_id))).all()
     
     return {
         "schedules": [
@@ -3013,15 +3100,14 @@ async def get_supply_schedules(
 async def update_supply_schedule(
     schedule_id: int,
     schedule_update: SupplyScheduleUpdate,
-    access_token: str = Cookie(None),
-    db: Session = Depends(get_db)
+    user: Optional[UserIdentity] = Depends(get_cookie_user_write),
+    db: AsyncSession = Depends(get_write_db)
 ):
     """공급 일정을 업데이트합니다."""
-    user = get_current_user_from_cookie(access_token)
     if not user:
         raise HTTPException(status_code=401, detail="인증이 필요합니다")
     
-    schedule = db.query(SupplySchedule).filter(SupplySchedule.id == schedule_id).first()
+    schedule = await db.get(SupplySchedule, schedule_id)
     if not schedule:
         raise HTTPException(status_code=404, detail="공급 일정을 찾을 수 없습니다")
     
@@ -3033,7 +3119,7 @@ async def update_supply_schedule(
     if schedule_update.notes:
         schedule.notes = schedule_update.notes
     
-    db.commit()
+    await db.commit()
     
     return {"message": "공급 일정이 업데이트되었습니다"}
 
@@ -3042,16 +3128,15 @@ async def update_supply_schedule(
 async def create_document_work(
     order_id: int,
     document: DocumentWorkCreate,
-    access_token: str = Cookie(None),
-    db: Session = Depends(get_db)
+    user: Optional[UserIdentity] = Depends(get_cookie_user_write),
+    db: AsyncSession = Depends(get_write_db)
 ):
     """주문에 대한 문서 작업을 생성합니다."""
-    user = get_current_user_from_cookie(access_token)
     if not user:
         raise HTTPException(status_code=401, detail="인증이 필요합니다")
     
     # 주문 존재 확인
-    order = db.query(Order).filter(Order.id == order_id).first()
+    order = await db.get(Order, order_id)
     if not order:
         raise HTTPException(status_code=404, detail="주문을 찾을 수 없습니다")
     
@@ -3066,8 +3151,8 @@ async def create_document_work(
     )
     
     db.add(db_document)
-    db.commit()
-    db.refresh(db_document)
+    await db.commit()
+    await db.refresh(db_document)
     
     return {"message": "문서 작업이 생성되었습니다", "document_id": db_document.id}
 
@@ -3075,15 +3160,14 @@ async def create_document_work(
 @app.get("/api/orders/{order_id}/document-works")
 async def get_document_works(
     order_id: int,
-    access_token: str = Cookie(None),
-    db: Session = Depends(get_db)
+    user: Optional[UserIdentity] = Depends(get_cookie_user_read),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """주문의 문서 작업 목록을 조회합니다."""
-    user = get_current_user_from_cookie(access_token)
     if not user:
         raise HTTPException(status_code=401, detail="인증이 필요합니다")
     
-    documents = db.query(DocumentWork).filter(DocumentWork.order_id == order_id).all()
+    documents = (await db.scalars(select(DocumentWork).where(DocumentWork.order_id == order_id))).all()
     
     return {
         "documents": [
@@ -3107,15 +3191,14 @@ async def get_document_works(
 async def update_order_status(
     order_id: int,
     status_update: OrderUpdate,
-    access_token: str = Cookie(None),
-    db: Session = Depends(get_db)
+    user: Optional[UserIdentity] = Depends(get_cookie_user_write),
+    db: AsyncSession = Depends(get_write_db)
 ):
     """주문 상태를 업데이트합니다."""
-    user = get_current_user_from_cookie(access_token)
     if not user:
         raise HTTPException(status_code=401, detail="인증이 필요합니다")
     
-    order = db.query(Order).filter(Order.id == order_id).first()
+    order = await db.get(Order, order_id)
     if not order:
         raise HTTPException(status_code=404, detail="주문을 찾을 수 없습니다")
     
@@ -3133,7 +3216,7 @@ async def update_order_status(
     if status_update.notes:
         order.notes = status_update.notes
     
-    db.commit()
+    await db.commit()
     
     return {"message": "주문 상태가 업데이트되었습니다"}
 
@@ -3141,15 +3224,14 @@ async def update_order_status(
 @app.delete("/api/orders/{order_id}")
 async def delete_order(
     order_id: int,
-    access_token: str = Cookie(None),
-    db: Session = Depends(get_db)
+    user: Optional[UserIdentity] = Depends(get_cookie_user_write),
+    db: AsyncSession = Depends(get_write_db)
 ):
     """주문을 삭제합니다."""
-    user = get_current_user_from_cookie(access_token)
     if not user:
         raise HTTPException(status_code=401, detail="인증이 필요합니다")
     
-    order = db.query(Order).filter(Order.id == order_id).first()
+    order = await db.get(Order, order_id)
     if not order:
         raise HTTPException(status_code=404, detail="주문을 찾을 수 없습니다")
     
@@ -3159,20 +3241,20 @@ async def delete_order(
     
     # 관련 데이터 삭제 (CASCADE 설정으로 자동 삭제되지만 명시적으로 처리)
     # 주문 아이템 삭제
-    db.query(OrderItem).filter(OrderItem.order_id == order_id).delete()
+    await db.execute(delete(OrderItem).where(OrderItem.order_id == order_id))
     
     # 공급 일정 삭제
-    db.query(SupplySchedule).filter(SupplySchedule.order_id == order_id).delete()
+    await db.execute(delete(SupplySchedule).where(SupplySchedule.order_id == order_id))
     
     # 선납금 삭제
-    db.query(AdvancePayment).filter(AdvancePayment.order_id == order_id).delete()
+    await db.execute(delete(AdvancePayment).where(AdvancePayment.order_id == order_id))
     
     # 문서 작업 삭제
-    db.query(DocumentWork).filter(DocumentWork.order_id == order_id).delete()
+    await db.execute(delete(DocumentWork).where(DocumentWork.order_id == order_id))
     
-    # 주문 삭제
-    db.delete(order)
-    db.commit()
+    # 주문 삭제 (ORM delete는 cascade 컬렉션을 지연 로딩하므로 직접 DELETE 실행)
+    await db.execute(delete(Order).where(Order.id == order_id))
+    await db.commit()
     
     return {"message": "주문이 삭제되었습니다"}
 
@@ -3181,15 +3263,14 @@ async def delete_order(
 async def update_document_work(
     document_id: int,
     document_update: DocumentWorkUpdate,
-    access_token: str = Cookie(None),
-    db: Session = Depends(get_db)
+    user: Optional[UserIdentity] = Depends(get_cookie_user_write),
+    db: AsyncSession = Depends(get_write_db)
 ):
     """문서 작업을 업데이트합니다."""
-    user = get_current_user_from_cookie(access_token)
     if not user:
         raise HTTPException(status_code=401, detail="인증이 필요합니다")
     
-    document = db.query(DocumentWork).filter(DocumentWork.id == document_id).first()
+    document = await db.get(DocumentWork, document_id)
     if not document:
         raise HTTPException(status_code=404, detail="문서 작업을 찾을 수 없습니다")
     
@@ -3210,169 +3291,17 @@ async def update_document_work(
     if document_update.file_path:
         document.file_path = document_update.file_path
     
-    db.commit()
+    await db.commit()
     
     return {"message": "문서 작업이 업데이트되었습니다"}
 
 
 
 
-# 재고 거래 시 선납금 자동 차감
-def auto_deduct_prepayment(db: Session, supplier_id: int, amount: float, stock_transaction_id: int, user_id: int):
-    """재고 거래 시 선납금을 자동으로 차감합니다."""
-    # 선납금 잔액 확인
-    balance = db.query(PrepaymentBalance).filter(
-        PrepaymentBalance.supplier_id == supplier_id
-    ).first()
-    
-    if not balance or balance.balance <= 0:
-        return False  # 선납금 없음
-    
-    # 사용할 금액 결정 (잔액과 요청 금액 중 작은 값)
-    deduct_amount = min(balance.balance, amount)
-    
-    if deduct_amount > 0:
-        # 선납금 사용 거래 생성
-        payment = PaymentTransaction(
-            supplier_id=supplier_id,
-            user_id=user_id,
-            stock_transaction_id=stock_transaction_id,
-            payment_type="settlement",
-            amount=-deduct_amount,
-            payment_method="prepayment",
-            payment_date=datetime.utcnow(),
-            notes=f"재고 거래 #{stock_transaction_id} 자동 차감",
-            status="completed"
-        )
-        
-        db.add(payment)
-        
-        # 잔액 업데이트
-        update_prepayment_balance(db, supplier_id, deduct_amount, "subtract")
-        
-        return True
-    
-    return False
-
-def update_prepayment_balance(db: Session, supplier_id: int, amount: float, operation: str):
-    """선납금 잔액을 업데이트합니다."""
-    balance = db.query(PrepaymentBalance).filter(
-        PrepaymentBalance.supplier_id == supplier_id
-    ).first()
-    
-    if not balance:
-        # 새로 생성
-        balance = PrepaymentBalance(
-            supplier_id=supplier_id,
-            balance=amount if operation == "add" else 0,
-            total_prepaid=amount if operation == "add" else 0,
-            total_used=0 if operation == "add" else amount
-        )
-        db.add(balance)
-    else:
-        # 기존 잔액 업데이트
-        if operation == "add":
-            balance.balance += amount
-            balance.total_prepaid += amount
-        else:  # subtract
-            balance.balance -= amount
-            balance.total_used += amount
-        
-        balance.last_updated = datetime.utcnow()
-    
-    db.commit()
-
-def migrate_create_payment_tables():
-    """결제 관련 테이블들을 생성합니다."""
-    try:
-        from database import SessionLocal
-        db = SessionLocal()
-        
-        print("결제 관련 테이블들을 생성하는 중...")
-        
-        # PaymentTransaction 테이블 생성
-        db.execute(text("""
-            CREATE TABLE IF NOT EXISTS payment_transactions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                supplier_id INTEGER NOT NULL,
-                user_id INTEGER NOT NULL,
-                stock_transaction_id INTEGER,
-                payment_type VARCHAR(20) NOT NULL,
-                amount REAL NOT NULL,
-                currency VARCHAR(3) DEFAULT 'KRW',
-                status VARCHAR(20) DEFAULT 'pending',
-                payment_method VARCHAR(50),
-                payment_date DATETIME,
-                due_date DATETIME,
-                reference_number VARCHAR(100),
-                notes TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (supplier_id) REFERENCES suppliers (id),
-                FOREIGN KEY (user_id) REFERENCES users (id),
-                FOREIGN KEY (stock_transaction_id) REFERENCES stock_transactions (id)
-            )
-        """))
-        
-        # PaymentSchedule 테이블 생성
-        db.execute(text("""
-            CREATE TABLE IF NOT EXISTS payment_schedules (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                supplier_id INTEGER NOT NULL,
-                user_id INTEGER NOT NULL,
-                stock_transaction_id INTEGER,
-                total_amount REAL NOT NULL,
-                paid_amount REAL DEFAULT 0,
-                remaining_amount REAL NOT NULL,
-                due_date DATETIME NOT NULL,
-                payment_terms VARCHAR(50),
-                status VARCHAR(20) DEFAULT 'pending',
-                is_active BOOLEAN DEFAULT 1,
-                notes TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (supplier_id) REFERENCES suppliers (id),
-                FOREIGN KEY (user_id) REFERENCES users (id),
-                FOREIGN KEY (stock_transaction_id) REFERENCES stock_transactions (id)
-            )
-        """))
-        
-        # PrepaymentBalance 테이블 생성
-        db.execute(text("""
-            CREATE TABLE IF NOT EXISTS prepayment_balances (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                supplier_id INTEGER NOT NULL UNIQUE,
-                balance REAL DEFAULT 0,
-                total_prepaid REAL DEFAULT 0,
-                total_used REAL DEFAULT 0,
-                currency VARCHAR(3) DEFAULT 'KRW',
-                is_active BOOLEAN DEFAULT 1,
-                last_updated DATETIME DEFAULT CURRENT_TIMESTAMP,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (supplier_id) REFERENCES suppliers (id)
-            )
-        """))
-        
-        # 인덱스 생성
-        db.execute(text("CREATE INDEX IF NOT EXISTS idx_payment_transactions_supplier ON payment_transactions (supplier_id)"))
-        db.execute(text("CREATE INDEX IF NOT EXISTS idx_payment_transactions_date ON payment_transactions (payment_date)"))
-        db.execute(text("CREATE INDEX IF NOT EXISTS idx_payment_schedules_due_date ON payment_schedules (due_date)"))
-        db.execute(text("CREATE INDEX IF NOT EXISTS idx_payment_schedules_status ON payment_schedules (status)"))
-        
-        db.commit()
-        db.close()
-        
-        print("결제 관련 테이블 생성 완료!")
-        return True
-    except Exception as e:
-        print(f"결제 테이블 생성 실패: {e}")
-        return False
-
 # 주문관리 페이지
 @app.get("/orders", response_class=HTMLResponse)
-async def orders_page(request: Request, access_token: str = Cookie(None)):
+async def orders_page(request: Request, user: Optional[UserIdentity] = Depends(get_cookie_user_read)):
     """주문관리 페이지"""
-    user = get_current_user_from_cookie(access_token)
     if not user:
         return RedirectResponse(url="/login", status_code=302)
     
@@ -3382,32 +3311,5 @@ async def orders_page(request: Request, access_token: str = Cookie(None)):
     })
 
 if __name__ == "__main__":
-    # 데이터베이스 마이그레이션 실행
-    print("데이터베이스 마이그레이션을 확인하는 중...")
-    
-    # 모든 테이블 존재 여부 확인 및 생성
-    ensure_all_tables_exist()
-    
-    # 주문 관련 테이블이 없으면 생성
-    if not check_order_tables_exist():
-        print("주문 관련 테이블이 없습니다. 생성합니다.")
-        Base.metadata.create_all(bind=engine)
-        print("주문 관련 테이블 생성 완료!")
-    else:
-        print("주문 관련 테이블이 이미 존재합니다.")
-    
-    # 결제 관련 테이블이 없으면 생성
-    if not check_payment_tables_exist():
-        print("결제 관련 테이블이 없습니다. 생성합니다.")
-        migrate_create_payment_tables()
-    else:
-        print("결제 관련 테이블이 이미 존재합니다.")
-    
-    # 거래처 정렬 순서 컬럼이 없으면 추가
-    if not check_supplier_sort_order_column_exists():
-        print("거래처 정렬 순서 컬럼이 없습니다. 추가합니다.")
-        migrate_add_supplier_sort_order()
-    else:
-        print("거래처 정렬 순서 컬럼이 이미 존재합니다.")
-    
+    import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8100)
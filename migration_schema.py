@@ -0,0 +1,333 @@
+"""
+마이그레이션 고정 스키마
+마이그레이션이 만드는 테이블을 그 마이그레이션을 추가한 시점의 정의로 고정해 둔 Core 테이블입니다.
+models.py가 나중에 바뀌어도 이전 버전 데이터베이스는 항상 같은 순서로 같은 스키마 변경을 거칩니다.
+(이후 마이그레이션의 컬럼/인덱스 추가는 각 마이그레이션의 SQL에 있음)
+
+모델을 바꿀 때는 이 파일의 테이블을 고치지 말고 새 마이그레이션을 추가합니다.
+DDL에 영향이 없는 Python 기본값(default, onupdate)과 관계는 생략합니다.
+"""
+
+from sqlalchemy import MetaData, Table, Column, Integer, String, Float, Boolean, Date, DateTime, ForeignKey, Text, UniqueConstraint, Index
+
+metadata = MetaData()
+
+# 적용된 마이그레이션 기록 (마이그레이션 실행기가 관리)
+schema_version = Table(
+    "schema_version", metadata,
+    Column("version", Integer, primary_key=True, autoincrement=False),
+    Column("name", String(100), nullable=False),
+    Column("applied_at", DateTime(timezone=True)),
+)
+
+# 마이그레이션 1 (create_tables) - 기본 테이블
+users = Table(
+    "users", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("username", String(50), unique=True, index=True, nullable=False),
+    Column("email", String(100), unique=True, index=True, nullable=False),
+    Column("full_name", String(100), nullable=False),
+    Column("hashed_password", String(255), nullable=False),
+    Column("is_approved", Boolean),
+    Column("is_admin", Boolean),
+    Column("created_at", DateTime(timezone=True)),
+    Column("updated_at", DateTime(timezone=True)),
+)
+
+products = Table(
+    "products", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("name", String(100), nullable=False, index=True),
+    Column("description", Text),
+    Column("price", Float, nullable=False),
+    Column("stock_quantity", Integer),
+    Column("safety_stock", Integer),
+    Column("safety_stock_level", String(20)),
+    Column("category", String(50), index=True),
+    Column("sort_order", Integer),
+    Column("created_at", DateTime(timezone=True)),
+    Column("updated_at", DateTime(timezone=True)),
+)
+
+suppliers = Table(
+    "suppliers", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("name", String(100), nullable=False, index=True),
+    Column("contact_person", String(100)),
+    Column("phone", String(20)),
+    Column("email", String(100)),
+    Column("address", Text),
+    Column("supplier_type", String(20), nullable=False),
+    Column("sort_order", Integer),
+    Column("is_active", Boolean),
+    Column("created_at", DateTime(timezone=True)),
+    Column("updated_at", DateTime(timezone=True)),
+)
+
+stock_transactions = Table(
+    "stock_transactions", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("product_id", Integer, ForeignKey("products.id"), nullable=False),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("supplier_id", Integer, ForeignKey("suppliers.id"), nullable=True),
+    Column("transaction_type", String(10), nullable=False),
+    Column("quantity", Integer, nullable=False),
+    Column("lot_number", String(50), nullable=True),
+    Column("location", String(100), nullable=True),
+    Column("notes", Text),
+    Column("created_at", DateTime(timezone=True)),
+)
+
+category_orders = Table(
+    "category_orders", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("category_name", String(50), unique=True, nullable=False, index=True),
+    Column("sort_order", Integer, nullable=False),
+    Column("created_at", DateTime(timezone=True)),
+    Column("updated_at", DateTime(timezone=True)),
+)
+
+audit_logs = Table(
+    "audit_logs", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("action", String(50), nullable=False),
+    Column("target_type", String(50), nullable=False),
+    Column("target_id", Integer, nullable=True),
+    Column("details", Text),
+    Column("ip_address", String(45)),
+    Column("user_agent", Text),
+    Column("created_at", DateTime(timezone=True)),
+)
+
+payment_transactions = Table(
+    "payment_transactions", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("supplier_id", Integer, ForeignKey("suppliers.id"), nullable=False),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("stock_transaction_id", Integer, ForeignKey("stock_transactions.id"), nullable=True),
+    Column("payment_type", String(20), nullable=False),
+    Column("amount", Float, nullable=False),
+    Column("currency", String(3)),
+    Column("status", String(20)),
+    Column("payment_method", String(50)),
+    Column("payment_date", DateTime(timezone=True)),
+    Column("due_date", DateTime(timezone=True)),
+    Column("reference_number", String(100)),
+    Column("notes", Text),
+    Column("created_at", DateTime(timezone=True)),
+    Column("updated_at", DateTime(timezone=True)),
+)
+
+payment_schedules = Table(
+    "payment_schedules", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("supplier_id", Integer, ForeignKey("suppliers.id"), nullable=False),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("stock_transaction_id", Integer, ForeignKey("stock_transactions.id"), nullable=True),
+    Column("total_amount", Float, nullable=False),
+    Column("paid_amount", Float),
+    Column("remaining_amount", Float, nullable=False),
+    Column("due_date", DateTime(timezone=True), nullable=False),
+    Column("payment_terms", String(50)),
+    Column("status", String(20)),
+    Column("is_active", Boolean),
+    Column("notes", Text),
+    Column("created_at", DateTime(timezone=True)),
+    Column("updated_at", DateTime(timezone=True)),
+)
+
+prepayment_balances = Table(
+    "prepayment_balances", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("supplier_id", Integer, ForeignKey("suppliers.id"), nullable=False, unique=True),
+    Column("balance", Float),
+    Column("total_prepaid", Float),
+    Column("total_used", Float),
+    Column("currency", String(3)),
+    Column("is_active", Boolean),
+    Column("last_updated", DateTime(timezone=True)),
+    Column("created_at", DateTime(timezone=True)),
+)
+
+orders = Table(
+    "orders", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("order_number", String(50), unique=True, nullable=False, index=True),
+    Column("supplier_id", Integer, ForeignKey("suppliers.id"), nullable=False),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("order_date", DateTime(timezone=True), nullable=False),
+    Column("delivery_date", DateTime(timezone=True)),
+    Column("total_amount", Float, nullable=False),
+    Column("currency", String(3)),
+    Column("status", String(20)),
+    Column("priority", String(10)),
+    Column("payment_type", String(10)),
+    Column("notes", Text),
+    Column("created_at", DateTime(timezone=True)),
+    Column("updated_at", DateTime(timezone=True)),
+)
+
+order_items = Table(
+    "order_items", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("order_id", Integer, ForeignKey("orders.id"), nullable=False),
+    Column("product_id", Integer, ForeignKey("products.id"), nullable=False),
+    Column("quantity", Integer, nullable=False),
+    Column("unit_price", Float, nullable=False),
+    Column("total_price", Float, nullable=False),
+    Column("supplied_quantity", Integer),
+    Column("remaining_quantity", Integer, nullable=False),
+    Column("notes", Text),
+    Column("created_at", DateTime(timezone=True)),
+    Column("updated_at", DateTime(timezone=True)),
+)
+
+advance_payments = Table(
+    "advance_payments", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("order_id", Integer, ForeignKey("orders.id"), nullable=False),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("amount", Float, nullable=False),
+    Column("currency", String(3)),
+    Column("payment_method", String(50)),
+    Column("status", String(20)),
+    Column("payment_date", DateTime(timezone=True)),
+    Column("reference_number", String(100)),
+    Column("notes", Text),
+    Column("created_at", DateTime(timezone=True)),
+    Column("updated_at", DateTime(timezone=True)),
+)
+
+supply_schedules = Table(
+    "supply_schedules", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("order_id", Integer, ForeignKey("orders.id"), nullable=False),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("schedule_date", DateTime(timezone=True), nullable=False),
+    Column("planned_quantity", Integer, nullable=False),
+    Column("actual_quantity", Integer),
+    Column("status", String(20)),
+    Column("notes", Text),
+    Column("created_at", DateTime(timezone=True)),
+    Column("updated_at", DateTime(timezone=True)),
+)
+
+document_works = Table(
+    "document_works", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("order_id", Integer, ForeignKey("orders.id"), nullable=False),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("document_type", String(50), nullable=False),
+    Column("status", String(20)),
+    Column("start_date", DateTime(timezone=True)),
+    Column("completion_date", DateTime(timezone=True)),
+    Column("due_date", DateTime(timezone=True)),
+    Column("notes", Text),
+    Column("file_path", String(500)),
+    Column("created_at", DateTime(timezone=True)),
+    Column("updated_at", DateTime(timezone=True)),
+)
+
+BASE_TABLES = [
+    users, products, suppliers, stock_transactions, category_orders, audit_logs,
+    payment_transactions, payment_schedules, prepayment_balances,
+    orders, order_items, advance_payments, supply_schedules, document_works,
+]
+
+# 마이그레이션 8 (create_lot_balances) - 자동 LOT 배정 컬럼은 마이그레이션 10에서 추가
+lot_balances = Table(
+    "lot_balances", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("product_id", Integer, ForeignKey("products.id"), nullable=False),
+    Column("lot_number", String(50), nullable=False),
+    Column("quantity", Integer, nullable=False),
+    Column("updated_at", DateTime(timezone=True)),
+    UniqueConstraint("product_id", "lot_number", name="uq_lot_balances_product_lot"),
+)
+
+# 마이그레이션 11 (create_inventory_snapshots)
+inventory_snapshots = Table(
+    "inventory_snapshots", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("snapshot_date", Date, nullable=False, unique=True),
+    Column("line_count", Integer, nullable=False),
+    Column("created_at", DateTime(timezone=True)),
+)
+
+inventory_snapshot_lines = Table(
+    "inventory_snapshot_lines", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("snapshot_date", Date, nullable=False),
+    Column("product_id", Integer, ForeignKey("products.id"), nullable=False),
+    Column("lot_number", String(50), nullable=False),
+    Column("quantity", Integer, nullable=False),
+    UniqueConstraint("snapshot_date", "product_id", "lot_number", name="uq_inventory_snapshot_lines_date_product_lot"),
+)
+
+# 마이그레이션 12 (create_stock_reconciliation_runs)
+stock_reconciliation_runs = Table(
+    "stock_reconciliation_runs", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("mode", String(20), nullable=False),
+    Column("dry_run", Boolean, nullable=False),
+    Column("started_at", DateTime(timezone=True), nullable=False),
+    Column("max_transaction_id", Integer, nullable=False),
+    Column("checked_count", Integer, nullable=False),
+    Column("drift_count", Integer, nullable=False),
+    Column("fixed_count", Integer, nullable=False),
+    Column("verified", Boolean, nullable=False),
+    Column("finished_at", DateTime(timezone=True)),
+)
+
+# 마이그레이션 16 (create_daily_stock_rollups)
+daily_stock_rollups = Table(
+    "daily_stock_rollups", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("day", Date, nullable=False),
+    Column("product_id", Integer, ForeignKey("products.id"), nullable=False),
+    Column("supplier_id", Integer, nullable=False),
+    Column("transaction_type", String(10), nullable=False),
+    Column("quantity", Integer, nullable=False),
+    Column("transaction_count", Integer, nullable=False),
+    UniqueConstraint("day", "product_id", "supplier_id", "transaction_type", name="uq_daily_stock_rollups_key"),
+    Index("ix_daily_stock_rollups_product_day", "product_id", "day"),
+)
+
+# 마이그레이션 15 (create_search_indexes) - SQLite FTS5 trigram 검색 테이블과 동기화 트리거
+SQLITE_SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS product_search USING fts5("
+    "name, category, content='products', content_rowid='id', tokenize='trigram')",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS transaction_search USING fts5("
+    "lot_number, notes, content='stock_transactions', content_rowid='id', tokenize='trigram')",
+    """CREATE TRIGGER IF NOT EXISTS product_search_insert AFTER INSERT ON products BEGIN
+        INSERT INTO product_search(rowid, name, category) VALUES (new.id, new.name, new.category);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS product_search_delete AFTER DELETE ON products BEGIN
+        INSERT INTO product_search(product_search, rowid, name, category) VALUES ('delete', old.id, old.name, old.category);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS product_search_update AFTER UPDATE OF name, category ON products BEGIN
+        INSERT INTO product_search(product_search, rowid, name, category) VALUES ('delete', old.id, old.name, old.category);
+        INSERT INTO product_search(rowid, name, category) VALUES (new.id, new.name, new.category);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS transaction_search_insert AFTER INSERT ON stock_transactions BEGIN
+        INSERT INTO transaction_search(rowid, lot_number, notes) VALUES (new.id, new.lot_number, new.notes);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS transaction_search_delete AFTER DELETE ON stock_transactions BEGIN
+        INSERT INTO transaction_search(transaction_search, rowid, lot_number, notes) VALUES ('delete', old.id, old.lot_number, old.notes);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS transaction_search_update AFTER UPDATE OF lot_number, notes ON stock_transactions BEGIN
+        INSERT INTO transaction_search(transaction_search, rowid, lot_number, notes) VALUES ('delete', old.id, old.lot_number, old.notes);
+        INSERT INTO transaction_search(rowid, lot_number, notes) VALUES (new.id, new.lot_number, new.notes);
+    END""",
+    "INSERT INTO product_search(product_search) VALUES ('rebuild')",
+    "INSERT INTO transaction_search(transaction_search) VALUES ('rebuild')",
+]
+
+# 마이그레이션 15 - PostgreSQL pg_trgm GIN 인덱스 (확장을 사용할 수 있을 때만)
+POSTGRESQL_SEARCH_DDL = [
+    "CREATE INDEX IF NOT EXISTS ix_products_name_trgm ON products USING gin (name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_products_category_trgm ON products USING gin (category gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_stock_transactions_lot_number_trgm ON stock_transactions USING gin (lot_number gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_stock_transactions_notes_trgm ON stock_transactions USING gin (notes gin_trgm_ops)",
+]
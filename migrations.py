@@ -0,0 +1,342 @@
+"""
+스키마 마이그레이션 실행기
+schema_version 테이블에 적용된 마이그레이션 번호를 기록하고,
+등록된 마이그레이션 중 아직 적용되지 않은 것만 순서대로 한 번씩 실행합니다.
+각 마이그레이션은 하나의 트랜잭션에서 실행되며, 실패하면 롤백되고 이후 마이그레이션은 실행하지 않습니다.
+"""
+
+from contextlib import contextmanager
+from datetime import datetime, timezone, timedelta
+
+from sqlalchemy import inspect, select, func, text, bindparam, Integer, Date, DateTime
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+import migration_schema as schema
+
+# PostgreSQL에서 여러 프로세스가 동시에 시작할 때 마이그레이션을 직렬화하는 잠금 키
+MIGRATION_LOCK_KEY = 4731
+
+# 각 마이그레이션은 models.py나 다른 모듈의 현재 코드 대신 migration_schema의 고정 테이블과
+# 아래의 SQL만 사용하므로, 나중에 모델이 바뀌어도 이전 버전에서의 업그레이드 결과가 달라지지 않음
+
+def get_kst_now():
+    return datetime.now(timezone(timedelta(hours=9)))
+
+def get_column_names(connection, table_name: str):
+    """테이블의 컬럼 목록 조회"""
+    return {column["name"] for column in inspect(connection).get_columns(table_name)}
+
+def add_column_if_missing(connection, table_name: str, column_name: str, column_type):
+    """컬럼이 테이블에 없으면 추가하고 추가 여부를 반환합니다."""
+    if column_name in get_column_names(connection, table_name):
+        return False
+    compiled_type = column_type.compile(dialect=connection.dialect)
+    connection.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {compiled_type}"))
+    return True
+
+def create_indexes(connection, statements):
+    """CREATE INDEX IF NOT EXISTS 문장들을 실행합니다."""
+    for statement in statements:
+        connection.execute(text(statement))
+
+def create_tables(connection):
+    """기본 테이블 중 없는 테이블을 생성합니다."""
+    schema.metadata.create_all(bind=connection, tables=schema.BASE_TABLES)
+
+def add_product_sort_order(connection):
+    """products 테이블에 sort_order 컬럼을 추가하고 카테고리별 순서를 설정합니다."""
+    if "sort_order" in get_column_names(connection, "products"):
+        return
+    connection.execute(text("ALTER TABLE products ADD COLUMN sort_order INTEGER DEFAULT 0"))
+
+    # 카테고리별 순서 카운터
+    category_counters = {}
+    products = connection.execute(text("SELECT id, category FROM products ORDER BY category, name")).fetchall()
+    for product_id, category in products:
+        category_key = category or '미분류'
+        category_counters[category_key] = category_counters.get(category_key, 0) + 1
+        connection.execute(text("UPDATE products SET sort_order = :sort_order WHERE id = :product_id"),
+                           {"sort_order": category_counters[category_key], "product_id": product_id})
+    print(f"제품 {len(products)}개의 순서가 설정되었습니다.")
+
+def add_supplier_sort_order(connection):
+    """suppliers 테이블에 sort_order 컬럼을 추가하고 유형별 순서를 설정합니다."""
+    if "sort_order" in get_column_names(connection, "suppliers"):
+        return
+    connection.execute(text("ALTER TABLE suppliers ADD COLUMN sort_order INTEGER DEFAULT 0"))
+
+    # 유형별 순서 카운터
+    type_counters = {}
+    suppliers = connection.execute(text("SELECT id, supplier_type FROM suppliers ORDER BY supplier_type, name")).fetchall()
+    for supplier_id, supplier_type in suppliers:
+        type_counters[supplier_type] = type_counters.get(supplier_type, 0) + 1
+        connection.execute(text("UPDATE suppliers SET sort_order = :sort_order WHERE id = :supplier_id"),
+                           {"sort_order": type_counters[supplier_type], "supplier_id": supplier_id})
+    print(f"거래처 {len(suppliers)}개의 순서가 설정되었습니다.")
+
+def create_payment_indexes(connection):
+    """결제 관련 테이블 인덱스를 생성합니다."""
+    connection.execute(text("CREATE INDEX IF NOT EXISTS idx_payment_transactions_supplier ON payment_transactions (supplier_id)"))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS idx_payment_transactions_date ON payment_transactions (payment_date)"))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS idx_payment_schedules_due_date ON payment_schedules (due_date)"))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS idx_payment_schedules_status ON payment_schedules (status)"))
+
+def set_default_supplier_type(connection):
+    """유형이 없는 거래처를 출고처('out')로 설정합니다."""
+    result = connection.execute(text(
+        "UPDATE suppliers SET supplier_type = 'out' WHERE supplier_type IS NULL OR supplier_type = ''"
+    ))
+    if result.rowcount:
+        print(f"거래처 {result.rowcount}개의 유형을 '출고처'로 설정했습니다.")
+
+def initialize_category_orders(connection):
+    """카테고리 순서 데이터가 없으면 현재 카테고리로 순서를 설정합니다."""
+    if connection.scalar(text("SELECT COUNT(*) FROM category_orders")):
+        return
+    categories = [row[0] for row in connection.execute(text(
+        "SELECT DISTINCT category FROM products WHERE category IS NOT NULL ORDER BY category"
+    ))]
+
+    # 미분류 카테고리도 추가
+    categories.append('미분류')
+    now = get_kst_now()
+    connection.execute(schema.category_orders.insert(), [
+        {"category_name": category, "sort_order": index + 1, "created_at": now, "updated_at": now}
+        for index, category in enumerate(categories)
+    ])
+    print(f"카테고리 {len(categories)}개의 순서가 설정되었습니다.")
+
+# 조회 성능용 복합 인덱스 (거래 내역 최신순 created_at 인덱스는 마이그레이션 14에서 (created_at, id)로 교체)
+QUERY_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_stock_transactions_product_lot_type ON stock_transactions (product_id, lot_number, transaction_type)",
+    "CREATE INDEX IF NOT EXISTS ix_stock_transactions_created_at ON stock_transactions (created_at)",
+    "CREATE INDEX IF NOT EXISTS ix_stock_transactions_supplier_created_at ON stock_transactions (supplier_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS ix_audit_logs_created_at ON audit_logs (created_at)",
+    "CREATE INDEX IF NOT EXISTS ix_orders_status_created_at ON orders (status, created_at)",
+]
+
+def create_query_indexes(connection):
+    """조회 성능용 복합 인덱스를 생성합니다. (실행 계획 확인은 마이그레이션 완료 후 시작 시 수행)"""
+    create_indexes(connection, QUERY_INDEXES)
+
+# (제품, LOT)별 입고 합계 - 출고 합계 (LOT 목록은 처음 기록된 순서)
+FILL_LOT_BALANCES = text("""
+    INSERT INTO lot_balances (product_id, lot_number, quantity, updated_at)
+    SELECT product_id, lot_number, SUM(CASE WHEN transaction_type = 'in' THEN quantity ELSE -quantity END), :now
+    FROM stock_transactions
+    WHERE lot_number IS NOT NULL
+    GROUP BY product_id, lot_number
+    ORDER BY MIN(id)
+""").bindparams(bindparam("now", type_=DateTime(timezone=True)))
+
+def create_lot_balances(connection):
+    """LOT별 재고 집계 테이블을 생성하고 거래 내역으로 채웁니다."""
+    schema.lot_balances.create(bind=connection, checkfirst=True)
+    if connection.dialect.name == "postgresql":
+        # 채우는 동안 다른 트랜잭션의 재고 이동이 반영되지 않고 사라지지 않도록 집계 테이블 쓰기를 막음
+        connection.execute(text("LOCK TABLE lot_balances IN EXCLUSIVE MODE"))
+    connection.execute(text("DELETE FROM lot_balances"))
+    connection.execute(FILL_LOT_BALANCES, {"now": get_kst_now()})
+    count = connection.scalar(text("SELECT COUNT(*) FROM lot_balances"))
+    print(f"LOT 재고 집계 {count}건이 생성되었습니다.")
+
+def add_product_version(connection):
+    """products 테이블에 재고 변경 버전 컬럼을 추가합니다."""
+    if "version" in get_column_names(connection, "products"):
+        return
+    connection.execute(text("ALTER TABLE products ADD COLUMN version INTEGER NOT NULL DEFAULT 1"))
+
+# 자동 LOT 배정 우선순위 (재고가 남은 LOT만: FIFO는 최초 입고순, FEFO는 유통기한순)
+LOT_ALLOCATION_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_lot_balances_fifo ON lot_balances (product_id, first_received_at, id) WHERE quantity > 0",
+    "CREATE INDEX IF NOT EXISTS ix_lot_balances_fefo ON lot_balances (product_id, expiry_date, first_received_at, id) WHERE quantity > 0",
+]
+
+# LOT 재고와 함께 최초 입고 시각, 가장 빠른 유통기한을 채움 (빈 LOT 번호 제외)
+REFILL_LOT_BALANCES = text("""
+    INSERT INTO lot_balances (product_id, lot_number, quantity, first_received_at, expiry_date, updated_at)
+    SELECT product_id, lot_number, SUM(CASE WHEN transaction_type = 'in' THEN quantity ELSE -quantity END),
+           MIN(CASE WHEN transaction_type = 'in' THEN created_at END), MIN(expiry_date), :now
+    FROM stock_transactions
+    WHERE lot_number IS NOT NULL AND lot_number != ''
+    GROUP BY product_id, lot_number
+    ORDER BY MIN(id)
+""").bindparams(bindparam("now", type_=DateTime(timezone=True)))
+
+def add_lot_allocation_columns(connection):
+    """자동 LOT 배정용 컬럼(최초 입고 시각, 유통기한)과 우선순위 인덱스를 추가합니다."""
+    add_column_if_missing(connection, "stock_transactions", "expiry_date", Date())
+    added = add_column_if_missing(connection, "lot_balances", "first_received_at", DateTime(timezone=True))
+    add_column_if_missing(connection, "lot_balances", "expiry_date", Date())
+    create_indexes(connection, LOT_ALLOCATION_INDEXES)
+    if added:
+        # 기존 LOT의 최초 입고 시각을 거래 내역에서 채움
+        if connection.dialect.name == "postgresql":
+            connection.execute(text("LOCK TABLE lot_balances IN EXCLUSIVE MODE"))
+        connection.execute(text("DELETE FROM lot_balances"))
+        connection.execute(REFILL_LOT_BALANCES, {"now": get_kst_now()})
+        count = connection.scalar(text("SELECT COUNT(*) FROM lot_balances"))
+        print(f"LOT 재고 집계 {count}건의 최초 입고 시각이 설정되었습니다.")
+
+def create_inventory_snapshots(connection):
+    """기간 마감 재고 스냅샷 테이블을 생성합니다. (스냅샷은 주기 작업에서 생성)"""
+    schema.inventory_snapshots.create(bind=connection, checkfirst=True)
+    schema.inventory_snapshot_lines.create(bind=connection, checkfirst=True)
+
+def create_stock_reconciliation_runs(connection):
+    """재고 수량 검증 실행 기록(증분 검사 기준) 테이블을 생성합니다."""
+    schema.stock_reconciliation_runs.create(bind=connection, checkfirst=True)
+
+# 제품별/LOT별 거래 순서 (재고 카드 범위 조회, 누적 재고 재계산 시 앞 거래 검색)
+LEDGER_ORDER_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_stock_transactions_product_created_at ON stock_transactions (product_id, created_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_stock_transactions_product_lot_created_at ON stock_transactions (product_id, lot_number, created_at, id)",
+]
+
+# 거래 순서(created_at, id)로 본 거래 직후 제품 재고 / LOT 재고 (LOT 번호가 없으면 NULL)
+FILL_RUNNING_BALANCES = text("""
+    UPDATE stock_transactions
+    SET balance_after = balances.balance_after, lot_balance_after = balances.lot_balance_after
+    FROM (
+        SELECT id,
+               SUM(CASE WHEN transaction_type = 'in' THEN quantity ELSE -quantity END)
+                   OVER (PARTITION BY product_id ORDER BY created_at, id) AS balance_after,
+               CASE WHEN lot_number IS NOT NULL AND lot_number != '' THEN
+                   SUM(CASE WHEN transaction_type = 'in' THEN quantity ELSE -quantity END)
+                       OVER (PARTITION BY product_id, lot_number ORDER BY created_at, id)
+               END AS lot_balance_after
+        FROM stock_transactions
+    ) AS balances
+    WHERE stock_transactions.id = balances.id
+""")
+
+def add_running_balances(connection):
+    """거래 후 재고 컬럼과 제품별/LOT별 거래 순서 인덱스를 추가하고 기존 거래의 누적 재고를 채웁니다."""
+    added = add_column_if_missing(connection, "stock_transactions", "balance_after", Integer())
+    add_column_if_missing(connection, "stock_transactions", "lot_balance_after", Integer())
+    create_indexes(connection, LEDGER_ORDER_INDEXES)
+    # 컬럼을 새로 추가했거나 거래 후 재고가 비어 있는 거래가 있으면 전체 계산
+    missing = connection.scalar(text("SELECT id FROM stock_transactions WHERE balance_after IS NULL LIMIT 1"))
+    if added or missing:
+        count = connection.execute(FILL_RUNNING_BALANCES).rowcount
+        print(f"거래 {count}건의 거래 후 재고가 설정되었습니다.")
+
+def add_transaction_keyset_index(connection):
+    """거래 내역 커서 페이지네이션용 (created_at, id) 인덱스를 만들고 기존 created_at 단일 인덱스를 제거합니다."""
+    create_indexes(connection, [
+        "CREATE INDEX IF NOT EXISTS ix_stock_transactions_created_at_id ON stock_transactions (created_at, id)"
+    ])
+    # (created_at, id) 인덱스가 created_at 단독 조회도 처리하므로 중복 인덱스 제거
+    connection.execute(text("DROP INDEX IF EXISTS ix_stock_transactions_created_at"))
+
+def create_search_indexes(connection):
+    """제품명/카테고리, LOT 번호/비고 부분 문자열 검색 인덱스를 만들고 기존 데이터로 채웁니다."""
+    if connection.dialect.name == "sqlite":
+        for statement in schema.SQLITE_SEARCH_DDL:
+            connection.exec_driver_sql(statement)
+        return
+    available = connection.scalar(text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'"))
+    if not available:
+        print("⚠️ pg_trgm 확장을 사용할 수 없어 부분 문자열 검색은 LIKE 순차 검색을 사용합니다.")
+        return
+    try:
+        # 확장 생성 권한이 없을 수 있으므로 세이브포인트 안에서 시도
+        with connection.begin_nested():
+            connection.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    except (ProgrammingError, OperationalError) as e:
+        print(f"⚠️ pg_trgm 확장을 만들 수 없어 부분 문자열 검색은 LIKE 순차 검색을 사용합니다: {e}")
+        return
+    for statement in schema.POSTGRESQL_SEARCH_DDL:
+        connection.exec_driver_sql(statement)
+
+def create_daily_stock_rollups(connection):
+    """daily_stock_rollups 테이블을 만들고 기존 거래 내역으로 채웁니다."""
+    schema.daily_stock_rollups.create(bind=connection, checkfirst=True)
+    # 거래 날짜는 서울 시간 기준 (SQLite는 서울 시간으로 저장된 값의 날짜), 거래처 없음은 0
+    if connection.dialect.name == "postgresql":
+        day = "date(timezone('Asia/Seoul', created_at))"
+    else:
+        day = "date(created_at)"
+    connection.execute(text("DELETE FROM daily_stock_rollups"))
+    connection.execute(text(f"""
+        INSERT INTO daily_stock_rollups (day, product_id, supplier_id, transaction_type, quantity, transaction_count)
+        SELECT {day}, product_id, COALESCE(supplier_id, 0), transaction_type, SUM(quantity), COUNT(*)
+        FROM stock_transactions
+        GROUP BY {day}, product_id, COALESCE(supplier_id, 0), transaction_type
+    """))
+    count = connection.scalar(text("SELECT COUNT(*) FROM daily_stock_rollups"))
+    print(f"일별 입출고 집계 생성 완료: {count}개 집계")
+
+# 마이그레이션 목록 (번호, 이름, 함수) - 새 마이그레이션은 항상 끝에 추가하고 번호를 바꾸지 않음
+# 기존 데이터베이스(schema_version 도입 전)에서도 안전하도록 각 마이그레이션은 현재 상태를 확인한 뒤 변경
+MIGRATIONS = [
+    (1, "create_tables", create_tables),
+    (2, "add_product_sort_order", add_product_sort_order),
+    (3, "add_supplier_sort_order", add_supplier_sort_order),
+    (4, "create_payment_indexes", create_payment_indexes),
+    (5, "set_default_supplier_type", set_default_supplier_type),
+    (6, "initialize_category_orders", initialize_category_orders),
+    (7, "create_query_indexes", create_query_indexes),
+    (8, "create_lot_balances", create_lot_balances),
+    (9, "add_product_version", add_product_version),
+    (10, "add_lot_allocation_columns", add_lot_allocation_columns),
+    (11, "create_inventory_snapshots", create_inventory_snapshots),
+    (12, "create_stock_reconciliation_runs", create_stock_reconciliation_runs),
+    (13, "add_running_balances", add_running_balances),
+    (14, "add_transaction_keyset_index", add_transaction_keyset_index),
+    (15, "create_search_indexes", create_search_indexes),
+    (16, "create_daily_stock_rollups", create_daily_stock_rollups),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version(engine):
+    """현재 스키마 버전을 반환합니다. (schema_version 테이블이 없으면 0)"""
+    try:
+        with engine.connect() as connection:
+            return connection.scalar(select(func.max(schema.schema_version.c.version))) or 0
+    except (OperationalError, ProgrammingError):
+        return 0
+
+@contextmanager
+def migration_transaction(engine):
+    """마이그레이션 한 건을 실행할 트랜잭션 (DDL 포함)"""
+    if engine.dialect.name == "sqlite":
+        # pysqlite는 DDL 전에 트랜잭션을 시작하지 않으므로 직접 BEGIN IMMEDIATE로 쓰기 잠금을 잡음
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+            try:
+                yield connection
+                connection.exec_driver_sql("COMMIT")
+            except Exception:
+                connection.exec_driver_sql("ROLLBACK")
+                raise
+    else:
+        with engine.begin() as connection:
+            if engine.dialect.name == "postgresql":
+                connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+            yield connection
+
+def run_migrations(engine):
+    """적용되지 않은 마이그레이션을 순서대로 실행하고 최종 스키마 버전을 반환합니다."""
+    current_version = get_schema_version(engine)
+    if current_version >= LATEST_VERSION:
+        return current_version
+
+    print(f"스키마 버전 {current_version} -> {LATEST_VERSION} 마이그레이션을 시작합니다...")
+    if current_version == 0:
+        schema.schema_version.create(bind=engine, checkfirst=True)
+
+    for version, name, migrate in MIGRATIONS:
+        if version <= current_version:
+            continue
+        with migration_transaction(engine) as connection:
+            # 다른 프로세스가 먼저 적용했는지 잠금 안에서 다시 확인
+            if connection.scalar(select(schema.schema_version.c.version).where(schema.schema_version.c.version == version)):
+                continue
+            migrate(connection)
+            connection.execute(schema.schema_version.insert().values(version=version, name=name, applied_at=get_kst_now()))
+        print(f"마이그레이션 {version} ({name}) 적용 완료")
+        current_version = version
+
+    return current_version
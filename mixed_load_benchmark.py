@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+혼합 부하 벤치마크 스크립트
+임시 데이터베이스에 거래 내역을 채운 뒤, 느린 엑셀 다운로드 요청과 가벼운 조회 요청을
+동시에 보내 가벼운 요청의 지연 시간(p50/p99)을 측정합니다.
+
+사용법:
+    python mixed_load_benchmark.py --rows 50000 --duration 15 --readers 8
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="혼합 부하 지연 시간 벤치마크")
+    parser.add_argument("--rows", type=int, default=50000, help="생성할 거래 내역 수")
+    parser.add_argument("--products", type=int, default=200, help="생성할 제품 수")
+    parser.add_argument("--duration", type=float, default=15.0, help="측정 시간 (초)")
+    parser.add_argument("--readers", type=int, default=8, help="가벼운 조회 요청 동시 실행 수")
+    parser.add_argument("--exporters", type=int, default=1, help="엑셀 다운로드 동시 실행 수")
+    parser.add_argument("--port", type=int, default=8765)
+    return parser.parse_args()
+
+def seed_database(db_path: str, user_id: int, products: int, rows: int):
+    """벤치마크용 제품과 거래 내역을 생성합니다."""
+    connection = sqlite3.connect(db_path)
+    now = datetime.now().isoformat(sep=" ")
+    connection.executemany(
+        "INSERT INTO products (name, price, stock_quantity, category, sort_order, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+        [(f"벤치마크 제품 {i}", 1000, rows, "벤치마크", i, now) for i in range(products)]
+    )
+    product_ids = [row[0] for row in connection.execute("SELECT id FROM products")]
+    connection.executemany(
+        "INSERT INTO stock_transactions (product_id, user_id, transaction_type, quantity, lot_number, notes, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [
+            (product_ids[i % len(product_ids)], user_id, "in" if i % 3 else "out", 1, f"LOT-{i % 50}", None, now)
+            for i in range(rows)
+        ]
+    )
+    connection.commit()
+    connection.close()
+    return product_ids
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def main():
+    args = parse_args()
+    db_dir = tempfile.mkdtemp(prefix="erp_bench_")
+    os.environ["DB_DIR"] = db_dir
+
+    import uvicorn
+    import main as app_module
+    from auth import create_access_token
+    from database import SessionLocal
+    from models import User
+
+    app_module.initialize_database()
+    db = SessionLocal()
+    user = db.query(User).filter(User.is_admin == True).first()
+    db.close()
+    product_ids = seed_database(os.path.join(db_dir, "erp_system.db"), user.id, args.products, args.rows)
+    cookie = f"access_token={create_access_token(data={'sub': user.username})}"
+
+    server = uvicorn.Server(uvicorn.Config(app_module.app, port=args.port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    deadline = time.perf_counter() + args.duration
+
+    def request(path):
+        req = urllib.request.Request(base_url + path, headers={"Cookie": cookie})
+        started = time.perf_counter()
+        with urllib.request.urlopen(req, timeout=120) as response:
+            response.read()
+        return time.perf_counter() - started
+
+    def reader(worker_id):
+        latencies = []
+        i = worker_id
+        while time.perf_counter() < deadline:
+            product_id = product_ids[i % len(product_ids)]
+            path = f"/api/products/{product_id}/lots" if i % 2 else "/api/transactions/filtered?page=1&per_page=20"
+            latencies.append(request(path))
+            i += 1
+        return latencies
+
+    def exporter(_):
+        latencies = []
+        while time.perf_counter() < deadline:
+            latencies.append(request("/api/transactions/export"))
+        return latencies
+
+    with ThreadPoolExecutor(max_workers=args.readers + args.exporters) as pool:
+        export_futures = [pool.submit(exporter, i) for i in range(args.exporters)]
+        reader_futures = [pool.submit(reader, i) for i in range(args.readers)]
+        reads = [latency for future in reader_futures for latency in future.result()]
+        exports = [latency for future in export_futures for latency in future.result()]
+
+    server.should_exit = True
+    time.sleep(0.5)
+    shutil.rmtree(db_dir, ignore_errors=True)
+
+    print("=== 혼합 부하 벤치마크 결과 ===")
+    print(f"거래 내역: {args.rows}건, 조회 동시성: {args.readers}, 다운로드 동시성: {args.exporters}")
+    if reads:
+        print(f"가벼운 조회: {len(reads)}건, p50 {statistics.median(reads) * 1000:.1f}ms, p99 {percentile(reads, 99) * 1000:.1f}ms, 최대 {max(reads) * 1000:.1f}ms")
+    if exports:
+        print(f"엑셀 다운로드: {len(exports)}건, 평균 {statistics.mean(exports) * 1000:.1f}ms")
+
+if __name__ == "__main__":
+    main()
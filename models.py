@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Float, Boolean, Date, DateTime, ForeignKey, Text, Index, UniqueConstraint, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone, timedelta
@@ -15,8 +15,8 @@ class User(Base):
     hashed_password = Column(String(255), nullable=False)
     is_approved = Column(Boolean, default=False)
     is_admin = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone(timedelta(hours=9))))
-    updated_at = Column(DateTime, default=lambda: datetime.now(timezone(timedelta(hours=9))), onupdate=lambda: datetime.now(timezone(timedelta(hours=9))))
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone(timedelta(hours=9))))
+    updated_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone(timedelta(hours=9))), onupdate=lambda: datetime.now(timezone(timedelta(hours=9))))
     
     # 관계
     stock_transactions = relationship("StockTransaction", back_populates="user")
@@ -33,8 +33,9 @@ class Product(Base):
     safety_stock_level = Column(String(20), default="good")  # 안전 재고 단계: good, warning, critical
     category = Column(String(50), index=True)
     sort_order = Column(Integer, default=0)  # 카테고리 내 정렬 순서
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone(timedelta(hours=9))))
-    updated_at = Column(DateTime, default=lambda: datetime.now(timezone(timedelta(hours=9))), onupdate=lambda: datetime.now(timezone(timedelta(hours=9))))
+    version = Column(Integer, nullable=False, default=1, server_default="1")  # 재고 변경마다 1씩 증가
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone(timedelta(hours=9))))
+    updated_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone(timedelta(hours=9))), onupdate=lambda: datetime.now(timezone(timedelta(hours=9))))
     
     # 관계
     stock_transactions = relationship("StockTransaction", back_populates="product")
@@ -51,14 +52,25 @@ class Supplier(Base):
     supplier_type = Column(String(20), nullable=False)  # "in" (입고처) 또는 "out" (출고처)
     sort_order = Column(Integer, default=0)  # 거래처 정렬 순서
     is_active = Column(Boolean, default=True)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone(timedelta(hours=9))))
-    updated_at = Column(DateTime, default=lambda: datetime.now(timezone(timedelta(hours=9))), onupdate=lambda: datetime.now(timezone(timedelta(hours=9))))
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone(timedelta(hours=9))))
+    updated_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone(timedelta(hours=9))), onupdate=lambda: datetime.now(timezone(timedelta(hours=9))))
     
     # 관계
     stock_transactions = relationship("StockTransaction", back_populates="supplier")
 
 class StockTransaction(Base):
     __tablename__ = "stock_transactions"
+    __table_args__ = (
+        # LOT별 재고 확인 (제품 + LOT + 거래 유형 합계)
+        Index("ix_stock_transactions_product_lot_type", "product_id", "lot_number", "transaction_type"),
+        # 거래 내역 최신순 조회 (created_at, id 커서 페이지네이션 범위 검색)
+        Index("ix_stock_transactions_created_at_id", "created_at", "id"),
+        # 거래처별 거래 내역 최신순 조회
+        Index("ix_stock_transactions_supplier_created_at", "supplier_id", "created_at"),
+        # 제품별/LOT별 거래 순서 (재고 카드 범위 조회, 누적 재고 재계산 시 앞 거래 검색)
+        Index("ix_stock_transactions_product_created_at", "product_id", "created_at", "id"),
+        Index("ix_stock_transactions_product_lot_created_at", "product_id", "lot_number", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
@@ -67,26 +79,106 @@ class StockTransaction(Base):
     transaction_type = Column(String(10), nullable=False)  # "in" 또는 "out"
     quantity = Column(Integer, nullable=False)
     lot_number = Column(String(50), nullable=True)  # LOT 번호
+    expiry_date = Column(Date, nullable=True)  # 유통기한 (입고 시 선택 입력)
     location = Column(String(100), nullable=True)  # 입고처/출고처 (레거시 필드)
     notes = Column(Text)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone(timedelta(hours=9))))
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone(timedelta(hours=9))))
+    balance_after = Column(Integer, nullable=True)  # 거래 직후 제품 재고 (거래 순서: created_at, id)
+    lot_balance_after = Column(Integer, nullable=True)  # 거래 직후 같은 LOT 재고 (LOT 번호가 없으면 NULL)
     
     # 관계
     product = relationship("Product", back_populates="stock_transactions")
     user = relationship("User", back_populates="stock_transactions")
     supplier = relationship("Supplier", back_populates="stock_transactions")
 
+# LOT별 현재 재고 (stock_transactions 집계, 재고 이동과 같은 트랜잭션에서 갱신)
+class LotBalance(Base):
+    __tablename__ = "lot_balances"
+    __table_args__ = (
+        # LOT 재고 확인은 (제품, LOT) 단일 조회
+        UniqueConstraint("product_id", "lot_number", name="uq_lot_balances_product_lot"),
+        # 자동 LOT 배정 우선순위 (재고가 남은 LOT만: FIFO는 최초 입고순, FEFO는 유통기한순)
+        Index("ix_lot_balances_fifo", "product_id", "first_received_at", "id",
+              sqlite_where=text("quantity > 0"), postgresql_where=text("quantity > 0")),
+        Index("ix_lot_balances_fefo", "product_id", "expiry_date", "first_received_at", "id",
+              sqlite_where=text("quantity > 0"), postgresql_where=text("quantity > 0")),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    lot_number = Column(String(50), nullable=False)
+    quantity = Column(Integer, nullable=False, default=0)  # 입고 합계 - 출고 합계
+    first_received_at = Column(DateTime(timezone=True), nullable=True)  # 최초 입고 시각 (FIFO 기준)
+    expiry_date = Column(Date, nullable=True)  # 유통기한 (FEFO 기준, 입고 시 입력된 가장 빠른 날짜)
+    updated_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone(timedelta(hours=9))), onupdate=lambda: datetime.now(timezone(timedelta(hours=9))))
+
+class InventorySnapshot(Base):
+    __tablename__ = "inventory_snapshots"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    snapshot_date = Column(Date, nullable=False, unique=True)  # 이 날짜(서울 시간) 마감 기준
+    line_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone(timedelta(hours=9))))
+
+class InventorySnapshotLine(Base):
+    __tablename__ = "inventory_snapshot_lines"
+    __table_args__ = (
+        # 스냅샷 날짜별 (제품, LOT) 마감 재고, lot_number가 빈 문자열이면 제품 전체 재고
+        UniqueConstraint("snapshot_date", "product_id", "lot_number", name="uq_inventory_snapshot_lines_date_product_lot"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    snapshot_date = Column(Date, nullable=False)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    lot_number = Column(String(50), nullable=False, default="")
+    quantity = Column(Integer, nullable=False)
+
+class StockReconciliationRun(Base):
+    __tablename__ = "stock_reconciliation_runs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    mode = Column(String(20), nullable=False)  # full(전체 제품) 또는 incremental(변경된 제품만)
+    dry_run = Column(Boolean, nullable=False, default=False)  # 불일치 보고만 하고 수정하지 않음
+    started_at = Column(DateTime(timezone=True), nullable=False)  # 다음 증분 검사의 기준 시각
+    max_transaction_id = Column(Integer, nullable=False, default=0)  # 검사 시작 시점의 마지막 거래 ID
+    checked_count = Column(Integer, nullable=False, default=0)
+    drift_count = Column(Integer, nullable=False, default=0)
+    fixed_count = Column(Integer, nullable=False, default=0)
+    verified = Column(Boolean, nullable=False, default=False)  # 검사 후 남은 불일치가 없음 (증분 검사 기준으로 사용)
+    finished_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone(timedelta(hours=9))))
+
+class DailyStockRollup(Base):
+    __tablename__ = "daily_stock_rollups"
+    __table_args__ = (
+        # 집계 키 (날짜 범위 집계는 이 인덱스의 날짜 범위 검색)
+        UniqueConstraint("day", "product_id", "supplier_id", "transaction_type", name="uq_daily_stock_rollups_key"),
+        # 제품별 기간 집계 (소모량 분석)
+        Index("ix_daily_stock_rollups_product_day", "product_id", "day"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(Date, nullable=False)  # 거래 날짜 (서울 시간)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    supplier_id = Column(Integer, nullable=False, default=0)  # 거래처 ID (거래처 없음은 0, NULL은 UPSERT 충돌 키로 쓸 수 없음)
+    transaction_type = Column(String(10), nullable=False)  # "in" 또는 "out"
+    quantity = Column(Integer, nullable=False, default=0)  # 수량 합계
+    transaction_count = Column(Integer, nullable=False, default=0)  # 거래 건수
+
 class CategoryOrder(Base):
     __tablename__ = "category_orders"
     
     id = Column(Integer, primary_key=True, index=True)
     category_name = Column(String(50), unique=True, nullable=False, index=True)
     sort_order = Column(Integer, nullable=False, default=0)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone(timedelta(hours=9))))
-    updated_at = Column(DateTime, default=lambda: datetime.now(timezone(timedelta(hours=9))), onupdate=lambda: datetime.now(timezone(timedelta(hours=9))))
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone(timedelta(hours=9))))
+    updated_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone(timedelta(hours=9))), onupdate=lambda: datetime.now(timezone(timedelta(hours=9))))
 
 class AuditLog(Base):
     __tablename__ = "audit_logs"
+    __table_args__ = (
+        # 감사 로그 최신순 조회
+        Index("ix_audit_logs_created_at", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -96,7 +188,7 @@ class AuditLog(Base):
     details = Column(Text)  # 상세 정보 (JSON 형태)
     ip_address = Column(String(45))  # IPv4 또는 IPv6
     user_agent = Column(Text)  # 브라우저 정보
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone(timedelta(hours=9))))
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone(timedelta(hours=9))))
     
     # 관계
     user = relationship("User")
@@ -119,14 +211,14 @@ class PaymentTransaction(Base):
     payment_method = Column(String(50))  # "cash", "transfer", "card", "check"
     
     # 날짜 정보
-    payment_date = Column(DateTime)  # 실제 결제일
-    due_date = Column(DateTime)  # 결제 예정일 (후납의 경우)
+    payment_date = Column(DateTime(timezone=True))  # 실제 결제일
+    due_date = Column(DateTime(timezone=True))  # 결제 예정일 (후납의 경우)
     
     # 추가 정보
     reference_number = Column(String(100))  # 거래 참조번호
     notes = Column(Text)  # 비고
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone(timedelta(hours=9))))
-    updated_at = Column(DateTime, default=lambda: datetime.now(timezone(timedelta(hours=9))), onupdate=lambda: datetime.now(timezone(timedelta(hours=9))))
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone(timedelta(hours=9))))
+    updated_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone(timedelta(hours=9))), onupdate=lambda: datetime.now(timezone(timedelta(hours=9))))
     
     # 관계
     supplier = relationship("Supplier")
@@ -147,7 +239,7 @@ class PaymentSchedule(Base):
     remaining_amount = Column(Float, nullable=False)  # 남은 금액
     
     # 일정 정보
-    due_date = Column(DateTime, nullable=False)  # 결제 예정일
+    due_date = Column(DateTime(timezone=True), nullable=False)  # 결제 예정일
     payment_terms = Column(String(50))  # "30일", "60일", "현금" 등
     
     # 상태
@@ -156,8 +248,8 @@ class PaymentSchedule(Base):
     
     # 추가 정보
     notes = Column(Text)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone(timedelta(hours=9))))
-    updated_at = Column(DateTime, default=lambda: datetime.now(timezone(timedelta(hours=9))), onupdate=lambda: datetime.now(timezone(timedelta(hours=9))))
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone(timedelta(hours=9))))
+    updated_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone(timedelta(hours=9))), onupdate=lambda: datetime.now(timezone(timedelta(hours=9))))
     
     # 관계
     supplier = relationship("Supplier")
@@ -182,8 +274,8 @@ class PrepaymentBalance(Base):
     is_active = Column(Boolean, default=True)
     
     # 날짜
-    last_updated = Column(DateTime, default=lambda: datetime.now(timezone(timedelta(hours=9))), onupdate=lambda: datetime.now(timezone(timedelta(hours=9))))
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone(timedelta(hours=9))))
+    last_updated = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone(timedelta(hours=9))), onupdate=lambda: datetime.now(timezone(timedelta(hours=9))))
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone(timedelta(hours=9))))
     
     # 관계
     supplier = relationship("Supplier")
@@ -191,6 +283,10 @@ class PrepaymentBalance(Base):
 # 새로운 주문 관리 시스템
 class Order(Base):
     __tablename__ = "orders"
+    __table_args__ = (
+        # 상태별 주문 목록 최신순 조회
+        Index("ix_orders_status_created_at", "status", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     order_number = Column(String(50), unique=True, nullable=False, index=True)  # 주문번호
@@ -198,8 +294,8 @@ class Order(Base):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     
     # 주문 정보
-    order_date = Column(DateTime, nullable=False, default=lambda: datetime.now(timezone(timedelta(hours=9))))
-    delivery_date = Column(DateTime)  # 납기일
+    order_date = Column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone(timedelta(hours=9))))
+    delivery_date = Column(DateTime(timezone=True))  # 납기일
     total_amount = Column(Float, nullable=False)  # 총 주문 금액
     currency = Column(String(3), default="KRW")
     
@@ -210,8 +306,8 @@ class Order(Base):
     
     # 추가 정보
     notes = Column(Text)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone(timedelta(hours=9))))
-    updated_at = Column(DateTime, default=lambda: datetime.now(timezone(timedelta(hours=9))), onupdate=lambda: datetime.now(timezone(timedelta(hours=9))))
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone(timedelta(hours=9))))
+    updated_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone(timedelta(hours=9))), onupdate=lambda: datetime.now(timezone(timedelta(hours=9))))
     
     # 관계
     supplier = relationship("Supplier")
@@ -238,8 +334,8 @@ class OrderItem(Base):
     
     # 추가 정보
     notes = Column(Text)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone(timedelta(hours=9))))
-    updated_at = Column(DateTime, default=lambda: datetime.now(timezone(timedelta(hours=9))), onupdate=lambda: datetime.now(timezone(timedelta(hours=9))))
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone(timedelta(hours=9))))
+    updated_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone(timedelta(hours=9))), onupdate=lambda: datetime.now(timezone(timedelta(hours=9))))
     
     # 관계
     order = relationship("Order", back_populates="order_items")
@@ -259,13 +355,13 @@ class AdvancePayment(Base):
     
     # 결제 상태
     status = Column(String(20), default="pending")  # pending, completed, cancelled, refunded
-    payment_date = Column(DateTime)  # 실제 결제일
+    payment_date = Column(DateTime(timezone=True))  # 실제 결제일
     
     # 참조 정보
     reference_number = Column(String(100))  # 거래 참조번호
     notes = Column(Text)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone(timedelta(hours=9))))
-    updated_at = Column(DateTime, default=lambda: datetime.now(timezone(timedelta(hours=9))), onupdate=lambda: datetime.now(timezone(timedelta(hours=9))))
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone(timedelta(hours=9))))
+    updated_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone(timedelta(hours=9))), onupdate=lambda: datetime.now(timezone(timedelta(hours=9))))
     
     # 관계
     order = relationship("Order", back_populates="advance_payments")
@@ -279,7 +375,7 @@ class SupplySchedule(Base):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     
     # 공급 일정 정보
-    schedule_date = Column(DateTime, nullable=False)  # 공급 예정일
+    schedule_date = Column(DateTime(timezone=True), nullable=False)  # 공급 예정일
     planned_quantity = Column(Integer, nullable=False)  # 계획된 공급 수량
     actual_quantity = Column(Integer, default=0)  # 실제 공급 수량
     
@@ -288,8 +384,8 @@ class SupplySchedule(Base):
     
     # 추가 정보
     notes = Column(Text)
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone(timedelta(hours=9))))
-    updated_at = Column(DateTime, default=lambda: datetime.now(timezone(timedelta(hours=9))), onupdate=lambda: datetime.now(timezone(timedelta(hours=9))))
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone(timedelta(hours=9))))
+    updated_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone(timedelta(hours=9))), onupdate=lambda: datetime.now(timezone(timedelta(hours=9))))
     
     # 관계
     order = relationship("Order", back_populates="supply_schedules")
@@ -307,16 +403,16 @@ class DocumentWork(Base):
     status = Column(String(20), default="pending")  # pending, in_progress, completed, rejected
     
     # 날짜 정보
-    start_date = Column(DateTime)
-    completion_date = Column(DateTime)
-    due_date = Column(DateTime)  # 완료 예정일
+    start_date = Column(DateTime(timezone=True))
+    completion_date = Column(DateTime(timezone=True))
+    due_date = Column(DateTime(timezone=True))  # 완료 예정일
     
     # 추가 정보
     notes = Column(Text)
     file_path = Column(String(500))  # 첨부 파일 경로
-    created_at = Column(DateTime, default=lambda: datetime.now(timezone(timedelta(hours=9))))
-    updated_at = Column(DateTime, default=lambda: datetime.now(timezone(timedelta(hours=9))), onupdate=lambda: datetime.now(timezone(timedelta(hours=9))))
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone(timedelta(hours=9))))
+    updated_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone(timedelta(hours=9))), onupdate=lambda: datetime.now(timezone(timedelta(hours=9))))
     
     # 관계
     order = relationship("Order")
-    user = relationship("User")
\ No newline at end of file
+    user = relationship("User")
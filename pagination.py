@@ -0,0 +1,38 @@
+"""
+거래 내역 커서 페이지네이션
+페이지 위치를 OFFSET 대신 마지막으로 본 거래의 (created_at, id)로 기억하고,
+다음 페이지는 그 키 이후를 (created_at, id) 복합 인덱스 범위 검색으로 읽습니다.
+몇 번째 페이지든 조회 비용이 첫 페이지와 같습니다.
+
+커서는 클라이언트가 해석하지 않는 불투명한 문자열로 주고받습니다.
+"""
+
+import base64
+import binascii
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+def encode_cursor(created_at: datetime, transaction_id: int) -> str:
+    """(created_at, ID)를 커서 문자열로 변환합니다."""
+    raw = f"{created_at.isoformat()}|{transaction_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    """커서 문자열을 (created_at, ID)로 변환합니다. (형식이 잘못되면 ValueError)"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    except (binascii.Error, UnicodeDecodeError):
+        raise ValueError("잘못된 페이지 커서입니다")
+    created_at, separator, transaction_id = raw.rpartition("|")
+    if not separator:
+        raise ValueError("잘못된 페이지 커서입니다")
+    return datetime.fromisoformat(created_at), int(transaction_id)
+
+def keyset_after(created_at_column, id_column, cursor_key):
+    """거래 순서에서 커서 키 이후인 행 조건 (행 값 비교라 인덱스 범위 검색 가능, 값은 컬럼 타입으로 바인딩)"""
+    return tuple_(created_at_column, id_column) > tuple(cursor_key)
+
+def keyset_before(created_at_column, id_column, cursor_key):
+    """거래 순서에서 커서 키 이전인 행 조건"""
+    return tuple_(created_at_column, id_column) < tuple(cursor_key)
@@ -0,0 +1,83 @@
+"""
+선납금 정산
+재고 거래 금액을 거래처의 선납금 잔액에서 차감합니다.
+여러 거래를 한 번에 정산할 때도 잔액은 한 번만 조회하고, 거래별 차감액은 메모리에서 배분한 뒤
+PaymentTransaction을 한 번의 INSERT로 기록하고 잔액을 한 번만 갱신합니다.
+커밋은 하지 않으며, 호출한 요청의 트랜잭션과 함께 커밋/롤백됩니다.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import select, insert, update
+
+from models import PaymentTransaction, PrepaymentBalance
+
+def allocate_prepayment(balance: float, lines):
+    """잔액을 거래 순서대로 배분하여 [(재고 거래 ID, 차감액)]을 반환합니다. (잔액이 바닥나면 중단)"""
+    allocations = []
+    remaining = balance
+    for stock_transaction_id, amount in lines:
+        if remaining <= 0:
+            break
+        deduct_amount = min(remaining, amount)
+        if deduct_amount > 0:
+            allocations.append((stock_transaction_id, deduct_amount))
+            remaining -= deduct_amount
+    return allocations
+
+async def settle_prepayment(db, supplier_id: int, lines, user_id: int) -> float:
+    """재고 거래 [(재고 거래 ID, 금액)]을 선납금에서 차감하고 총 차감액을 반환합니다."""
+    # 선납금 잔액 확인 (PostgreSQL에서는 정산이 끝날 때까지 행 잠금)
+    balance = await db.scalar(select(PrepaymentBalance.balance).where(
+        PrepaymentBalance.supplier_id == supplier_id
+    ).with_for_update())
+
+    if not balance or balance <= 0:
+        return 0  # 선납금 없음
+
+    allocations = allocate_prepayment(balance, lines)
+    if not allocations:
+        return 0
+
+    # 선납금 사용 거래 일괄 생성
+    payment_date = datetime.utcnow()
+    await db.execute(insert(PaymentTransaction), [
+        {
+            "supplier_id": supplier_id,
+            "user_id": user_id,
+            "stock_transaction_id": stock_transaction_id,
+            "payment_type": "settlement",
+            "amount": -deduct_amount,
+            "payment_method": "prepayment",
+            "payment_date": payment_date,
+            "notes": f"재고 거래 #{stock_transaction_id} 자동 차감",
+            "status": "completed"
+        }
+        for stock_transaction_id, deduct_amount in allocations
+    ])
+
+    # 잔액 업데이트 (한 번)
+    total_deducted = sum(deduct_amount for _, deduct_amount in allocations)
+    await update_prepayment_balance(db, supplier_id, total_deducted, "subtract")
+    return total_deducted
+
+async def update_prepayment_balance(db, supplier_id: int, amount: float, operation: str):
+    """선납금 잔액을 업데이트합니다. (커밋은 호출한 쪽에서)"""
+    if operation == "add":
+        values = {"balance": PrepaymentBalance.balance + amount, "total_prepaid": PrepaymentBalance.total_prepaid + amount}
+    else:  # subtract
+        values = {"balance": PrepaymentBalance.balance - amount, "total_used": PrepaymentBalance.total_used + amount}
+    values["last_updated"] = datetime.utcnow()
+
+    result = await db.execute(update(PrepaymentBalance).where(
+        PrepaymentBalance.supplier_id == supplier_id
+    ).values(**values).execution_options(synchronize_session=False))
+
+    if result.rowcount == 0:
+        # 새로 생성
+        db.add(PrepaymentBalance(
+            supplier_id=supplier_id,
+            balance=amount if operation == "add" else 0,
+            total_prepaid=amount if operation == "add" else 0,
+            total_used=0 if operation == "add" else amount
+        ))
@@ -0,0 +1,115 @@
+"""
+거래 내역 누적 재고 (거래 후 재고)
+stock_transactions의 balance_after / lot_balance_after는 거래 순서(created_at, id)로 본
+그 거래 직후의 제품 재고 / LOT 재고입니다. 재고 카드는 누적 합계를 다시 계산하지 않고
+제품(또는 LOT)별 인덱스 범위 검색 한 번으로 조회합니다.
+
+거래를 기록/삭제/수정하면 같은 트랜잭션에서 그 거래 위치 이후(suffix)만 다시 계산합니다.
+기준 재고는 바로 앞 거래의 balance_after를 인덱스로 한 번 찾아 사용하므로,
+현재 시각으로 기록되는 일반 입출고는 새 거래 행만 갱신합니다.
+과거 날짜로 기록하거나 과거 거래를 삭제/수정하면 그 이후 거래들만 갱신됩니다.
+
+전체 재생성:
+    python running_balances.py
+"""
+
+from datetime import datetime
+
+from sqlalchemy import select, update, and_, or_, func, case, literal, bindparam
+
+from models import StockTransaction
+
+def ledger_after(table, created_at, transaction_id):
+    """거래 순서에서 (created_at, transaction_id) 이후(포함)인 행 조건"""
+    return or_(table.c.created_at > created_at, and_(table.c.created_at == created_at, table.c.id >= transaction_id))
+
+def ledger_before(table, created_at, transaction_id):
+    """거래 순서에서 (created_at, transaction_id) 이전인 행 조건"""
+    return or_(table.c.created_at < created_at, and_(table.c.created_at == created_at, table.c.id < transaction_id))
+
+def running_balances_query(product_ids=None, created_at=None, transaction_id=0):
+    """거래별 누적 재고 (ID, 제품 누적, LOT 누적) 조회 쿼리
+
+    created_at을 지정하면 그 위치 이후 거래만 계산하고, 기준 재고는 바로 앞 거래의 누적 재고를 사용합니다.
+    (값 대신 bindparam을 넘기면 한 번 만든 문장을 재사용할 수 있음)
+    """
+    row = StockTransaction.__table__.alias("ledger_row")
+    previous = StockTransaction.__table__.alias("ledger_previous")
+    signed_quantity = case((row.c.transaction_type == "in", row.c.quantity), else_=-row.c.quantity)
+    has_lot = and_(row.c.lot_number.isnot(None), row.c.lot_number != "")
+    ledger_order = (row.c.created_at, row.c.id)
+
+    conditions = []
+    product_base = literal(0)
+    lot_base = literal(0)
+    if product_ids is not None:
+        conditions.append(row.c.product_id.in_(product_ids))
+    if created_at is not None:
+        conditions.append(ledger_after(row, created_at, transaction_id))
+        # 바로 앞 거래의 누적 재고 (제품 / 같은 LOT, 인덱스 역방향 검색 한 번)
+        before = ledger_before(previous, created_at, transaction_id)
+        latest_first = (previous.c.created_at.desc(), previous.c.id.desc())
+        product_base = func.coalesce(select(previous.c.balance_after).where(
+            previous.c.product_id == row.c.product_id, before
+        ).order_by(*latest_first).limit(1).scalar_subquery(), 0)
+        lot_base = func.coalesce(select(previous.c.lot_balance_after).where(
+            previous.c.product_id == row.c.product_id, previous.c.lot_number == row.c.lot_number, before
+        ).order_by(*latest_first).limit(1).scalar_subquery(), 0)
+
+    return select(
+        row.c.id,
+        (product_base + func.sum(signed_quantity).over(
+            partition_by=row.c.product_id, order_by=ledger_order
+        )).label("balance_after"),
+        case((has_lot, lot_base + func.sum(signed_quantity).over(
+            partition_by=(row.c.product_id, row.c.lot_number), order_by=ledger_order
+        )), else_=None).label("lot_balance_after")
+    ).where(*conditions)
+
+def running_balances_update(query):
+    """계산한 누적 재고 중 바뀐 값만 stock_transactions에 반영하는 UPDATE ... FROM 문"""
+    # ORM 엔티티 대신 테이블 대상 UPDATE (세션 동기화 처리 없이 실행)
+    balances = query.subquery()
+    transactions = StockTransaction.__table__
+    return update(transactions).where(
+        transactions.c.id == balances.c.id,
+        or_(
+            transactions.c.balance_after.is_distinct_from(balances.c.balance_after),
+            transactions.c.lot_balance_after.is_distinct_from(balances.c.lot_balance_after)
+        )
+    ).values(
+        balance_after=balances.c.balance_after,
+        lot_balance_after=balances.c.lot_balance_after
+    )
+
+# 입출고마다 실행하는 부분 재계산 문장 (매번 문장을 새로 만들고 컴파일하는 비용을 피하기 위해 한 번만 생성)
+REFRESH_RUNNING_BALANCES = running_balances_update(running_balances_query(
+    bindparam("start_product_ids", expanding=True),
+    bindparam("start_created_at", type_=StockTransaction.created_at.type),
+    bindparam("start_transaction_id")
+))
+
+async def refresh_running_balances(db, product_ids, created_at: datetime, transaction_id: int = 0):
+    """제품들의 (created_at, transaction_id) 이후 거래 누적 재고를 다시 계산합니다.
+
+    거래 기록/삭제/수정과 같은 트랜잭션에서, 제품 재고를 변경(행 잠금)한 뒤 호출합니다.
+    """
+    product_ids = list(set(product_ids))
+    if not product_ids:
+        return
+    await db.execute(REFRESH_RUNNING_BALANCES, {
+        "start_product_ids": product_ids,
+        "start_created_at": created_at,
+        "start_transaction_id": transaction_id
+    })
+
+def rebuild_running_balances(connection) -> int:
+    """전체 거래 내역의 누적 재고를 다시 계산하고 갱신한 행 수를 반환합니다."""
+    return connection.execute(running_balances_update(running_balances_query())).rowcount
+
+if __name__ == "__main__":
+    from database import engine
+
+    with engine.begin() as connection:
+        count = rebuild_running_balances(connection)
+    print(f"거래 후 재고 재계산 완료: {count}건 갱신")
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr
 from typing import Optional, Union
-from datetime import datetime
+from datetime import datetime, date
 
 # 사용자 관련 스키마
 class UserBase(BaseModel):
@@ -24,6 +24,18 @@ class User(UserBase):
     class Config:
         from_attributes = True
 
+class UserIdentity(BaseModel):
+    """인증된 사용자 스냅샷 (인증 캐시에 저장, 변경 불가)"""
+    id: int
+    username: str
+    full_name: str
+    is_admin: bool
+    is_approved: bool
+    
+    class Config:
+        from_attributes = True
+        frozen = True
+
 # 제품 관련 스키마
 class ProductBase(BaseModel):
     name: str
@@ -94,6 +106,7 @@ class StockTransactionBase(BaseModel):
     product_id: int
     quantity: int
     lot_number: Optional[str] = None
+    expiry_date: Optional[date] = None  # 유통기한 (입고 시)
     supplier_id: Optional[int] = None
     location: Optional[str] = None
     notes: Optional[str] = None
@@ -114,12 +127,14 @@ class StockTransaction(StockTransactionBase):
 class StockTransactionQuantityUpdate(BaseModel):
     new_quantity: int
     reason: str
+    expected_version: Optional[int] = None  # 화면에서 본 제품 재고 버전 (그사이 재고가 바뀌었으면 409)
 
 # 다중 제품 입고/출고 처리를 위한 스키마
 class BulkStockItem(BaseModel):
     product_id: int
     quantity: int
     lot_number: Optional[str] = None
+    expiry_date: Optional[date] = None  # 유통기한 (입고 시)
 
 class BulkStockInCreate(BaseModel):
     items: list[BulkStockItem]
@@ -133,6 +148,17 @@ class BulkStockOutCreate(BaseModel):
     notes: Optional[str] = None
     transaction_date: Optional[datetime] = None
 
+class AutoStockOutItem(BaseModel):
+    product_id: int
+    quantity: int
+
+class AutoStockOutCreate(BaseModel):
+    items: list[AutoStockOutItem]
+    strategy: str = "fifo"  # "fifo": 먼저 입고된 LOT부터, "fefo": 유통기한이 빠른 LOT부터
+    supplier_id: Optional[int] = None
+    notes: Optional[str] = None
+    transaction_date: Optional[datetime] = None
+
 # 결제 관련 스키마
 class PaymentTransactionBase(BaseModel):
     supplier_id: int
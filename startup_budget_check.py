@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+시작 시간 예산 검사 스크립트
+uvicorn으로 서버를 띄운 뒤 /login이 처음 200을 반환할 때까지의 시간을 측정합니다.
+새 데이터베이스(첫 부팅)와 기존 데이터베이스(재시작) 두 경우를 측정하며,
+예산을 넘으면 종료 코드 1을 반환합니다.
+
+사용법:
+    python startup_budget_check.py --cold-budget 3 --warm-budget 2
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="시작 시간 예산 검사")
+    parser.add_argument("--cold-budget", type=float, default=3.0, help="첫 부팅 예산 (초)")
+    parser.add_argument("--warm-budget", type=float, default=2.0, help="재시작 예산 (초)")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--timeout", type=float, default=60.0, help="최대 대기 시간 (초)")
+    return parser.parse_args()
+
+def time_to_first_200(db_dir: str, port: int, timeout: float) -> float:
+    """서버 프로세스 시작부터 /login 200 응답까지 걸린 시간(초)을 반환합니다."""
+    env = dict(os.environ, DB_DIR=db_dir)
+    env.pop("DATABASE_URL", None)
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if server.poll() is not None:
+                raise RuntimeError(f"서버가 종료되었습니다 (종료 코드 {server.returncode})")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/login", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.02)
+        raise RuntimeError(f"{timeout}초 안에 서버가 응답하지 않았습니다")
+    finally:
+        server.terminate()
+        server.wait()
+
+def main():
+    args = parse_args()
+    db_dir = tempfile.mkdtemp(prefix="erp_startup_")
+    try:
+        cold = time_to_first_200(db_dir, args.port, args.timeout)
+        warm = time_to_first_200(db_dir, args.port, args.timeout)
+    finally:
+        shutil.rmtree(db_dir, ignore_errors=True)
+
+    print("=== 시작 시간 예산 검사 결과 ===")
+    failed = False
+    for name, elapsed, budget in (("첫 부팅", cold, args.cold_budget), ("재시작", warm, args.warm_budget)):
+        mark = "✅" if elapsed <= budget else "❌"
+        print(f"{mark} {name}: {elapsed:.2f}초 (예산 {budget:.1f}초)")
+        failed = failed or elapsed > budget
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
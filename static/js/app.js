@@ -92,6 +92,29 @@ function logout() {
     }
 }
 
+// 중복 제출 방지용 Idempotency-Key
+// 폼별로 응답을 받을 때까지 같은 키를 사용하여, 더블 클릭이나 재시도로 같은 거래가 두 번 기록되지 않도록 함
+const pendingIdempotencyKeys = {};
+
+function createIdempotencyKey() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    return Date.now().toString(36) + '-' + Math.random().toString(36).slice(2) + Math.random().toString(36).slice(2);
+}
+
+function getIdempotencyKey(formName) {
+    if (!pendingIdempotencyKeys[formName]) {
+        pendingIdempotencyKeys[formName] = createIdempotencyKey();
+    }
+    return pendingIdempotencyKeys[formName];
+}
+
+// 서버 응답을 받은 뒤 호출 (다음 제출은 새 요청으로 처리)
+function clearIdempotencyKey(formName) {
+    delete pendingIdempotencyKeys[formName];
+}
+
 // API 요청 헬퍼 함수
 async function apiRequest(url, options = {}) {
     const token = localStorage.getItem('access_token');
@@ -119,6 +142,7 @@ async function apiRequest(url, options = {}) {
                 const retryOptions = {
                     ...options,
                     headers: {
+                        ...(options.headers || {}),  // Idempotency-Key 등 요청 헤더 유지
                         'Content-Type': 'application/json',
                         'Authorization': `Bearer ${newToken}`
                     }
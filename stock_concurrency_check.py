@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+동시 출고 초과 출고 검사 스크립트
+재고가 제한된 제품에 출고 요청(단건/다중, LOT 지정)을 동시에 보내고,
+성공한 출고 수량이 재고를 넘지 않는지, 제품 재고/LOT 재고/거래 내역이 서로 맞는지 확인합니다.
+DATABASE_URL이 설정되어 있으면 해당 데이터베이스(PostgreSQL 등)에서, 없으면 임시 SQLite에서 실행합니다.
+초과 출고나 불일치가 있으면 종료 코드 1을 반환합니다.
+
+사용법:
+    python stock_concurrency_check.py --requests 200 --stock 50
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="동시 출고 초과 출고 검사")
+    parser.add_argument("--requests", type=int, default=200, help="동시에 보낼 출고 요청 수")
+    parser.add_argument("--stock", type=int, default=50, help="입고할 재고 수량")
+    parser.add_argument("--port", type=int, default=8766)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    db_dir = tempfile.mkdtemp(prefix="erp_concurrency_")
+    os.environ["DB_DIR"] = db_dir
+
+    import uvicorn
+    import main as app_module
+    from sqlalchemy import select, func, case
+    from auth import create_access_token
+    from database import SessionLocal
+    from models import User, Product, StockTransaction, LotBalance
+
+    app_module.initialize_database()
+    db = SessionLocal()
+    user = db.query(User).filter(User.is_admin == True).first()
+    db.close()
+    cookie = f"access_token={create_access_token(data={'sub': user.username})}"
+
+    server = uvicorn.Server(uvicorn.Config(app_module.app, port=args.port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    def post(path, payload):
+        req = urllib.request.Request(base_url + path, data=json.dumps(payload).encode(), method="POST",
+                                     headers={"Cookie": cookie, "Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(req, timeout=120) as response:
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    product_name = f"동시성 검사 제품 {time.time_ns()}"
+    post("/inventory/add", {"name": product_name, "price": 1000, "category": "검사"})
+    db = SessionLocal()
+    product_id = db.scalar(select(Product.id).where(Product.name == product_name))
+    db.close()
+    post("/stock/in", {"product_id": product_id, "quantity": args.stock, "lot_number": "LOT-A"})
+
+    def stock_out(i):
+        # 단건 출고와 다중 출고를 번갈아 요청
+        if i % 2:
+            return post("/stock/out", {"product_id": product_id, "quantity": 1, "lot_number": "LOT-A"})
+        return post("/stock/out/bulk", {"items": [{"product_id": product_id, "quantity": 1, "lot_number": "LOT-A"}]})
+
+    barrier = threading.Barrier(args.requests)
+
+    def worker(i):
+        barrier.wait()
+        return stock_out(i)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.requests) as pool:
+        statuses = list(pool.map(worker, range(args.requests)))
+    elapsed = time.perf_counter() - started
+
+    server.should_exit = True
+    time.sleep(0.5)
+
+    db = SessionLocal()
+    stock_quantity = db.scalar(select(Product.stock_quantity).where(Product.id == product_id))
+    lot_quantity = db.scalar(select(LotBalance.quantity).where(LotBalance.product_id == product_id, LotBalance.lot_number == "LOT-A"))
+    ledger_quantity = db.scalar(select(func.sum(case(
+        (StockTransaction.transaction_type == "in", StockTransaction.quantity), else_=-StockTransaction.quantity
+    ))).where(StockTransaction.product_id == product_id))
+    db.close()
+    shutil.rmtree(db_dir, ignore_errors=True)
+
+    succeeded = statuses.count(200)
+    rejected = statuses.count(400)
+    errors = len(statuses) - succeeded - rejected
+    print("=== 동시 출고 검사 결과 ===")
+    print(f"요청 {args.requests}건 ({elapsed:.2f}초): 성공 {succeeded}, 재고 부족 {rejected}, 기타 오류 {errors}")
+    print(f"입고 {args.stock}개 -> 제품 재고 {stock_quantity}, LOT 재고 {lot_quantity}, 거래 내역 합계 {ledger_quantity}")
+
+    failed = (
+        succeeded > args.stock
+        or errors
+        or stock_quantity < 0
+        or not (stock_quantity == lot_quantity == ledger_quantity == args.stock - succeeded)
+    )
+    print("❌ 초과 출고 또는 불일치 발견" if failed else "✅ 초과 출고 없음")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
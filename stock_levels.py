@@ -0,0 +1,55 @@
+"""
+제품 재고 수량 변경
+재고 수량은 읽고-확인하고-쓰는 방식 대신 조건부 원자적 UPDATE로 변경합니다.
+    UPDATE products SET stock_quantity = stock_quantity - :q, version = version + 1
+    WHERE id = :id AND stock_quantity >= :q
+동시에 들어온 출고 요청이 같은 재고를 보고 함께 통과할 수 없으므로 재고가 음수가 되지 않으며,
+재고가 바뀔 때마다 제품의 version이 1씩 증가합니다.
+
+version은 제품/입출고 응답에 함께 반환되며, 화면에서 본 재고를 기준으로 수정하는 요청(거래 수량 수정)은
+expected_version을 보내 그사이 다른 재고 변경이 있었으면 같은 조건부 UPDATE에서 거부됩니다. (낙관적 동시성 검사)
+"""
+
+from typing import Optional, Tuple
+
+from sqlalchemy import select, update, case, or_
+
+from models import Product
+
+async def change_product_stock(db, product_id: int, delta: int, expected_version: Optional[int] = None) -> Optional[Tuple[int, int]]:
+    """재고를 delta만큼 변경하고 (변경 후 재고, 버전)을 반환합니다. (감소할 재고가 부족하거나 버전이 expected_version과 다르면 None)"""
+    statement = update(Product).where(Product.id == product_id)
+    if delta < 0:
+        statement = statement.where(Product.stock_quantity >= -delta)
+    if expected_version is not None:
+        statement = statement.where(Product.version == expected_version)
+    statement = statement.values(
+        stock_quantity=Product.stock_quantity + delta,
+        version=Product.version + 1
+    ).returning(Product.stock_quantity, Product.version).execution_options(synchronize_session=False)
+    row = (await db.execute(statement)).first()
+    return (row[0], row[1]) if row else None
+
+async def apply_stock_deltas(db, deltas: dict) -> set:
+    """여러 제품의 재고를 UPDATE ... CASE 한 번으로 변경하고 변경된 제품 ID를 반환합니다. (감소할 재고가 부족한 제품은 제외)"""
+    deltas = {product_id: delta for product_id, delta in deltas.items() if delta}
+    if not deltas:
+        return set()
+    delta_case = case(deltas, value=Product.id)
+    statement = update(Product).where(
+        Product.id.in_(list(deltas.keys())),
+        or_(delta_case >= 0, Product.stock_quantity + delta_case >= 0)
+    ).values(
+        stock_quantity=Product.stock_quantity + delta_case,
+        version=Product.version + 1
+    ).returning(Product.id).execution_options(synchronize_session=False)
+    return set((await db.scalars(statement)).all())
+
+async def get_product_stock(db, product_id: int) -> int:
+    """현재 재고 수량 조회 (재고 부족 메시지용)"""
+    return await db.scalar(select(Product.stock_quantity).where(Product.id == product_id)) or 0
+
+async def get_product_stock_version(db, product_id: int) -> Tuple[int, int]:
+    """현재 (재고 수량, 버전) 조회 (조건부 UPDATE 실패 원인 구분용)"""
+    row = (await db.execute(select(Product.stock_quantity, Product.version).where(Product.id == product_id))).first()
+    return (row[0] or 0, row[1]) if row else (0, 0)
@@ -0,0 +1,181 @@
+"""
+재고 수량 검증 (거래 내역 합계와 products.stock_quantity 비교)
+제품별 거래 내역 합계를 GROUP BY 집계 한 번으로 계산해 현재 재고와 다른 제품만 읽습니다.
+검사는 읽기 연결에서 실행하므로 쓰기 잠금을 잡지 않고, 불일치 수정은 해당 제품만
+쓰기 묶음 처리기를 통해 짧은 트랜잭션으로 다시 계산합니다.
+
+증분 검사는 마지막으로 검증된 실행(불일치가 남지 않은 실행) 이후 재고가 바뀌었거나
+새 거래가 기록된 제품만 검사합니다. 거래 내역을 직접 수정한 경우처럼 재고 변경 없이
+거래만 바뀐 제품은 전체 검사로 확인합니다.
+
+야간 검사:
+    python stock_reconciliation.py --incremental
+    python stock_reconciliation.py --dry-run
+"""
+
+import os
+from datetime import datetime, timezone, timedelta
+
+from sqlalchemy import select, insert, update, func, case, union
+
+from models import Product, StockTransaction, StockReconciliationRun
+
+# 증분 검사 기준 시각을 앞당기는 여유 시간 (검사 시작 전에 실행되어 늦게 커밋된 재고 변경 포함)
+STOCK_SYNC_OVERLAP_SECONDS = int(os.getenv("STOCK_SYNC_OVERLAP_SECONDS", "300"))
+# 불일치 수정 시 한 번의 UPDATE로 처리할 제품 수
+STOCK_SYNC_FIX_CHUNK_SIZE = 500
+
+def get_kst_now():
+    return datetime.now(timezone(timedelta(hours=9)))
+
+def signed_quantity():
+    """거래 유형에 따른 재고 변화량 (입고 +, 출고 -)"""
+    return case(
+        (StockTransaction.transaction_type == "in", StockTransaction.quantity),
+        (StockTransaction.transaction_type == "out", -StockTransaction.quantity),
+        else_=0
+    )
+
+def ledger_total_for_product():
+    """products 행과 연관된 거래 내역 합계 (UPDATE/SELECT 안의 상관 서브쿼리)"""
+    return select(func.coalesce(func.sum(signed_quantity()), 0)).where(
+        StockTransaction.product_id == Product.id
+    ).scalar_subquery()
+
+def touched_products_query(watermark: StockReconciliationRun):
+    """검증된 실행 이후 재고가 바뀌었거나 새 거래가 기록된 제품 ID 조회 쿼리"""
+    since = watermark.started_at - timedelta(seconds=STOCK_SYNC_OVERLAP_SECONDS)
+    return union(
+        select(Product.id).where(Product.updated_at >= since),
+        select(StockTransaction.product_id).where(StockTransaction.id > watermark.max_transaction_id)
+    )
+
+def drift_query(touched=None):
+    """거래 내역 합계와 현재 재고가 다른 제품 (ID, 이름, 현재 재고, 계산 재고) 조회 쿼리"""
+    ledger = select(
+        StockTransaction.product_id.label("product_id"),
+        func.sum(signed_quantity()).label("total")
+    ).group_by(StockTransaction.product_id)
+    products = select(Product.id, Product.name, Product.stock_quantity)
+    if touched is not None:
+        ledger = ledger.where(StockTransaction.product_id.in_(touched))
+        products = products.where(Product.id.in_(touched))
+    ledger = ledger.subquery()
+    products = products.subquery()
+    calculated = func.coalesce(ledger.c.total, 0)
+    return select(
+        products.c.id, products.c.name, products.c.stock_quantity, calculated.label("calculated")
+    ).outerjoin(ledger, ledger.c.product_id == products.c.id).where(
+        products.c.stock_quantity.is_distinct_from(calculated)
+    ).order_by(products.c.id)
+
+def checked_count_query(touched=None):
+    """검사 대상 제품 수 조회 쿼리"""
+    query = select(func.count()).select_from(Product)
+    if touched is not None:
+        query = query.where(Product.id.in_(touched))
+    return query
+
+async def get_verified_watermark(db):
+    """마지막으로 검증된 실행 조회 (없으면 None)"""
+    return await db.scalar(
+        select(StockReconciliationRun).where(StockReconciliationRun.verified == True).order_by(StockReconciliationRun.id.desc()).limit(1)
+    )
+
+async def fix_stock_drift(db, product_ids: list, run_values: dict) -> list:
+    """불일치 제품의 재고를 거래 내역 합계로 다시 계산하고 실행 기록을 남깁니다. (쓰기 단위)"""
+    fixed = []
+    for start in range(0, len(product_ids), STOCK_SYNC_FIX_CHUNK_SIZE):
+        chunk = product_ids[start:start + STOCK_SYNC_FIX_CHUNK_SIZE]
+        # PostgreSQL: 제품 행을 먼저 잠가 진행 중인 입출고가 커밋된 뒤의 거래 내역으로 계산 (SQLite는 쓰기 잠금으로 직렬화)
+        await db.execute(select(Product.id).where(Product.id.in_(chunk)).order_by(Product.id).with_for_update())
+        ledger_total = ledger_total_for_product()
+        result = await db.execute(
+            update(Product).where(
+                Product.id.in_(chunk),
+                Product.stock_quantity.is_distinct_from(ledger_total)
+            ).values(
+                stock_quantity=ledger_total,
+                version=Product.version + 1
+            ).returning(Product.id, Product.stock_quantity).execution_options(synchronize_session=False)
+        )
+        fixed.extend((row[0], row[1]) for row in result)
+    await record_run(db, dict(run_values, fixed_count=len(fixed)))
+    return fixed
+
+async def record_run(db, run_values: dict):
+    """검사 실행 기록을 남깁니다. (쓰기 단위)"""
+    await db.execute(insert(StockReconciliationRun).values(finished_at=get_kst_now(), **run_values))
+
+async def reconcile_stock(db, submit, summary: dict, dry_run: bool = False, incremental: bool = False):
+    """불일치 제품을 읽는 대로 반환하고, 끝나면 수정(dry_run이 아니면)과 실행 기록 후 summary를 채웁니다.
+
+    db는 읽기 세션, submit은 쓰기 단위를 실행할 함수(write_coordinator.submit)입니다.
+    """
+    started_at = get_kst_now()
+    max_transaction_id = await db.scalar(select(func.coalesce(func.max(StockTransaction.id), 0)))
+    watermark = await get_verified_watermark(db) if incremental else None
+    touched = touched_products_query(watermark) if watermark else None
+    mode = "incremental" if watermark else "full"
+    checked_count = await db.scalar(checked_count_query(touched))
+
+    drifted_ids = []
+    result = await db.stream(drift_query(touched))
+    async for product_id, name, stock_quantity, calculated in result:
+        drifted_ids.append(product_id)
+        yield {
+            "product_id": product_id,
+            "product_name": name,
+            "old_stock": stock_quantity,
+            "new_stock": calculated,
+            "difference": calculated - (stock_quantity or 0)
+        }
+
+    run_values = {
+        "mode": mode,
+        "dry_run": dry_run,
+        "started_at": started_at,
+        "max_transaction_id": max_transaction_id,
+        "checked_count": checked_count,
+        "drift_count": len(drifted_ids),
+        "fixed_count": 0,
+        "verified": not dry_run or not drifted_ids
+    }
+    fixed = []
+    if dry_run or not drifted_ids:
+        await submit(record_run, run_values)
+    else:
+        fixed = await submit(fix_stock_drift, drifted_ids, run_values)
+
+    summary.update({
+        "mode": mode,
+        "dry_run": dry_run,
+        "watermark": watermark.started_at.isoformat() if watermark else None,
+        "checked_count": checked_count,
+        "drift_count": len(drifted_ids),
+        "fixed_count": len(fixed)
+    })
+
+if __name__ == "__main__":
+    import argparse
+    import asyncio
+
+    parser = argparse.ArgumentParser(description="재고 수량 검증")
+    parser.add_argument("--dry-run", action="store_true", help="불일치만 보고하고 수정하지 않음")
+    parser.add_argument("--incremental", action="store_true", help="마지막 검증 이후 변경된 제품만 검사")
+    args = parser.parse_args()
+
+    async def main():
+        from database import ReadSessionLocal, dispose_async_engines, engine
+        from write_coordinator import write_coordinator
+
+        StockReconciliationRun.__table__.create(bind=engine, checkfirst=True)
+        summary = {}
+        async with ReadSessionLocal() as db:
+            async for row in reconcile_stock(db, write_coordinator.submit, summary, args.dry_run, args.incremental):
+                print(f"불일치: {row['product_name']} (ID {row['product_id']}) 재고 {row['old_stock']} / 거래 내역 {row['new_stock']} ({row['difference']:+d})")
+        await dispose_async_engines()
+        print(f"재고 검증 완료 ({summary['mode']}{', 보고만' if args.dry_run else ''}): "
+              f"{summary['checked_count']}개 제품 검사, 불일치 {summary['drift_count']}개, 수정 {summary['fixed_count']}개")
+
+    asyncio.run(main())
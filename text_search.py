@@ -0,0 +1,150 @@
+"""
+제품명/카테고리, LOT 번호/비고 부분 문자열 검색 인덱스
+LIKE '%검색어%'는 인덱스를 사용할 수 없어 거래 내역 전체를 읽습니다.
+
+SQLite: FTS5 trigram 토크나이저 외부 콘텐츠 테이블(product_search, transaction_search)을 만들고
+트리거로 products / stock_transactions와 같은 트랜잭션에서 동기화합니다. 트리거는 검색 대상 컬럼이
+바뀔 때만 실행되므로 재고 수량/누적 재고 갱신에는 비용이 없습니다.
+PostgreSQL: pg_trgm 확장이 있으면 GIN trigram 인덱스를 만들어 LIKE 조건이 그대로 인덱스를 사용합니다.
+(확장이 없으면 기존 LIKE 순차 검색 유지)
+
+trigram은 세 글자 단위로 색인하므로 세 글자 이상 검색어만 인덱스를 사용합니다.
+한두 글자 검색어(예: 한글 제품명 '사과')는 LIKE로 검색하며, 제품 검색은 앞부분 일치를 먼저 보여 줍니다.
+거래 내역 검색은 일치 건수를 상한까지만 세어, 대부분의 거래와 일치하는 검색어(예: 'LOT')는 LIKE를 사용합니다.
+
+인덱스 재생성:
+    python text_search.py
+"""
+
+from sqlalchemy import select, table, column, case, func, literal_column, text, Integer, String
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+from database import IS_SQLITE
+from models import Product, StockTransaction
+
+# trigram 인덱스를 사용할 수 있는 최소 검색어 길이
+TRIGRAM_MIN_LENGTH = 3
+# 검색어와 일치하는 거래가 전체의 이 비율을 넘으면 LIKE 사용 (최신순 인덱스를 읽다가 한 페이지를 채우면 바로 끝남)
+SEARCH_INDEX_MAX_RATIO = 0.1
+# 이 건수 이하로 일치하면 전체 건수와 관계없이 검색 인덱스 사용
+SEARCH_INDEX_MIN_CAP = 1000
+
+# FTS5 외부 콘텐츠 테이블 (rowid = 원본 테이블 ID)
+product_search = table("product_search", column("rowid", Integer), column("name", String), column("category", String))
+transaction_search = table("transaction_search", column("rowid", Integer), column("lot_number", String), column("notes", String))
+
+SQLITE_SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS product_search USING fts5("
+    "name, category, content='products', content_rowid='id', tokenize='trigram')",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS transaction_search USING fts5("
+    "lot_number, notes, content='stock_transactions', content_rowid='id', tokenize='trigram')",
+    """CREATE TRIGGER IF NOT EXISTS product_search_insert AFTER INSERT ON products BEGIN
+        INSERT INTO product_search(rowid, name, category) VALUES (new.id, new.name, new.category);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS product_search_delete AFTER DELETE ON products BEGIN
+        INSERT INTO product_search(product_search, rowid, name, category) VALUES ('delete', old.id, old.name, old.category);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS product_search_update AFTER UPDATE OF name, category ON products BEGIN
+        INSERT INTO product_search(product_search, rowid, name, category) VALUES ('delete', old.id, old.name, old.category);
+        INSERT INTO product_search(rowid, name, category) VALUES (new.id, new.name, new.category);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS transaction_search_insert AFTER INSERT ON stock_transactions BEGIN
+        INSERT INTO transaction_search(rowid, lot_number, notes) VALUES (new.id, new.lot_number, new.notes);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS transaction_search_delete AFTER DELETE ON stock_transactions BEGIN
+        INSERT INTO transaction_search(transaction_search, rowid, lot_number, notes) VALUES ('delete', old.id, old.lot_number, old.notes);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS transaction_search_update AFTER UPDATE OF lot_number, notes ON stock_transactions BEGIN
+        INSERT INTO transaction_search(transaction_search, rowid, lot_number, notes) VALUES ('delete', old.id, old.lot_number, old.notes);
+        INSERT INTO transaction_search(rowid, lot_number, notes) VALUES (new.id, new.lot_number, new.notes);
+    END""",
+]
+
+POSTGRESQL_SEARCH_DDL = [
+    "CREATE INDEX IF NOT EXISTS ix_products_name_trgm ON products USING gin (name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_products_category_trgm ON products USING gin (category gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_stock_transactions_lot_number_trgm ON stock_transactions USING gin (lot_number gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_stock_transactions_notes_trgm ON stock_transactions USING gin (notes gin_trgm_ops)",
+]
+
+def create_search_indexes(connection):
+    """검색 인덱스(SQLite FTS5 테이블과 트리거, PostgreSQL trigram 인덱스)를 만듭니다."""
+    if connection.dialect.name == "sqlite":
+        for statement in SQLITE_SEARCH_DDL:
+            connection.exec_driver_sql(statement)
+        rebuild_search_indexes(connection)
+        return
+    available = connection.scalar(text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'"))
+    if not available:
+        print("⚠️ pg_trgm 확장을 사용할 수 없어 부분 문자열 검색은 LIKE 순차 검색을 사용합니다.")
+        return
+    try:
+        # 확장 생성 권한이 없을 수 있으므로 세이브포인트 안에서 시도
+        with connection.begin_nested():
+            connection.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    except (ProgrammingError, OperationalError) as e:
+        print(f"⚠️ pg_trgm 확장을 만들 수 없어 부분 문자열 검색은 LIKE 순차 검색을 사용합니다: {e}")
+        return
+    for statement in POSTGRESQL_SEARCH_DDL:
+        connection.exec_driver_sql(statement)
+
+def rebuild_search_indexes(connection):
+    """SQLite FTS5 검색 테이블을 원본 테이블 내용으로 다시 만듭니다."""
+    connection.exec_driver_sql("INSERT INTO product_search(product_search) VALUES ('rebuild')")
+    connection.exec_driver_sql("INSERT INTO transaction_search(transaction_search) VALUES ('rebuild')")
+
+def fts_phrase(term: str) -> str:
+    """검색어를 FTS5 구문(phrase)으로 감쌉니다. (trigram 구문 검색 = 부분 문자열 일치)"""
+    return '"' + term.replace('"', '""') + '"'
+
+def uses_search_index(term: str) -> bool:
+    return IS_SQLITE and len(term) >= TRIGRAM_MIN_LENGTH
+
+def product_name_contains(term: str):
+    """제품명에 검색어가 포함된 제품 조건"""
+    if not uses_search_index(term):
+        return Product.name.contains(term)
+    return Product.id.in_(select(product_search.c.rowid).where(product_search.c.name.match(fts_phrase(term))))
+
+async def prefers_search_index(db, column_name: str, term: str) -> bool:
+    """거래의 LOT 번호/비고 검색에 검색 인덱스를 사용할지 결정합니다. (일치 건수를 상한까지만 세어 선택도 확인)"""
+    if not uses_search_index(term):
+        return False
+    total = await db.scalar(select(func.max(StockTransaction.id))) or 0
+    cap = max(int(total * SEARCH_INDEX_MAX_RATIO), SEARCH_INDEX_MIN_CAP)
+    matches = select(transaction_search.c.rowid).where(
+        transaction_search.c[column_name].match(fts_phrase(term))
+    ).limit(cap).subquery()
+    return await db.scalar(select(func.count()).select_from(matches)) < cap
+
+def transaction_column_contains(column_name: str, term: str, use_index: bool = True):
+    """거래의 LOT 번호 또는 비고에 검색어가 포함된 거래 조건"""
+    if not use_index or not uses_search_index(term):
+        return getattr(StockTransaction, column_name).contains(term)
+    return StockTransaction.id.in_(
+        select(transaction_search.c.rowid).where(transaction_search.c[column_name].match(fts_phrase(term)))
+    )
+
+def product_search_query(term: str, limit: int):
+    """제품명/카테고리 검색 쿼리 (앞부분 일치 > 제품명 일치 > 관련도 > 짧은 이름 순)"""
+    prefix_first = case((Product.name.startswith(term, autoescape=True), 0), else_=1)
+    name_first = case((Product.name.contains(term, autoescape=True), 0), else_=1)
+    if not uses_search_index(term):
+        return select(Product).where(
+            Product.name.contains(term, autoescape=True) | Product.category.contains(term, autoescape=True)
+        ).order_by(prefix_first, name_first, func.length(Product.name), Product.name).limit(limit)
+    # bm25 관련도 (제품명 일치에 카테고리보다 높은 가중치, 값이 작을수록 관련도 높음)
+    matches = select(
+        product_search.c.rowid.label("id"),
+        func.bm25(literal_column("product_search"), 10.0, 1.0).label("score")
+    ).where(literal_column("product_search").match(fts_phrase(term))).subquery()
+    return select(Product).join(matches, matches.c.id == Product.id).order_by(
+        prefix_first, name_first, matches.c.score, func.length(Product.name), Product.name
+    ).limit(limit)
+
+if __name__ == "__main__":
+    from database import engine
+
+    with engine.begin() as connection:
+        create_search_indexes(connection)
+    print("검색 인덱스 재생성 완료")
@@ -0,0 +1,208 @@
+"""
+쓰기 묶음 처리기 (그룹 커밋)
+입출고 요청은 쓰기 작업(단위)을 큐에 넣고 결과를 기다립니다.
+하나의 백그라운드 작업이 큐를 비우면서 모인 단위들을 한 트랜잭션 안에서 단위별 SAVEPOINT로 실행하고,
+한 번 커밋한 뒤 기다리던 요청들에 각자의 결과(또는 예외)를 돌려줍니다.
+단위 하나가 실패하면 그 SAVEPOINT만 롤백되므로 같은 묶음의 다른 요청에는 영향이 없습니다.
+바코드 스캔처럼 작은 입출고가 몰릴 때 커밋(및 쓰기 잠금 획득) 횟수가 요청 수가 아니라 묶음 수로 줄어듭니다.
+"""
+
+import asyncio
+import os
+import time
+
+from database import WriteSessionLocal
+
+# 묶음 설정
+# 첫 단위가 들어온 뒤 다음 단위를 더 기다리는 시간 (0이면 이미 큐에 쌓인 단위만 묶음)
+WRITE_BATCH_WINDOW_MS = float(os.getenv("WRITE_BATCH_WINDOW_MS", "2"))
+WRITE_BATCH_MAX_SIZE = int(os.getenv("WRITE_BATCH_MAX_SIZE", "64"))
+WRITE_BATCH_ENABLED = os.getenv("WRITE_BATCH_ENABLED", "true").lower() in ("1", "true", "yes", "on")
+
+class WriteUnit:
+    """큐에 들어간 쓰기 작업 하나"""
+
+    __slots__ = ("function", "args", "future", "enqueued_at")
+
+    def __init__(self, function, args, future):
+        self.function = function
+        self.args = args
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+
+def batch_size_bucket(size: int) -> str:
+    """묶음 크기 분포용 구간 이름 (1, 2, 3-4, 5-8, ...)"""
+    if size <= 2:
+        return str(size)
+    upper = 1 << (size - 1).bit_length()
+    return f"{upper // 2 + 1}-{upper}"
+
+class WriteCoordinator:
+    """쓰기 단위를 모아 한 트랜잭션으로 커밋하는 처리기"""
+
+    def __init__(self, session_factory, window_ms: float, max_size: int, enabled: bool = True):
+        self.session_factory = session_factory
+        self.window = window_ms / 1000
+        self.max_size = max(1, max_size)
+        self.enabled = enabled
+        self.queue = None
+        self.task = None
+        self.loop = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        """통계를 초기화합니다."""
+        self.batches = 0
+        self.units = 0
+        self.failed_units = 0
+        self.commit_failures = 0
+        self.largest_batch = 0
+        self.batch_sizes = {}
+        self.total_queue_wait = 0.0
+        self.max_queue_wait = 0.0
+        self.total_commit_time = 0.0
+
+    def start(self):
+        """현재 이벤트 루프에서 처리 작업을 시작합니다."""
+        if not self.enabled or self.task is not None:
+            return
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+        self.task = self.loop.create_task(self.run())
+        print(f"쓰기 묶음 처리 시작 (대기 {self.window * 1000:g}ms, 최대 {self.max_size}건)")
+
+    async def stop(self):
+        """큐에 남은 단위를 모두 처리한 뒤 작업을 종료합니다."""
+        if self.task is None:
+            return
+        task = self.task
+        self.task = None
+        self.queue.put_nowait(None)  # 종료 표시
+        await task
+
+    def is_running(self) -> bool:
+        """현재 이벤트 루프에서 처리 작업이 동작 중인지 확인합니다."""
+        if self.task is None or self.task.done():
+            return False
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    async def submit(self, function, *args):
+        """쓰기 단위 function(db, *args)를 실행하고 커밋된 결과를 반환합니다."""
+        if not self.is_running():
+            # 처리 작업이 없으면(비활성화, 시작 이벤트 없이 실행) 요청별 세션에서 바로 커밋
+            async with self.session_factory() as db:
+                result = await function(db, *args)
+                await db.commit()
+                return result
+
+        future = self.loop.create_future()
+        self.queue.put_nowait(WriteUnit(function, args, future))
+        return await future
+
+    async def run(self):
+        """큐에서 단위를 묶어 처리합니다."""
+        stopping = False
+        while not stopping:
+            unit = await self.queue.get()
+            if unit is None:
+                break
+            batch = [unit]
+
+            # 묶음 대기 시간 동안 단위가 더 들어오기를 기다림 (이미 가득 찼으면 바로 처리)
+            if self.window > 0 and self.queue.qsize() < self.max_size - 1:
+                await asyncio.sleep(self.window)
+            while len(batch) < self.max_size and not self.queue.empty():
+                unit = self.queue.get_nowait()
+                if unit is None:
+                    stopping = True
+                    break
+                batch.append(unit)
+
+            try:
+                await self.apply_batch(batch)
+            except Exception as e:
+                print(f"쓰기 묶음 처리 오류: {e}")
+                for unit in batch:
+                    if not unit.future.done():
+                        unit.future.set_exception(e)
+
+    async def apply_batch(self, batch):
+        """묶음을 한 트랜잭션에서 단위별 SAVEPOINT로 실행하고 한 번 커밋한 뒤 결과를 돌려줍니다."""
+        started = time.perf_counter()
+        # 기다리던 요청이 취소된(연결 끊김 등) 단위는 실행하지 않음
+        units = [unit for unit in batch if not unit.future.cancelled()]
+        if not units:
+            return
+
+        outcomes = []  # (단위, 결과, 예외)
+        commit_error = None
+        async with self.session_factory() as db:
+            for unit in units:
+                try:
+                    async with db.begin_nested():
+                        result = await unit.function(db, *unit.args)
+                    outcomes.append((unit, result, None))
+                except Exception as e:
+                    outcomes.append((unit, None, e))
+                # 다음 단위가 앞 단위에서 읽은 객체를 재사용하지 않도록 세션 비우기
+                db.expunge_all()
+
+            commit_started = time.perf_counter()
+            try:
+                await db.commit()
+            except Exception as e:
+                await db.rollback()
+                commit_error = e
+                self.commit_failures += 1
+                print(f"쓰기 묶음 커밋 실패 ({len(units)}건): {e}")
+            self.total_commit_time += time.perf_counter() - commit_started
+
+        # 통계 기록
+        size = len(units)
+        self.batches += 1
+        self.units += size
+        self.largest_batch = max(self.largest_batch, size)
+        bucket = batch_size_bucket(size)
+        self.batch_sizes[bucket] = self.batch_sizes.get(bucket, 0) + 1
+        for unit in units:
+            queue_wait = started - unit.enqueued_at
+            self.total_queue_wait += queue_wait
+            self.max_queue_wait = max(self.max_queue_wait, queue_wait)
+
+        # 커밋 후 결과 전달 (커밋이 실패하면 성공한 단위도 실패로 전달)
+        for unit, result, error in outcomes:
+            if error is None:
+                error = commit_error
+            if error is not None:
+                self.failed_units += 1
+            if unit.future.done():
+                continue
+            if error is not None:
+                unit.future.set_exception(error)
+            else:
+                unit.future.set_result(result)
+
+    def stats(self) -> dict:
+        """묶음 크기와 큐 대기 시간 통계를 반환합니다."""
+        return {
+            "enabled": self.enabled,
+            "running": self.task is not None and not self.task.done(),
+            "window_ms": self.window * 1000,
+            "max_batch_size": self.max_size,
+            "queued": self.queue.qsize() if self.queue is not None else 0,
+            "batches": self.batches,
+            "units": self.units,
+            "failed_units": self.failed_units,
+            "commit_failures": self.commit_failures,
+            "avg_batch_size": round(self.units / self.batches, 2) if self.batches else 0,
+            "largest_batch": self.largest_batch,
+            "batch_sizes": dict(sorted(self.batch_sizes.items(), key=lambda item: int(item[0].split("-")[0]))),
+            "avg_queue_wait_ms": round(self.total_queue_wait / self.units * 1000, 3) if self.units else 0,
+            "max_queue_wait_ms": round(self.max_queue_wait * 1000, 3),
+            "avg_commit_ms": round(self.total_commit_time / self.batches * 1000, 3) if self.batches else 0
+        }
+
+write_coordinator = WriteCoordinator(WriteSessionLocal, WRITE_BATCH_WINDOW_MS, WRITE_BATCH_MAX_SIZE, WRITE_BATCH_ENABLED)